@@ -0,0 +1,170 @@
+"""
+   scan a directory tree of netcdf granules into a json-lines catalog
+
+   every file gets one line holding its size and mtime, the
+   netcdflib.nc_summary of its dimensions, variables, chunking and sizes,
+   and its modismeta.parseMeta metadata (null with meta_error for files
+   that aren't MODIS granules).  Files are scanned in a process pool, and
+   a rescan against an existing catalog only opens files that are new or
+   whose size or mtime changed; entries for deleted files are dropped.
+
+   usage:
+       python archive_scan.py /data/modis --catalog modis_catalog.jsonl --processes 8
+"""
+from __future__ import division,print_function
+import os
+import json
+import fnmatch
+import argparse
+import multiprocessing
+from netCDF4 import Dataset
+from netcdflib import nc_summary,json_value
+from modismeta import parseMeta
+
+def walk_granules(top,pattern='*.nc'):
+    """
+       sorted absolute paths of the files below top whose names match pattern
+    """
+    found=[]
+    for dirpath,dirnames,filenames in os.walk(top):
+        for filename in fnmatch.filter(filenames,pattern):
+            found.append(os.path.abspath(os.path.join(dirpath,filename)))
+    return sorted(found)
+
+def scan_file(filename):
+    """
+       catalog entry for one file, an 'error' key replaces the schema
+       if the file can't be opened
+    """
+    stat=os.stat(filename)
+    entry=dict(filename=filename,size=stat.st_size,mtime=stat.st_mtime)
+    try:
+        nc_file=Dataset(filename,'r')
+    except Exception as error:
+        entry['error']=str(error)
+        return entry
+    try:
+        entry['schema']=nc_summary(nc_file)
+        try:
+            meta=parseMeta(nc_file)
+            entry['meta']=dict((key,json_value(value)) for key,value in meta.items())
+        except Exception as error:
+            entry['meta']=None
+            entry['meta_error']=str(error)
+    finally:
+        nc_file.close()
+    return entry
+
+def read_catalog(catalog):
+    """
+       dictionary of filename: entry from a catalog file, empty if it doesn't exist
+    """
+    entries={}
+    if os.path.exists(catalog):
+        with open(catalog,'r') as infile:
+            for line in infile:
+                if line.strip():
+                    entry=json.loads(line)
+                    entries[entry['filename']]=entry
+    return entries
+
+def write_catalog(catalog,entries):
+    """
+       write entries sorted by filename, through a temporary file so an
+       interrupted scan never leaves a truncated catalog
+    """
+    tmpname=catalog + '.tmp'
+    with open(tmpname,'w') as outfile:
+        for filename in sorted(entries.keys()):
+            outfile.write(json.dumps(entries[filename],sort_keys=True,separators=(',',':')) + '\n')
+    os.rename(tmpname,catalog)
+
+def scan_archive(top,catalog,pattern='*.nc',processes=None,chunksize=8):
+    """
+       input: top -- directory to walk
+              catalog -- json-lines catalog file, updated in place
+              pattern -- filename pattern for granules
+              processes -- size of the process pool, None for one per cpu,
+                           1 to scan in this process
+              chunksize -- files sent to a worker at a time
+       output: dictionary of counts: scanned, unchanged, removed, errors
+    """
+    entries=read_catalog(catalog)
+    filenames=walk_granules(top,pattern)
+    todo=[]
+    for filename in filenames:
+        old=entries.get(filename)
+        if old is not None:
+            stat=os.stat(filename)
+            if old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                continue
+        todo.append(filename)
+    present=set(filenames)
+    removed=[filename for filename in entries if filename not in present]
+    for filename in removed:
+        del entries[filename]
+    pool=None
+    if processes == 1:
+        results_iter=(scan_file(filename) for filename in todo)
+    else:
+        pool=multiprocessing.Pool(processes)
+        results_iter=pool.imap_unordered(scan_file,todo,chunksize)
+    try:
+        for entry in results_iter:
+            entries[entry['filename']]=entry
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    write_catalog(catalog,entries)
+    errors=sum(1 for entry in entries.values() if 'error' in entry)
+    return dict(scanned=len(todo),unchanged=len(filenames) - len(todo),
+                removed=len(removed),errors=errors)
+
+def test_scan_archive():
+    """
+       scan a small tree, then check that a rescan only opens changed files
+    """
+    import tempfile
+    import shutil
+    from modis_reader import write_test_granule
+    tmpdir=tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tmpdir,'day1'))
+        names=[os.path.join(tmpdir,'a.nc'),os.path.join(tmpdir,'day1','b.nc')]
+        write_test_granule(names[0])
+        write_test_granule(names[1],lat0=-10.)
+        with open(os.path.join(tmpdir,'day1','bad.nc'),'w') as outfile:
+            outfile.write('not a netcdf file')
+        catalog=os.path.join(tmpdir,'catalog.jsonl')
+        counts=scan_archive(tmpdir,catalog,processes=2,chunksize=1)
+        assert counts == dict(scanned=3,unchanged=0,removed=0,errors=1)
+        entries=read_catalog(catalog)
+        entry=entries[names[1]]
+        assert entry['schema']['dimensions'] == {'Band_1KM_Emissive':16,'rows':40,'cols':30}
+        emissive=entry['schema']['variables']['EV_1KM_Emissive']
+        assert emissive['chunking'] == [1,20,30] and emissive['nbytes'] == 16*40*30*2
+        assert entry['meta']['orbit'] == '8923' and entry['meta']['cornerlats'][0] == -10.
+        counts=scan_archive(tmpdir,catalog,processes=1)
+        assert counts == dict(scanned=0,unchanged=3,removed=0,errors=1)
+        write_test_granule(names[0],nrows=50)
+        os.remove(os.path.join(tmpdir,'day1','bad.nc'))
+        counts=scan_archive(tmpdir,catalog,processes=1)
+        assert counts == dict(scanned=1,unchanged=1,removed=1,errors=0)
+        assert read_catalog(catalog)[names[0]]['schema']['dimensions']['rows'] == 50
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='catalog the netcdf granules below a directory')
+    parser.add_argument('top', type=str, help='directory to scan')
+    parser.add_argument('--catalog', type=str, default='catalog.jsonl',
+                        help='json-lines catalog, rescans only read new or changed files')
+    parser.add_argument('--pattern', type=str, default='*.nc', help='granule filename pattern')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default one per cpu)')
+    args=parser.parse_args()
+    counts=scan_archive(args.top,args.catalog,pattern=args.pattern,processes=args.processes)
+    print("scanned {scanned}, unchanged {unchanged}, removed {removed}, "
+          "{errors} unreadable".format(**counts))
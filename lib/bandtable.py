@@ -0,0 +1,195 @@
+"""
+   band-integrated Planck radiance lookup tables
+
+   planck.planckInt calls scipy.integrate.quad once per temperature.  For
+   images we instead integrate planckwavelen over a channel's spectral
+   response once on a fine temperature grid, optionally save that table
+   to disk, and then evaluate radiance (forward) or brightness temperature
+   (inverse) for whole arrays with np.interp
+"""
+from __future__ import division
+import os
+import hashlib
+import numpy as np
+from planck import planckwavelen,planckInt
+
+#
+# tables already built in this session, keyed by band_key
+#
+_table_cache={}
+
+def band_integrate(Temp,wavel,response=None,average=False):
+    """
+       integrate planckwavelen over a spectral response with the trapezoid rule
+
+       input: Temp -- temperatures (K), any shape
+              wavel -- 1-d vector of wavelengths (m), increasing
+              response -- spectral response at wavel (no units), default 1
+              average -- if True divide by the integral of the response
+       output: radiance (W/m^2/sr, or W/m^2/m/sr if average), same shape as Temp
+    """
+    wavel=np.asarray(wavel,dtype=np.float64)
+    if response is None:
+        response=np.ones_like(wavel)
+    response=np.asarray(response,dtype=np.float64)
+    Temp=np.asarray(Temp,dtype=np.float64)
+    weights=np.empty_like(wavel)
+    #
+    # trapezoid weights, so the integral is a single matrix product
+    #
+    del_wavel=np.diff(wavel)
+    weights[0]=del_wavel[0]/2.
+    weights[-1]=del_wavel[-1]/2.
+    weights[1:-1]=(del_wavel[1:] + del_wavel[:-1])/2.
+    weights=weights*response
+    if average:
+        weights=weights/weights.sum()
+    out=np.empty(Temp.size,dtype=np.float64)
+    flatTemp=Temp.ravel()
+    #
+    # do the temperatures in chunks to bound the size of the
+    # (temperature x wavelength) work array
+    #
+    chunk=500
+    for start in range(0,flatTemp.size,chunk):
+        the_temps=flatTemp[start:start+chunk]
+        out[start:start+chunk]=np.dot(planckwavelen(wavel,the_temps[:,None]),weights)
+    return out.reshape(Temp.shape)
+
+
+def band_key(wavel,response=None,average=False,Tmin=150.,Tmax=350.,dT=0.05):
+    """
+       hex digest identifying a table, used for the in-memory and on-disk caches
+    """
+    the_hash=hashlib.md5()
+    the_hash.update(np.ascontiguousarray(wavel,dtype=np.float64).tobytes())
+    if response is not None:
+        the_hash.update(np.ascontiguousarray(response,dtype=np.float64).tobytes())
+    the_hash.update(repr((bool(average),float(Tmin),float(Tmax),float(dT))).encode('ascii'))
+    return the_hash.hexdigest()
+
+
+class BandTable(object):
+    """
+       band-integrated radiance tabulated on a regular temperature grid
+
+       table=BandTable(wavel,response)
+       rads=table.forward(Temps)    #radiance for any array of temperatures
+       Temps=table.inverse(rads)    #brightness temperature for any array of radiances
+
+       values outside the table temperature range come back as nan
+    """
+    def __init__(self,wavel,response=None,average=False,Tmin=150.,Tmax=350.,dT=0.05):
+        self.wavel=np.asarray(wavel,dtype=np.float64)
+        self.response=None if response is None else np.asarray(response,dtype=np.float64)
+        self.average=average
+        self.Temps=np.arange(Tmin,Tmax + dT/2.,dT)
+        self.rads=band_integrate(self.Temps,self.wavel,self.response,average)
+        self.key=band_key(self.wavel,self.response,average,Tmin,Tmax,dT)
+
+    def forward(self,Temp):
+        """
+           input: Temp (K), any shape
+           output: band radiance, same shape as Temp
+        """
+        return np.interp(Temp,self.Temps,self.rads,left=np.nan,right=np.nan)
+
+    def inverse(self,rad):
+        """
+           input: band radiance, any shape
+           output: brightness temperature (K), same shape as rad
+        """
+        return np.interp(rad,self.rads,self.Temps,left=np.nan,right=np.nan)
+
+    def save(self,filename):
+        """
+           write the table to a numpy .npz file
+        """
+        arrays=dict(wavel=self.wavel,Temps=self.Temps,rads=self.rads,
+                    average=np.array(self.average),key=np.array(self.key))
+        if self.response is not None:
+            arrays['response']=self.response
+        with open(filename,'wb') as outfile:
+            np.savez(outfile,**arrays)
+
+    @classmethod
+    def load(cls,filename):
+        """
+           read a table written by BandTable.save without recomputing it
+        """
+        table=cls.__new__(cls)
+        with np.load(filename) as infile:
+            table.wavel=infile['wavel']
+            table.response=infile['response'] if 'response' in infile.files else None
+            table.average=bool(infile['average'])
+            table.Temps=infile['Temps']
+            table.rads=infile['rads']
+            table.key=str(infile['key'])
+        return table
+
+
+def get_table(wavel,response=None,average=False,cachedir=None,**kwargs):
+    """
+       return the BandTable for this spectral response, building it only if
+       it isn't already in memory or (when cachedir is given) on disk
+
+       input: wavel, response, average -- see band_integrate
+              cachedir -- directory holding band_<key>.npz files, or None
+              kwargs -- Tmin, Tmax, dT passed to BandTable
+    """
+    key=band_key(wavel,response,average,**kwargs)
+    if key in _table_cache:
+        return _table_cache[key]
+    filename=None
+    if cachedir is not None:
+        filename=os.path.join(cachedir,'band_{}.npz'.format(key))
+        if os.path.exists(filename):
+            table=BandTable.load(filename)
+            _table_cache[key]=table
+            return table
+    table=BandTable(wavel,response,average,**kwargs)
+    if filename is not None:
+        table.save(filename)
+    _table_cache[key]=table
+    return table
+
+
+def planckIntTable(Temp,lower,upper,nwavel=4000,cachedir=None):
+    """
+       table version of planck.planckInt -- integrate planckwavelen from lower (m)
+       to upper (m) wavelengths, but for any array of temperatures Temp (K)
+
+       output: integrated radiance in W/m^2/sr, same shape as Temp
+    """
+    wavel=np.logspace(np.log10(lower),np.log10(upper),nwavel)
+    table=get_table(wavel,cachedir=cachedir)
+    return table.forward(Temp)
+
+
+def test_table_forward():
+    """
+       compare the table against planckInt's quad integration
+    """
+    Temps=np.array([200.3,251.7,299.9,333.3])
+    exact=np.array([planckInt(the_temp,10.e-6,12.e-6) for the_temp in Temps])
+    fast=planckIntTable(Temps,10.e-6,12.e-6)
+    np.testing.assert_allclose(fast,exact,rtol=1.e-5)
+    return None
+
+def test_table_inverse():
+    """
+       round trip through a gaussian spectral response
+    """
+    wavel=np.linspace(10.5e-6,11.5e-6,200)
+    response=np.exp(-((wavel - 11.e-6)/0.2e-6)**2.)
+    table=BandTable(wavel,response,average=True)
+    Temps=np.linspace(180.,340.,50).reshape(5,10)
+    rads=band_integrate(Temps,wavel,response,average=True)
+    np.testing.assert_allclose(table.forward(Temps),rads,rtol=1.e-5)
+    np.testing.assert_allclose(table.inverse(rads),Temps,atol=1.e-3)
+    assert np.isnan(table.inverse(-1.))
+    return None
+
+if __name__=="__main__":
+    test_table_forward()
+    test_table_inverse()
@@ -0,0 +1,223 @@
+"""
+   unfold aliased Doppler velocity fields (rays x gates)
+
+   a radial velocity v is only measured modulo 2*v_nyq, where v_nyq is the
+   Nyquist velocity wavel*PRF/4 (radar_geometry.nyquist_velocity, Stull eq.
+   8.35).  Three ways to choose the fold count for each gate:
+
+     unfold_reference -- the fold that brings v closest to a reference field
+                         (a sounding, a VAD wind or the previous sweep)
+     dual_prf         -- two PRFs with different Nyquist velocities: the pair
+                         of unfolded values that agree picks the fold, up to
+                         the extended Nyquist velocity v1*v2/(v1 - v2)
+     unfold_regions   -- region based continuity: gates are grouped into
+                         connected regions that can't contain a fold, and
+                         neighbouring regions are unfolded to match along
+                         their shared boundaries
+
+   example:
+       v_nyq=nyquist_velocity(10.,1000.)
+       velocity=unfold_regions(folded,v_nyq)
+"""
+from __future__ import division,print_function
+import timeit
+import numpy as np
+from scipy import ndimage
+from radar_geometry import nyquist_velocity
+
+def fold(velocity,v_nyq):
+    """
+       alias velocities into the Nyquist interval [-v_nyq,v_nyq)
+    """
+    return np.mod(np.asarray(velocity) + v_nyq,2.*v_nyq) - v_nyq
+
+def unfold_reference(velocity,reference,v_nyq):
+    """
+       input: velocity -- folded velocities (m/s), any shape
+              reference -- expected velocities (m/s), broadcastable to velocity
+              v_nyq -- Nyquist velocity (m/s), scalar or broadcastable
+       output: velocity + 2 n v_nyq with n chosen to be closest to reference
+    """
+    velocity=np.asarray(velocity,dtype=np.float64)
+    nfold=np.round((reference - velocity)/(2.*v_nyq))
+    return velocity + 2.*v_nyq*nfold
+
+def dual_prf(v_high,v_low,the_wavel,PRF_high,PRF_low):
+    """
+       input: v_high, v_low -- folded velocities (m/s) measured at the high and low PRF
+                               for the same gates, any matching shape
+              the_wavel -- wavelength (cm)
+              PRF_high, PRF_low -- pulse repetition frequencies (s^-1)
+       output: unfolded high PRF velocities (m/s), valid up to the extended Nyquist
+               velocity v_high_nyq*v_low_nyq/(v_high_nyq - v_low_nyq)
+    """
+    vn_high=nyquist_velocity(the_wavel,PRF_high)
+    vn_low=nyquist_velocity(the_wavel,PRF_low)
+    v_ext=vn_high*vn_low/(vn_high - vn_low)
+    v_high=np.asarray(v_high,dtype=np.float64)
+    #
+    # every high PRF candidate inside the extended interval, with the low PRF
+    # value unfolded to each of them; the candidate that the low PRF value
+    # matches best wins
+    #
+    nmax=int(np.ceil(v_ext/(2.*vn_high)))
+    folds=np.arange(-nmax,nmax + 1)
+    candidates=v_high[...,None] + 2.*vn_high*folds
+    mismatch=np.fabs(unfold_reference(np.asarray(v_low)[...,None],candidates,vn_low) - candidates)
+    mismatch[np.fabs(candidates) > v_ext]=np.inf
+    best=np.argmin(mismatch,axis=-1)
+    return np.take_along_axis(candidates,best[...,None],axis=-1)[...,0]
+
+def label_regions(velocity,v_nyq,nbins=4):
+    """
+       split the Nyquist interval into nbins velocity bins and label the
+       connected gates (4-connectivity) in each bin, so no region straddles a fold
+
+       output: labels (0 for missing gates, 1..nregions), nregions
+    """
+    valid=np.isfinite(velocity)
+    bins=np.floor((np.where(valid,velocity,0.) + v_nyq)/(2.*v_nyq)*nbins).astype(int)
+    bins=np.clip(bins,0,nbins - 1)
+    labels=np.zeros(velocity.shape,dtype=np.int64)
+    nregions=0
+    for the_bin in range(nbins):
+        bin_labels,count=ndimage.label(valid & (bins == the_bin))
+        labels=np.where(bin_labels > 0,bin_labels + nregions,labels)
+        nregions=nregions + count
+    return labels,nregions
+
+def boundary_pairs(labels,wrap_rays=True):
+    """
+       flat indices (first,second) of neighbouring gates that are in different regions,
+       along gates and along rays (with the last ray next to the first for a full PPI)
+    """
+    index=np.arange(labels.size).reshape(labels.shape)
+    firsts=[index[:,:-1].ravel(),index[:-1,:].ravel()]
+    seconds=[index[:,1:].ravel(),index[1:,:].ravel()]
+    if wrap_rays and labels.shape[0] > 2:
+        firsts.append(index[-1,:])
+        seconds.append(index[0,:])
+    first=np.concatenate(firsts)
+    second=np.concatenate(seconds)
+    flat=labels.ravel()
+    keep=(flat[first] > 0) & (flat[second] > 0) & (flat[first] != flat[second])
+    return first[keep],second[keep]
+
+def unfold_regions(velocity,v_nyq,reference=None,nbins=4,wrap_rays=True):
+    """
+       region based dealiasing of a (rays,gates) velocity field
+
+       input: velocity -- folded velocities (m/s), nan for missing gates
+              v_nyq -- Nyquist velocity (m/s)
+              reference -- optional expected velocity (scalar or (rays,gates)) used to
+                           pick the fold of the largest region in each connected piece,
+                           otherwise that region is taken to be unfolded
+              nbins -- velocity bins used to split the field into regions
+              wrap_rays -- the first and last rays are neighbours (full 360 degree scan)
+       output: unfolded velocities (m/s)
+    """
+    velocity=np.asarray(velocity,dtype=np.float64)
+    labels,nregions=label_regions(velocity,v_nyq,nbins)
+    flat_vel=velocity.ravel()
+    flat_labels=labels.ravel()
+    size=np.bincount(flat_labels,minlength=nregions + 1)
+    size[0]=0
+    first,second=boundary_pairs(labels,wrap_rays)
+    #
+    # each boundary is used in both directions
+    #
+    region_a=np.concatenate([flat_labels[first],flat_labels[second]])
+    region_b=np.concatenate([flat_labels[second],flat_labels[first]])
+    vel_a=np.concatenate([flat_vel[first],flat_vel[second]])
+    vel_b=np.concatenate([flat_vel[second],flat_vel[first]])
+    nfold=np.zeros(nregions + 1)
+    done=np.zeros(nregions + 1,dtype=bool)
+    done[0]=True
+    if reference is not None:
+        ref_diff=(np.broadcast_to(reference,velocity.shape).ravel() - flat_vel)/(2.*v_nyq)
+        ref_mean=np.bincount(flat_labels,weights=np.nan_to_num(ref_diff),minlength=nregions + 1)
+    while not done.all():
+        #
+        # seed the largest region left, then grow out from it through shared boundaries
+        #
+        seed=np.argmax(np.where(done,-1,size))
+        if reference is not None:
+            nfold[seed]=np.round(ref_mean[seed]/size[seed])
+        done[seed]=True
+        while True:
+            frontier=done[region_a] & ~done[region_b]
+            if not frontier.any():
+                break
+            target=region_b[frontier]
+            diff=(vel_a[frontier] + 2.*v_nyq*nfold[region_a[frontier]] - vel_b[frontier])/(2.*v_nyq)
+            counts=np.bincount(target,minlength=nregions + 1)
+            sums=np.bincount(target,weights=diff,minlength=nregions + 1)
+            new=counts > 0
+            nfold[new]=np.round(sums[new]/counts[new])
+            done[new]=True
+    return velocity + 2.*v_nyq*nfold[labels]*(labels > 0)
+
+def synthetic_field(nrays=360,ngates=1000,max_speed=40.,direction=30.):
+    """
+       radial velocities (m/s) of a uniform wind whose speed increases linearly
+       with range to max_speed, shaped (nrays,ngates)
+    """
+    azimuth=np.radians(np.arange(nrays)*360./nrays)[:,None]
+    speed=max_speed*(np.arange(ngates) + 1.)/ngates
+    return speed*np.cos(azimuth - np.radians(direction))
+
+def benchmark_dealias(nrays=360,ngates=1000,nsweeps=4,the_wavel=10.,PRF=800.):
+    """
+       time unfold_regions on a synthetic folded volume of nsweeps sweeps
+       output: gates per second
+    """
+    v_nyq=nyquist_velocity(the_wavel,PRF)
+    sweeps=[fold(synthetic_field(nrays,ngates,max_speed=30. + 5.*sweep) +
+                 np.random.normal(0.,0.5,(nrays,ngates)),v_nyq) for sweep in range(nsweeps)]
+    def run():
+        for sweep in sweeps:
+            unfold_regions(sweep,v_nyq)
+    seconds=min(timeit.repeat(run,number=1,repeat=3))
+    return nsweeps*nrays*ngates/seconds
+
+def test_dealias():
+    """
+       unfold synthetic folded fields with each method
+    """
+    the_wavel=10.
+    v_nyq=nyquist_velocity(the_wavel,800.)
+    truth=synthetic_field(180,300,max_speed=35.)
+    folded=fold(truth,v_nyq)
+    assert np.fabs(folded).max() <= v_nyq
+    np.testing.assert_allclose(unfold_reference(folded,truth + 5.,v_nyq),truth,atol=1.e-10)
+    #
+    # region continuity, with noise and missing gates
+    #
+    np.random.seed(4)
+    noisy=truth + np.random.normal(0.,0.5,truth.shape)
+    noisy[np.random.uniform(size=truth.shape) < 0.05]=np.nan
+    noisy[60:70,100:200]=np.nan
+    unfolded=unfold_regions(fold(noisy,v_nyq),v_nyq)
+    good=np.isfinite(noisy)
+    np.testing.assert_allclose(unfolded[good],noisy[good],atol=1.e-8)
+    assert np.isnan(unfolded[~good]).all()
+    #
+    # a reference picks the right fold even when most of the field is folded
+    #
+    fast=synthetic_field(90,200,max_speed=60.)
+    unfolded=unfold_regions(fold(fast,v_nyq),v_nyq,reference=fast + 3.)
+    np.testing.assert_allclose(unfolded,fast,atol=1.e-8)
+    #
+    # dual PRF: 4:3 PRFs extend the Nyquist velocity from 20 m/s to 60 m/s
+    #
+    PRF_high,PRF_low=800.,600.
+    v_true=np.linspace(-55.,55.,221)
+    v_high=fold(v_true + np.random.normal(0.,0.3,v_true.shape),nyquist_velocity(the_wavel,PRF_high))
+    v_low=fold(v_true + np.random.normal(0.,0.3,v_true.shape),nyquist_velocity(the_wavel,PRF_low))
+    unfolded=dual_prf(v_high,v_low,the_wavel,PRF_high,PRF_low)
+    np.testing.assert_allclose(unfolded,v_true,atol=1.5)
+    return None
+
+if __name__=="__main__":
+    test_dealias()
+    print("region dealiasing: {:.3g} gates per second".format(benchmark_dealias()))
@@ -0,0 +1,287 @@
+"""
+   run equil_run.run_equilibrium over a grid of parameters
+
+   cases that share num_layers are run together as columns of one
+   run_equilibrium call, and those batches are spread over a process pool.
+   Each finished case is written to its own case_NNNNNN.npz file in a store
+   directory as soon as its batch returns, so an interrupted ensemble can be
+   restarted with the same arguments and only the missing or failed cases
+   are rerun.  A case file whose stored parameters or run settings don't
+   match (the grid was extended or reordered, or stop_time, dT_tol ... changed)
+   is rerun too.
+
+   example:
+       cases=make_grid(tot_trans=[0.1,0.2,0.4],S0=[241.,260.],num_layers=[50,100])
+       done,failed=run_ensemble(cases,'equil_store',processes=4,stop_time=100*24*3600.)
+       results=load_ensemble('equil_store')
+"""
+from __future__ import division,print_function
+import os
+import glob
+import itertools
+import json
+import numbers
+import multiprocessing
+import traceback
+import numpy as np
+from equil_run import run_equilibrium
+
+#
+# parameters that define a case, and the subset that can differ
+# between columns of a single run_equilibrium call
+#
+grid_keys=('tot_trans','num_layers','S0','T_sfc')
+column_keys=('tot_trans','S0','T_sfc')
+
+def make_grid(tot_trans=(0.2,),num_layers=(100,),S0=(241.,),T_sfc=(300.,)):
+    """
+       input: sequences of values for each parameter (T_sfc is the initial temperature)
+       output: list of case dictionaries, one per combination, each with a case_id
+    """
+    cases=[]
+    for case_id,values in enumerate(itertools.product(tot_trans,num_layers,S0,T_sfc)):
+        case=dict(zip(grid_keys,values))
+        case['case_id']=case_id
+        cases.append(case)
+    return cases
+
+def case_filename(store,case_id,ext='npz'):
+    return os.path.join(store,'case_{:06d}.{}'.format(case_id,ext))
+
+def run_key(run_kwargs):
+    """
+       the run_equilibrium settings that change a result, as a json string
+       saved with each case (numbers as floats, so 10 and 10. match)
+    """
+    settings={}
+    for key,value in run_kwargs.items():
+        if key == 'verbose':
+            continue
+        if isinstance(value,numbers.Number) and not isinstance(value,bool):
+            value=float(value)
+        settings[key]=value
+    return json.dumps(settings,sort_keys=True)
+
+def stored_params(store,case_id):
+    """
+       the grid parameters and run_key saved with a finished case, None if
+       there's no result file or it was written without a run_key
+    """
+    filename=case_filename(store,case_id)
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as infile:
+        if 'run_key' not in infile.files:
+            return None
+        return dict((key,infile[key][()]) for key in grid_keys + ('run_key',))
+
+def pending_cases(cases,store,run_kwargs=None):
+    """
+       the cases that don't have a result file in store yet, or whose result
+       file was written for different parameters or run_kwargs
+    """
+    the_key=run_key(run_kwargs or {})
+    pending=[]
+    for case in cases:
+        stored=stored_params(store,case['case_id'])
+        if (stored is None or stored['run_key'] != the_key or
+                any(stored[key] != case[key] for key in grid_keys)):
+            pending.append(case)
+    return pending
+
+def make_batches(cases,batch_size):
+    """
+       group cases by num_layers and split each group into lists of at most batch_size
+    """
+    groups={}
+    for case in cases:
+        groups.setdefault(case['num_layers'],[]).append(case)
+    batches=[]
+    for num_layers in sorted(groups.keys()):
+        group=groups[num_layers]
+        for start in range(0,len(group),batch_size):
+            batches.append(group[start:start+batch_size])
+    return batches
+
+def run_batch(task):
+    """
+       run one batch of cases as columns of a single run_equilibrium call
+
+       input: task -- (batch,run_kwargs) tuple, so it can be sent through Pool.imap
+       output: list of (case,result,error) tuples, result is None and error holds
+               the traceback if the run raised
+    """
+    batch,run_kwargs=task
+    try:
+        columns=dict((key,np.array([case[key] for case in batch],dtype=np.float64))
+                     for key in column_keys)
+        out=run_equilibrium(num_layers=batch[0]['num_layers'],**dict(columns,**run_kwargs))
+        results=[]
+        for col,case in enumerate(batch):
+            result=dict(Temp_layers=out['Temp_layers'][col],
+                        height_levels=out['height_levels'][col],
+                        up=out['up'][col],down=out['down'][col],
+                        T_sfc_final=out['T_sfc'][col],
+                        converged=out['converged'][col],
+                        nsteps=out['nsteps'][col],
+                        stop_time=out['end_time'][col],
+                        run_key=run_key(run_kwargs))
+            results.append((case,result,None))
+    except Exception:
+        error=traceback.format_exc()
+        results=[(case,None,error) for case in batch]
+    return results
+
+def write_case(store,case,result):
+    """
+       write to a temporary name and rename, so a killed run never leaves
+       a partial file that would be mistaken for a finished case
+    """
+    filename=case_filename(store,case['case_id'])
+    tmpname=filename + '.tmp'
+    with open(tmpname,'wb') as outfile:
+        np.savez(outfile,**dict(case,**result))
+    os.rename(tmpname,filename)
+    failname=case_filename(store,case['case_id'],'failed')
+    if os.path.exists(failname):
+        os.remove(failname)
+
+def run_ensemble(cases,store,processes=None,batch_size=16,**run_kwargs):
+    """
+       run every case in cases that isn't already in store with the same run_kwargs
+
+       input: cases -- list from make_grid
+              store -- directory for the case files, created if needed
+              processes -- size of the process pool, None for one per cpu,
+                           1 to run in this process
+              batch_size -- maximum number of cases per run_equilibrium call
+              run_kwargs -- passed to run_equilibrium (delta_time, stop_time, dT_tol ...)
+                            with max_dT every case is run on its own, since
+                            run_equilibrium shares the adaptive step across columns
+       output: number of cases written, list of case_ids that failed
+               (a case_NNNNNN.failed file holds the traceback)
+    """
+    if not os.path.isdir(store):
+        os.makedirs(store)
+    if run_kwargs.get('max_dT') is not None:
+        batch_size=1
+    pending=pending_cases(cases,store,run_kwargs)
+    tasks=[(batch,run_kwargs) for batch in make_batches(pending,batch_size)]
+    pool=None
+    if processes == 1:
+        results_iter=(run_batch(task) for task in tasks)
+    else:
+        pool=multiprocessing.Pool(processes)
+        results_iter=pool.imap_unordered(run_batch,tasks)
+    done=0
+    failed=[]
+    try:
+        for results in results_iter:
+            for case,result,error in results:
+                if error is None:
+                    write_case(store,case,result)
+                    done=done + 1
+                else:
+                    with open(case_filename(store,case['case_id'],'failed'),'w') as outfile:
+                        outfile.write(error)
+                    failed.append(case['case_id'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return done,sorted(failed)
+
+def load_ensemble(store):
+    """
+       input: store -- directory written by run_ensemble
+       output: dictionary with arrays of case_id, the grid parameters, T_sfc_final,
+               converged and nsteps, plus lists of the Temp_layers and
+               height_levels profiles (num_layers can differ between cases)
+    """
+    scalar_keys=('case_id',) + grid_keys + ('T_sfc_final','converged','nsteps')
+    out=dict((key,[]) for key in scalar_keys + ('Temp_layers','height_levels'))
+    for filename in sorted(glob.glob(os.path.join(store,'case_*.npz'))):
+        with np.load(filename) as infile:
+            for key in out.keys():
+                out[key].append(infile[key][()])
+    for key in scalar_keys:
+        out[key]=np.array(out[key])
+    return out
+
+def test_ensemble():
+    """
+       run a small grid in a pool, check it against single runs, then
+       check that a rerun only repeats the missing case
+    """
+    import tempfile
+    import shutil
+    store=tempfile.mkdtemp()
+    try:
+        cases=make_grid(tot_trans=[0.2,0.5],num_layers=[10,20],S0=[241.])
+        run_kwargs=dict(stop_time=10*24*3600.)
+        done,failed=run_ensemble(cases,store,processes=2,batch_size=1,**run_kwargs)
+        assert done == 4 and failed == []
+        results=load_ensemble(store)
+        np.testing.assert_array_equal(results['case_id'],np.arange(4))
+        for index,case in enumerate(cases):
+            single=run_equilibrium(case['tot_trans'],case['S0'],num_layers=case['num_layers'],
+                                   T_sfc=case['T_sfc'],**run_kwargs)
+            np.testing.assert_allclose(results['Temp_layers'][index],single['Temp_layers'][0])
+        os.remove(case_filename(store,2))
+        assert [case['case_id'] for case in pending_cases(cases,store,run_kwargs)] == [2]
+        done,failed=run_ensemble(cases,store,processes=1,**run_kwargs)
+        assert done == 1
+        #
+        # a grid extended at the front shifts the case_ids, so every stored case
+        # now has different parameters and is rerun rather than reused
+        #
+        extended=make_grid(tot_trans=[0.1,0.2,0.5],num_layers=[10,20],S0=[241.])
+        assert [case['case_id'] for case in pending_cases(extended,store,run_kwargs)] == [0,1,2,3,4,5]
+        done,failed=run_ensemble(extended,store,processes=1,**run_kwargs)
+        assert done == 6 and pending_cases(extended,store,run_kwargs) == []
+        results=load_ensemble(store)
+        np.testing.assert_array_equal(results['tot_trans'],[0.1,0.1,0.2,0.2,0.5,0.5])
+        np.testing.assert_allclose(results['Temp_layers'][2],
+                                   run_equilibrium(0.2,241.,num_layers=10,**run_kwargs)['Temp_layers'][0])
+        #
+        # with max_dT each case gets its own step, so batching doesn't change the answer
+        #
+        adaptive=dict(stop_time=10*24*3600.,max_dT=1.)
+        adapt_store=os.path.join(store,'adaptive')
+        run_ensemble([cases[0],cases[2]],adapt_store,processes=1,batch_size=16,**adaptive)
+        results=load_ensemble(adapt_store)
+        single=run_equilibrium(0.5,241.,num_layers=10,**adaptive)
+        np.testing.assert_allclose(results['Temp_layers'][1],single['Temp_layers'][0])
+        #
+        # new run settings make every case pending, and nsteps and stop_time
+        # belong to the case, whatever batch it ran in
+        #
+        converge=dict(stop_time=2000*24*3600.,dT_tol=1.e-7)
+        assert len(pending_cases(extended,store,converge)) == len(extended)
+        assert pending_cases(extended,store,dict(stop_time=10*24*3600)) == []
+        for batch_size in [1,16]:
+            batch_store=os.path.join(store,'batch_{}'.format(batch_size))
+            done,failed=run_ensemble(cases,batch_store,processes=1,batch_size=batch_size,**converge)
+            assert done == 4
+            results=load_ensemble(batch_store)
+            single=run_equilibrium(0.2,241.,num_layers=10,**converge)
+            assert results['nsteps'][0] == single['nsteps'][0]
+            assert results['T_sfc_final'][0] == single['T_sfc'][0]
+        #
+        # a bad case is recorded as failed and retried on the next run
+        #
+        bad=make_grid(tot_trans=[0.2],num_layers=[0])
+        bad[0]['case_id']=10
+        done,failed=run_ensemble(bad,store,processes=1,**run_kwargs)
+        assert failed == [10] and os.path.exists(case_filename(store,10,'failed'))
+    finally:
+        shutil.rmtree(store)
+    return None
+
+if __name__=="__main__":
+    import sys
+    store=sys.argv[1] if len(sys.argv) > 1 else 'equil_store'
+    cases=make_grid(tot_trans=np.linspace(0.1,0.9,9),num_layers=[50,100],
+                    S0=[220.,241.,260.])
+    done,failed=run_ensemble(cases,store,dT_tol=1.e-8,max_dT=2.)
+    print("finished {} cases, {} failed".format(done,len(failed)))
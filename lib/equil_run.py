@@ -1,6 +1,7 @@
 from __future__ import division
 import numpy as np
 import matplotlib.pyplot as plt
+from fluxes import two_stream
 import sys
 #
 # use pretty plotting if it can be imported
@@ -16,11 +17,11 @@ def find_tau(tot_trans,num_layers):
     """
     # -TD- document using
     """
-    trans_layer=tot_trans**(1./num_layers)
+    trans_layer=np.asarray(tot_trans,dtype=np.float64)**(1./num_layers)
     tau_layer= -1.*np.log(trans_layer)
-    tau_layers=np.ones([num_layers])*tau_layer
-    tau_levels=np.cumsum(tau_layers)
-    tau_levels=np.concatenate(([0],tau_levels))
+    tau_layers=np.ones([num_layers])*tau_layer[...,None]
+    tau_levels=np.cumsum(tau_layers,axis=-1)
+    tau_levels=np.concatenate((np.zeros(tau_levels.shape[:-1] + (1,)),tau_levels),axis=-1)
     return tau_levels
 
 def find_heights(press_levels,rho_layers):
@@ -29,42 +30,17 @@ def find_heights(press_levels,rho_layers):
     """
     Rd=287.
     g=9.8
-    press_layers=(press_levels[1:] + press_levels[:-1])/2.
     del_press=(press_levels[1:] - press_levels[0:-1])
-    rho_layers=press_layers/(Rd*Temp_layers)
     del_z= -1.*del_press/(rho_layers*g)
-    level_heights=np.cumsum(del_z)
-    level_heights=np.concatenate(([0],level_heights))
+    level_heights=np.cumsum(del_z,axis=-1)
+    level_heights=np.concatenate((np.zeros(level_heights.shape[:-1] + (1,)),level_heights),axis=-1)
     return level_heights
 
 def fluxes(tau_levels,Temp_layers,T_surf):
     """
      -TD- docstring using google style
     """
-    up_rad=np.empty_like(tau_levels)
-    down_rad=np.empty_like(tau_levels)
-    sfc_rad=sigma*T_surf**4.
-    up_rad[0]=sfc_rad
-    tot_levs=len(tau_levels)
-    for index in np.arange(1,tot_levs):
-        upper_lev=index
-        lower_lev=index - 1
-        layer_num=index-1
-        del_tau=tau_levels[upper_lev] - tau_levels[lower_lev]
-        trans=np.exp(-1.666*del_tau)
-        emiss=1 - trans
-        layer_rad=sigma*Temp_layers[layer_num]**4.*emiss
-        up_rad[upper_lev]=trans*up_rad[lower_lev] + layer_rad
-    down_rad[tot_levs-1]=0
-    for index in np.arange(1,tot_levs):
-        upper_lev=tot_levs - index
-        lower_lev=tot_levs - index -1
-        layer_num=tot_levs - index - 1
-        del_tau=tau_levels[upper_lev] - tau_levels[lower_lev]
-        trans=np.exp(-1.666*del_tau)
-        emiss=1 - trans
-        layer_rad=sigma*Temp_layers[layer_num]**4.*emiss
-        down_rad[lower_lev]=down_rad[upper_lev]*trans + layer_rad
+    up_rad,down_rad=two_stream(tau_levels,Temp_layers,Temp_layers,T_surf)
     return (up_rad,down_rad)
 
 def heating_rate(net_up,height_levels,rho_layers):
@@ -72,7 +48,7 @@ def heating_rate(net_up,height_levels,rho_layers):
      -TD- docstring using google style
     """
     cpd=1004.
-    dFn_dz= -1.*np.diff(net_up)/np.diff(height_levels)
+    dFn_dz= -1.*np.diff(net_up,axis=-1)/np.diff(height_levels,axis=-1)
     dT_dt=dFn_dz/(rho_layers*cpd)
     return dT_dt
 
@@ -83,82 +59,188 @@ def time_step(heating_rate,Temp_layers,delta_time):
     Temp_layers[:] =  Temp_layers[:] + heating_rate*delta_time
     return Temp_layers
 
-if __name__=="__main__":
-    
-    tot_trans=0.2
-    num_layers=100
-    p_sfc=1000.*1.e2
-    p_top=100.*1.e2
-    g=9.8
-    T_sfc=300.
+def run_equilibrium(tot_trans=0.2,S0=241.,num_layers=100,T_sfc=300.,p_sfc=1000.*1.e2,
+                    p_top=100.*1.e2,delta_time=30*3600.,stop_time=600*24*3600.,
+                    max_dT=None,dT_tol=None,snapshots=(),verbose=False):
+    """
+       march one or many grey-atmosphere columns towards radiative equilibrium
+
+       input: tot_trans -- total atmospheric transmissivity, scalar or (ncols,) array
+              S0 -- absorbed solar flux at the surface (W/m^2), scalar or (ncols,) array
+              num_layers -- number of equal-pressure layers between p_sfc and p_top (Pa)
+              T_sfc -- initial surface and air temperature (K), scalar or (ncols,) array
+              delta_time -- time step (s); with max_dT this is the largest step allowed
+              stop_time -- stop after this much simulated time (s)
+              max_dT -- if given, shrink the step so no layer changes by more than max_dT (K)
+              dT_tol -- if given, freeze a column once its largest |dT/dt| is below
+                        dT_tol (K/s) and stop when every column is frozen
+              snapshots -- step indices at which to save full profiles
+              verbose -- write percent complete to stdout
+       output: dictionary with
+              Temp_layers, height_levels, up, down, T_sfc -- final state, leading axis ncols,
+                  with heights and fluxes computed from the final temperatures
+              times -- (nsteps,) time at the start of each step (s)
+              sfc_temp, air_temp -- (nsteps,ncols) surface and lowest layer temperature
+              snap_index -- the snapshot steps actually reached
+              snap_Temp, snap_height, snap_up, snap_down -- profiles at those steps,
+                  leading axis len(snap_index)
+              converged -- (ncols,) True where dT_tol was met
+              nsteps, end_time -- (ncols,) number of steps each column took and the
+                  time it stopped at (s), which don't depend on the other columns
+    """
     Rd=287. #J/kg/K
+    tot_trans,S0,T_sfc=np.broadcast_arrays(np.atleast_1d(tot_trans),np.atleast_1d(S0),
+                                           np.atleast_1d(T_sfc))
+    ncols=tot_trans.size
+    S0=S0.astype(np.float64)
+    T_sfc=T_sfc.astype(np.float64)
     num_levels=num_layers+1
     tau_levels=find_tau(tot_trans,num_layers)
-    press_levels=np.linspace(p_top,p_sfc,num_levels)
-    press_diff=np.diff(press_levels)[0]
-    press_levels=press_levels[::-1]
-    press_layers=(press_levels[1:] + press_levels[:-1])/2.
-    Temp_levels=np.ones([num_levels])*T_sfc
-    Temp_layers=(Temp_levels[1:] + Temp_levels[:-1])/2.
-
-    S0=241.
-    Tc=273.15
-    delta_time_hr=30   #time interval in hours
-    delta_time_sec=30*3600.  #time interval in seconds
-    stop_time_hr=600*24.  #stop time in hours
-    times=np.arange(0,stop_time_hr,delta_time_hr) #times in hours
-    tot_loops=len(times)
-    num_times=len(times)
     #
-    # -TD- comment which variables are defined on levels, and which on layers
+    # pressure is fixed on levels (surface first), temperature lives on layers
     #
-    sfc_temp=np.empty([num_times],dtype=np.float64)
-    hours=np.empty_like(sfc_temp)
+    press_levels=np.linspace(p_top,p_sfc,num_levels)[::-1]
+    press_layers=(press_levels[1:] + press_levels[:-1])/2.
+    Temp_layers=np.empty([ncols,num_layers],dtype=np.float64)
+    Temp_layers[...]=T_sfc[:,None]
     #
-    # -TD- describe what the 2-d arrays are used for
+    # work buffers reused every step
     #
-    air_temps=np.empty([num_layers,num_times],dtype=np.float64)
-    up_flux_run=np.empty([num_levels,num_times],dtype=np.float64)
-    down_flux_run=np.empty_like(up_flux_run)
-    height_levels_run=np.empty_like(up_flux_run)
-        
-    for index in np.arange(0,num_times):
-        rho_layers=press_layers/(Rd*Temp_layers)
+    rho_layers=np.empty_like(Temp_layers)
+    step=np.empty([ncols,1],dtype=np.float64)
+    active=np.ones([ncols],dtype=bool)
+    col_steps=np.full([ncols],-1,dtype=int)
+    col_time=np.zeros([ncols],dtype=np.float64)
+    snapshots=set(snapshots)
+    times=[]
+    sfc_temp=[]
+    air_temp=[]
+    snap_index=[]
+    snap_Temp=[]
+    snap_height=[]
+    snap_up=[]
+    snap_down=[]
+    the_time=0.
+    index=0
+    while the_time < stop_time and active.any():
+        np.divide(press_layers,Rd*Temp_layers,out=rho_layers)
         height_levels=find_heights(press_levels,rho_layers)
         up,down=fluxes(tau_levels,Temp_layers,T_sfc)
-        sfc_temp[index]=T_sfc
-        #
-        # -TD-  describe what this loop does
-        #
-        if np.mod(index,50)==0:
-            the_frac=np.int(index/tot_loops*100.)
+        dT_dt=heating_rate(up - down,height_levels,rho_layers)
+        times.append(the_time)
+        sfc_temp.append(T_sfc.copy())
+        air_temp.append(Temp_layers[:,0].copy())
+        if index in snapshots:
+            snap_index.append(index)
+            snap_Temp.append(Temp_layers.copy())
+            snap_height.append(height_levels)
+            snap_up.append(up)
+            snap_down.append(down)
+        if verbose and np.mod(index,50)==0:
+            the_frac=int(the_time/stop_time*100.)
             sys.stdout.write("\rpercent complete: %d%%" % the_frac)
             sys.stdout.flush()
-        air_temps[:,index]=Temp_layers[:]
-        up,down=fluxes(tau_levels,Temp_layers,T_sfc)
-        up_flux_run[:,index]=up[:]
-        down_flux_run[:,index]=down[:]
-        height_levels_run[:,index]=height_levels[:]
-        dT_dt=heating_rate(up-down,height_levels,rho_layers)
-        Temp_layers[:]=time_step(dT_dt,Temp_layers,delta_time_sec)
+        max_rate=np.abs(dT_dt).max(axis=-1)
+        if dT_tol is not None:
+            active=active & (max_rate >= dT_tol)
+            #
+            # a column that just froze has taken index steps and stopped at the_time
+            #
+            frozen=~active & (col_steps < 0)
+            col_steps[frozen]=index
+            col_time[frozen]=the_time
+        the_step=delta_time
+        if max_dT is not None and active.any():
+            the_step=min(delta_time,max_dT/max(max_rate[active].max(),1.e-30))
+        #
+        # frozen columns get a zero time step
+        #
+        step[:,0]=np.where(active,the_step,0.)
+        Temp_layers[:]=time_step(dT_dt,Temp_layers,step)
         #
-        # -TD- describe what the following statements do
+        # the surface is black and in balance with the absorbed solar plus
+        # the downwelling longwave at the bottom level
         #
-        net_downsfc=S0 + down[0]
-        T_sfc=(net_downsfc/sigma)**0.25
+        net_downsfc=S0 + down[:,0]
+        T_sfc=np.where(active,(net_downsfc/sigma)**0.25,T_sfc)
+        the_time=the_time + the_step
+        index=index + 1
+    if verbose:
+        sys.stdout.write("\n")
+    col_time[col_steps < 0]=the_time
+    col_steps[col_steps < 0]=index
+    #
+    # heights and fluxes for the final temperatures, not the ones the last step started from
+    #
+    np.divide(press_layers,Rd*Temp_layers,out=rho_layers)
+    height_levels=find_heights(press_levels,rho_layers)
+    up,down=fluxes(tau_levels,Temp_layers,T_sfc)
+    out=dict(Temp_layers=Temp_layers,height_levels=height_levels,up=up,down=down,
+             T_sfc=T_sfc,times=np.array(times),sfc_temp=np.array(sfc_temp),
+             air_temp=np.array(air_temp),snap_index=np.array(snap_index,dtype=int),
+             snap_Temp=np.array(snap_Temp),snap_height=np.array(snap_height),
+             snap_up=np.array(snap_up),snap_down=np.array(snap_down),
+             converged=~active,nsteps=col_steps,end_time=col_time)
+    return out
+
+def test_run_equilibrium():
+    """
+       a batch of columns should match the same columns run one at a time,
+       and the early stop should be reached before stop_time
+    """
+    tot_trans=np.array([0.2,0.5])
+    S0=np.array([241.,260.])
+    batch=run_equilibrium(tot_trans,S0,num_layers=20,stop_time=20*24*3600.,snapshots=[0,5])
+    assert batch['snap_Temp'].shape == (2,2,20)
+    for col in range(2):
+        single=run_equilibrium(tot_trans[col],S0[col],num_layers=20,stop_time=20*24*3600.)
+        np.testing.assert_allclose(batch['Temp_layers'][col],single['Temp_layers'][0],rtol=1.e-12)
+        np.testing.assert_allclose(batch['sfc_temp'][:,col],single['sfc_temp'][:,0],rtol=1.e-12)
+    quick=run_equilibrium(tot_trans,S0,num_layers=20,max_dT=2.,dT_tol=1.e-8,
+                          stop_time=2000*24*3600.)
+    assert quick['converged'].all()
+    assert quick['times'][-1] < 2000*24*3600.
+    for col in range(2):
+        alone=run_equilibrium(tot_trans[col],S0[col],num_layers=20,dT_tol=1.e-7,
+                              stop_time=2000*24*3600.)
+        together=run_equilibrium(tot_trans,S0,num_layers=20,dT_tol=1.e-7,stop_time=2000*24*3600.)
+        assert alone['nsteps'][0] == together['nsteps'][col]
+        assert alone['end_time'][0] == together['end_time'][col]
+        assert alone['end_time'][0] == alone['nsteps'][0]*30*3600.
+    #
+    # the returned fluxes belong to the returned temperatures
+    #
+    up,down=fluxes(find_tau(tot_trans,20),batch['Temp_layers'],batch['T_sfc'])
+    np.testing.assert_allclose(batch['up'],up,rtol=1.e-12)
+    np.testing.assert_allclose(batch['down'],down,rtol=1.e-12)
+    return None
+
+if __name__=="__main__":
+    
+    tot_trans=0.2
+    num_layers=100
+    T_sfc=300.
+    S0=241.
+    Tc=273.15
+    delta_time_hr=30   #time interval in hours
+    stop_time_hr=600*24.  #stop time in hours
+    snapshots=[0,2,8,30,40,50,60,70]
+    run=run_equilibrium(tot_trans,S0,num_layers=num_layers,T_sfc=T_sfc,
+                        delta_time=delta_time_hr*3600.,stop_time=stop_time_hr*3600.,
+                        snapshots=snapshots,verbose=True)
+    days=run['times']/3600./24.
+    sfc_temp=run['sfc_temp'][:,0]
     
     plt.close('all')
     fig1,axis1=plt.subplots(1,1)
-    snapshots=[0,2,8,30,40,50,60,70]
-    days=times/24.
-    for the_snap in snapshots:
+    for snap_num,the_snap in enumerate(run['snap_index']):
         #
         # -TD- describe what the label does
         #
         label="%3.1f" % days[the_snap]
-        height_levels=height_levels_run[:,the_snap]
+        height_levels=run['snap_height'][snap_num,0,:]
         layer_heights=(height_levels[1:] + height_levels[:-1])/2.
-        axis1.plot(air_temps[:,the_snap],layer_heights*1.e-3,label=label)
+        axis1.plot(run['snap_Temp'][snap_num,0,:],layer_heights*1.e-3,label=label)
         axis1.legend()
     axis1.set_title('temperature profiles for {} days'.format(len(snapshots)))
     axis1.set_xlabel('temperature (deg C)')
@@ -173,7 +255,7 @@ if __name__=="__main__":
     fig2.savefig("sfc_temp.png")
 
     fig3,axis3=plt.subplots(1,1)
-    axis3.plot(days,sfc_temp - air_temps[0,:])
+    axis3.plot(days,sfc_temp - run['air_temp'][:,0])
     axis3.set_title('air-sea temperature difference (deg C)')
     axis3.set_ylabel('surface - first layer temp (degC)')
     axis3.set_xlabel('day')
@@ -181,5 +263,3 @@ if __name__=="__main__":
     fig3.savefig("air_sea.png")
 
     plt.show()
-
-    
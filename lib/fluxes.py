@@ -1,44 +1,69 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from radiances import find_tau,hydrostat
+from hydrostat import find_tau,hydrostat
 
 sigma=5.67e-8
 
 
-def fluxes(tau,Temp,height,T_surf):
-    up_rad=np.empty_like(height)
-    down_rad=np.empty_like(height)
-    sfc_rad=sigma*T_surf**4.
-    up_rad[0]=sfc_rad
-    tot_levs=len(tau)
-    for index in np.arange(1,tot_levs):
-        upper_lev=index
-        lower_lev=index - 1
-        del_tau=tau[upper_lev] - tau[lower_lev]
-        trans=np.exp(-1.666*del_tau)
-        emiss=1 - trans
-        layer_rad=sigma*Temp[lower_lev]**4.*emiss
-        #
-        # find the radiance at the next level
-        #
-        up_rad[upper_lev]=trans*up_rad[lower_lev] + layer_rad
+def _accumulate(boundary,source,path):
+    """
+       evaluate out[i]=exp(-(path[i]-path[i-1]))*out[i-1] + source[i-1], out[0]=boundary
+       along the last axis.  The closed form is
+           out[i]=exp(-path[i])*(boundary + sum_{j<=i} source[j-1]*exp(path[j]))
+       which overflows for thick atmospheres, so the sum is done in log space
+       with the compiled scan np.logaddexp.accumulate
+    """
+    with np.errstate(divide='ignore'):
+        log_terms=np.concatenate((np.log(boundary),np.log(source) + path[...,1:]),axis=-1)
+    return np.exp(np.logaddexp.accumulate(log_terms,axis=-1) - path)
+
+
+def two_stream(tau,Temp_up,Temp_down,T_surf,diffusivity=1.666,emission=sigma):
+    """
+       upward and downward fluxes (or radiances) for any number of columns at once
+
+       input: tau -- optical depth at levels measured up from the surface, shape (...,nlev)
+              Temp_up -- temperature (K) of the layer emission added to the upward beam,
+                         shape (...,nlev-1)
+              Temp_down -- same for the downward beam
+              T_surf -- temperature (K) of the black surface, shape (...)
+              diffusivity -- 1.666 for fluxes, 1 for vertical radiances
+              emission -- sigma for fluxes, sigma/pi for radiances
+       output: up, down -- shape (...,nlev), zero downward flux at the top
+    """
+    tau=np.asarray(tau,dtype=np.float64)
+    path=diffusivity*(tau - tau[...,:1])
+    emiss= -np.expm1(-np.diff(path,axis=-1))
+    up_source=emiss*emission*np.asarray(Temp_up,dtype=np.float64)**4.
+    down_source=emiss*emission*np.asarray(Temp_down,dtype=np.float64)**4.
+    sfc_rad=emission*np.asarray(T_surf,dtype=np.float64)[...,None]**4.
     #
-    # start at the top of the atmosphere
-    # with zero downwelling flux
+    # give every array the same leading (column) dimensions
     #
-    down_rad[tot_levs-1]=0
+    batch=np.broadcast(path[...,1:],up_source,down_source,sfc_rad).shape[:-1]
+    nlev=path.shape[-1]
+    path=np.broadcast_to(path,batch + (nlev,))
+    up_source=np.broadcast_to(up_source,batch + (nlev-1,))
+    down_source=np.broadcast_to(down_source,batch + (nlev-1,))
+    sfc_rad=np.broadcast_to(sfc_rad,batch + (1,))
+    up=_accumulate(sfc_rad,up_source,path)
     #
-    # go down a level at a time, adding up the radiances
+    # the downward beam is the same recurrence run from the top, so flip
+    # the level axis and measure the path down from the top
     #
-    for index in np.arange(1,tot_levs):
-        upper_lev=tot_levs - index
-        lower_lev=tot_levs - index -1
-        del_tau=tau[upper_lev] - tau[lower_lev]
-        trans=np.exp(-1.666*del_tau)
-        emiss=1 - trans
-        layer_rad=sigma*Temp[upper_lev]**4.*emiss
-        down_rad[lower_lev]=down_rad[upper_lev]*trans + layer_rad
-    return (up_rad,down_rad)
+    top_path=(path[...,-1:] - path)[...,::-1]
+    down=_accumulate(np.zeros_like(sfc_rad),down_source[...,::-1],top_path)[...,::-1]
+    return (up,down)
+
+
+def fluxes(tau,Temp,height,T_surf):
+    """
+       input: tau -- level optical depths, Temp -- level temperatures (K),
+              height -- level heights (m), T_surf -- surface temperature (K)
+              all may carry leading column dimensions
+       output: up_rad, down_rad -- upward and downward fluxes in W/m^2 on levels
+    """
+    return two_stream(tau,Temp[...,:-1],Temp[...,1:],T_surf)
 
 def heating_rate(net_up,height,rho):
     cpd=1004.
@@ -46,11 +71,68 @@ def heating_rate(net_up,height,rho):
     # find the radiance divergence across the layer
     # by differencing the levels
     #
-    rho_mid=(rho[1:] + rho[:-1])/2.
-    dFn_dz= -1.*np.diff(net_up)/np.diff(height)
+    rho_mid=(rho[...,1:] + rho[...,:-1])/2.
+    dFn_dz= -1.*np.diff(net_up,axis=-1)/np.diff(height,axis=-1)
     dT_dt=dFn_dz/(rho_mid*cpd)
     return dT_dt
 
+def column_fluxes(tau_levels,Temp_layers,T_surf,height_levels,rho_layers):
+    """
+       batched flux solver for atmospheres with temperatures given on layers,
+       as in simple_atmos.py and equil_run.py
+
+       input: tau_levels -- level optical depths, shape (ncols,nlev)
+              Temp_layers -- layer temperatures (K), shape (ncols,nlev-1)
+              T_surf -- surface temperatures (K), shape (ncols,)
+              height_levels -- level heights (m), shape (ncols,nlev)
+              rho_layers -- layer densities (kg/m^3), shape (ncols,nlev-1)
+       output: up, down -- fluxes (W/m^2), shape (ncols,nlev)
+               dT_dt -- heating rate (K/s), shape (ncols,nlev-1)
+    """
+    cpd=1004.
+    up,down=two_stream(tau_levels,Temp_layers,Temp_layers,T_surf)
+    dFn_dz= -1.*np.diff(up - down,axis=-1)/np.diff(height_levels,axis=-1)
+    dT_dt=dFn_dz/(rho_layers*cpd)
+    return (up,down,dT_dt)
+
+def test_two_stream():
+    """
+       compare the log-space scan against the original level loops, for a
+       thin and a very thick column in the same batch
+    """
+    Temp,press,rho,height=hydrostat(np.array([300.,280.]),100.e3,-7.e-3,10.,1500)
+    tau=find_tau(0.01,np.array([0.01,10.]),rho,height)
+    Temp=Temp[:,None,:]
+    T_surf=np.array([300.,280.])[:,None]
+    up,down=fluxes(tau,Temp,height,T_surf)
+    assert up.shape == (2,2,1500)
+    for col in range(2):
+        for chan in range(2):
+            the_tau=tau[col,chan]
+            the_temp=Temp[col,0]
+            loop_up=np.empty(1500)
+            loop_down=np.empty(1500)
+            loop_up[0]=sigma*T_surf[col,0]**4.
+            loop_down[-1]=0.
+            for index in range(1,1500):
+                trans=np.exp(-1.666*(the_tau[index] - the_tau[index-1]))
+                loop_up[index]=trans*loop_up[index-1] + (1-trans)*sigma*the_temp[index-1]**4.
+                upper_lev=1500 - index
+                trans=np.exp(-1.666*(the_tau[upper_lev] - the_tau[upper_lev-1]))
+                loop_down[upper_lev-1]=trans*loop_down[upper_lev] + (1-trans)*sigma*the_temp[upper_lev]**4.
+            np.testing.assert_allclose(up[col,chan],loop_up,rtol=1.e-10)
+            np.testing.assert_allclose(down[col,chan],loop_down,rtol=1.e-10,atol=1.e-10)
+    #
+    # isothermal layers over a surface at the same temperature: no net flux
+    #
+    tau_levels=np.linspace(0,2000.,101)*np.ones([3,1])
+    Temp_layers=np.ones([3,100])*250.
+    up,down,dT_dt=column_fluxes(tau_levels,Temp_layers,250.*np.ones(3),
+                                np.linspace(0,1.e4,101)*np.ones([3,1]),np.ones([3,100]))
+    np.testing.assert_allclose(up,sigma*250.**4.)
+    np.testing.assert_allclose(dT_dt[:,:50],0.,atol=1.e-12)
+    return None
+
 if __name__=="__main__":
     
     r_gas=0.01  #kg/kg
@@ -0,0 +1,139 @@
+"""
+   grey atmosphere radiative equilibrium in one linear solve
+
+   equil_run.run_equilibrium marches layer temperatures forward in time
+   until the heating rates vanish.  In equilibrium every layer emits as
+   much as it absorbs, which is linear in the emitted fluxes
+   x_k=eps_k sigma T_k**4, so the steady state is the solution of
+   A x = b with the exchange matrix A of two_layer_analytic.exchange_matrix
+   built here from level optical depths (find_tau in equil_run), and b
+   the absorbed solar flux, all at the surface as in equil_run.
+
+   example:
+       out=radiative_equilibrium(np.array([0.2,0.5]),241.,num_layers=100)
+       out['Temp_layers'].shape   #(2,100)
+"""
+from __future__ import division,print_function
+import numpy as np
+from fluxes import two_stream
+from two_layer_analytic import exchange_matrix
+from equil_run import find_tau
+
+sigma=5.67e-8
+
+def layer_exchange(tau_levels,diffusivity=1.666):
+    """
+       input: tau_levels -- (...,nlev) optical depth on levels measured up from the surface
+              diffusivity -- 1.666 for fluxes, as in fluxes.two_stream
+       output: eps -- (...,nlev-1) layer emissivities 1 - exp(-diffusivity*dtau)
+               between -- (...,nlev,nlev) transmissivity between emitters, the
+                          ground first, as expected by exchange_matrix
+    """
+    tau_levels=np.asarray(tau_levels,dtype=np.float64)
+    eps= -np.expm1(-diffusivity*np.diff(tau_levels,axis=-1))
+    #
+    # emitter 0 is the ground and emitter k the layer between levels k-1 and k;
+    # the path from emitter a up to emitter b > a runs from level a to level b-1
+    #
+    bottom=tau_levels[...,:,None]
+    top=np.concatenate((tau_levels[...,:1],tau_levels[...,:-1]),axis=-1)[...,None,:]
+    path=np.triu(top - bottom,1)
+    path=path + np.swapaxes(path,-1,-2)
+    return eps,np.exp(-diffusivity*path)
+
+def solve_equilibrium(tau_levels,S0,diffusivity=1.666):
+    """
+       input: tau_levels -- (...,nlev) level optical depths, surface first
+              S0 -- solar flux absorbed by the black surface (W/m^2), shape (...)
+       output: dictionary with
+               Temp_layers -- (...,nlev-1) layer temperatures (K), nan for layers with
+                              zero optical depth
+               T_sfc -- (...) surface temperature (K)
+               up, down -- (...,nlev) equilibrium fluxes (W/m^2) from fluxes.two_stream,
+                           finite even where Temp_layers is nan
+    """
+    tau_levels=np.asarray(tau_levels,dtype=np.float64)
+    S0=np.asarray(S0,dtype=np.float64)
+    batch=np.broadcast(tau_levels[...,0],S0).shape
+    tau_levels=np.broadcast_to(tau_levels,batch + tau_levels.shape[-1:])
+    eps,between=layer_exchange(tau_levels,diffusivity)
+    A=exchange_matrix(eps,between,ground=True)
+    source=np.zeros(tau_levels.shape)
+    source[...,0]=S0
+    flux=np.linalg.solve(A,source[...,None])[...,0]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        Temp_layers=(flux[...,1:]/(sigma*eps))**0.25
+    T_sfc=(flux[...,0]/sigma)**0.25
+    #
+    # transparent layers emit nothing, whatever their (undefined) temperature
+    #
+    emitting=np.where(eps > 0.,Temp_layers,0.)
+    up,down=two_stream(tau_levels,emitting,emitting,T_sfc,diffusivity=diffusivity)
+    return dict(Temp_layers=Temp_layers,T_sfc=T_sfc,up=up,down=down)
+
+def radiative_equilibrium(tot_trans=0.2,S0=241.,num_layers=100):
+    """
+       the steady state of equil_run.run_equilibrium for the same arguments
+
+       input: tot_trans -- total atmospheric transmissivity, scalar or (ncols,) array
+              S0 -- absorbed solar flux at the surface (W/m^2), scalar or (ncols,) array
+              num_layers -- number of layers
+       output: dictionary from solve_equilibrium, leading axis ncols
+    """
+    tot_trans,S0=np.broadcast_arrays(np.atleast_1d(tot_trans),np.atleast_1d(S0))
+    return solve_equilibrium(find_tau(tot_trans,num_layers),S0)
+
+def test_grey_equilibrium():
+    """
+       the direct solve balances the energy budget, agrees with
+       two_layer_analytic for two layers and with the converged time marcher
+    """
+    from two_layer_analytic import grey_layers
+    from equil_run import run_equilibrium
+    tot_trans=np.array([0.05,0.2,0.5,0.9])
+    S0=np.array([241.,241.,260.,300.])
+    out=radiative_equilibrium(tot_trans,S0,num_layers=50)
+    assert out['Temp_layers'].shape == (4,50)
+    #
+    # in equilibrium the net upward flux is S0 at every level
+    #
+    np.testing.assert_allclose(out['up'] - out['down'],S0[:,None]*np.ones([1,51]),rtol=1.e-9)
+    two=radiative_equilibrium(tot_trans,S0,num_layers=2)
+    trans=tot_trans**(1./2.)
+    Tground,Temp=grey_layers(np.stack([1. - trans**1.666]*2,axis=-1),S0,albedo=0.)
+    np.testing.assert_allclose(two['T_sfc'],Tground,rtol=1.e-10)
+    np.testing.assert_allclose(two['Temp_layers'],Temp,rtol=1.e-10)
+    #
+    # a very thick layer in the middle of the column
+    #
+    thick=solve_equilibrium(np.array([0.,0.1,500.,500.1]),241.)
+    assert np.isfinite(thick['Temp_layers']).all()
+    np.testing.assert_allclose(thick['up'] - thick['down'],241.,rtol=1.e-9)
+    #
+    # transparent layers have no temperature but still pass the fluxes through
+    #
+    clear=solve_equilibrium(np.array([0.,0.,0.5,1.]),241.)
+    assert np.isnan(clear['Temp_layers'][0]) and np.isfinite(clear['Temp_layers'][1:]).all()
+    np.testing.assert_allclose(clear['up'] - clear['down'],241.,rtol=1.e-9)
+    vacuum=radiative_equilibrium(1.0,241.,num_layers=10)
+    np.testing.assert_allclose(vacuum['up'],241.,rtol=1.e-12)
+    np.testing.assert_allclose(vacuum['down'],0.)
+    np.testing.assert_allclose(vacuum['T_sfc'],(241./sigma)**0.25)
+    marched=run_equilibrium(tot_trans,S0,num_layers=20,max_dT=2.,dT_tol=1.e-9,
+                            stop_time=5000*24*3600.)
+    assert marched['converged'].all()
+    solved=radiative_equilibrium(tot_trans,S0,num_layers=20)
+    np.testing.assert_allclose(marched['Temp_layers'],solved['Temp_layers'],atol=0.05)
+    np.testing.assert_allclose(marched['T_sfc'],solved['T_sfc'],atol=0.05)
+    return None
+
+if __name__=="__main__":
+    import timeit
+    from equil_run import run_equilibrium
+    test_grey_equilibrium()
+    tot_trans=np.linspace(0.05,0.95,1000)
+    seconds=min(timeit.repeat(lambda: radiative_equilibrium(tot_trans,241.,num_layers=100),
+                              number=1,repeat=3))
+    print("direct solve: {} columns of 100 layers in {:.3f} s".format(len(tot_trans),seconds))
+    seconds=min(timeit.repeat(lambda: run_equilibrium(0.2,241.,num_layers=100),number=1,repeat=1))
+    print("run_equilibrium: one column, 600 days, in {:.3f} s".format(seconds))
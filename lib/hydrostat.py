@@ -2,67 +2,164 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
-def hydrostat(T_surf,p_surf,dT_dz,delta_z,num_levels):
+def hydrostat(T_surf,p_surf,dT_dz,delta_z,num_levels,analytic=False):
     """
        build a hydrostatic atmosphere by integrating the hydrostatic equation from the surface,
-       using num_layers=num_levels-1 of constant thickness delta_z
-       input:  T_surf -- surface temperature in K
-              p_surf -- surface pressure in Pa
-              dT_dz -- constant rate of temperature change with height in K/m
-              delta_z  -- layer thickness in m
+       using num_layers=num_levels-1 layers
+       input:  T_surf -- surface temperature in K, scalar or array of column values
+              p_surf -- surface pressure in Pa, scalar or array of column values
+              dT_dz -- rate of temperature change with height in K/m, either a constant
+                       or an array whose last axis is num_layers long (piecewise lapse rates).
+                       For one lapse rate per column pass shape (ncols,1)
+              delta_z  -- layer thickness in m, constant or last axis num_layers long
               num_levels -- number of levels in the atmosphere
+              analytic -- if False reproduce the original level-by-level march
+                          p[i+1]=p[i] - rho[i]*g*delta_z.  If True integrate
+                          dlnp/dz=-g/(Rd*T) exactly for temperature linear within each layer
        output:
               numpy arrays: Temp (K) , press (Pa), rho (kg/m^3), height (m)
+              all with shape broadcast(T_surf,p_surf,dT_dz,...) + (num_levels,)
     """
     Rd=287. #J/kg/K  -- gas constant for dry air
     g=9.8  #m/s^2
-    Temp=np.empty([num_levels])
-    press=np.empty_like(Temp)
-    rho=np.empty_like(Temp)
-    height=np.empty_like(Temp)
     num_layers=num_levels-1
+    T_surf=np.asarray(T_surf,dtype=np.float64)[...,None]
+    p_surf=np.asarray(p_surf,dtype=np.float64)[...,None]
     #
-    # layer 0 sits directly above the surface, so start
-    # with pressure, temp of air equal to ground temp, press
-    # and get density from equaiton of state
-    # 
-    press[0]=p_surf
-    Temp[0]=T_surf
-    rho[0]=p_surf/(Rd*T_surf)
-    height[0]=0
+    # layer thicknesses and temperature changes, shape (...,num_layers)
     #
-    #now march up the atmosphere a layer at a time
-    #using the hydrostatic equation from the Beer's law notes
+    del_z=np.asarray(delta_z,dtype=np.float64)*np.ones([num_layers])
+    del_T=np.asarray(dT_dz,dtype=np.float64)*del_z
+    del_z,del_T=np.broadcast_arrays(del_z,del_T,T_surf,p_surf)[:2]
+    zero=np.zeros(del_T.shape[:-1] + (1,))
     #
-    for i in range(num_layers):
-        delP= -rho[i]*g*delta_z
-        height[i+1] = height[i] + delta_z
-        Temp[i+1] = Temp[i] + dT_dz*delta_z
-        press[i+1]= press[i] + delP
-        rho[i+1]=press[i+1]/(Rd*Temp[i+1])
+    # level 0 sits at the surface, every other level is a running sum of layers
+    #
+    height=np.concatenate((zero,np.cumsum(del_z,axis=-1)),axis=-1)
+    Temp=T_surf + np.concatenate((zero,np.cumsum(del_T,axis=-1)),axis=-1)
+    if analytic:
+        #
+        # integral of dz/T across each layer, dz*ln(T_top/T_bot)/dT, or dz/T if isothermal
+        #
+        T_bot=Temp[...,:-1]
+        isothermal=np.fabs(del_T) < 1.e-10*T_bot
+        safe_T=np.where(isothermal,1.,del_T)
+        layer_int=np.where(isothermal,del_z/T_bot,del_z*np.log1p(del_T/T_bot)/safe_T)
+        log_p=np.concatenate((zero,np.cumsum(layer_int,axis=-1)),axis=-1)*(-g/Rd)
+        press=p_surf*np.exp(log_p)
+    else:
+        #
+        # the original march is p[i+1]=p[i]*(1 - g*delta_z/(Rd*T[i])), a running product
+        #
+        factor=1. - g*del_z/(Rd*Temp[...,:-1])
+        press=p_surf*np.concatenate((zero + 1.,np.cumprod(factor,axis=-1)),axis=-1)
+    rho=press/(Rd*Temp)
     return (Temp,press,rho,height)
 
-def find_tau(r_gas,k_lambda,rho,height):
+def find_tau(r_gas,k_lambda,rho,height,from_top=False):
     """
        input: r_gas -- gas mixing ratio in kg/kg
-              k_lambda -- mass absorption coefficient in kg/m^2
-              rho -- vector of air densities in kg/m^3
-              height -- corresponding level heights in m
-       output:  tau -- vetical optical depth from the surface, same shape as rho
+              k_lambda -- mass absorption coefficient in m^2/kg, scalar or
+                          vector of nchan channel values
+              rho -- air densities in kg/m^3, shape (nlev,) or (ncols,nlev)
+              height -- corresponding level heights in m, same shape as rho
+              from_top -- if False tau is measured up from the surface using the
+                          density at the bottom of each layer; if True it is measured
+                          down from the top of the atmosphere using the density at
+                          the top of each layer (as in transmit_top.py)
+       output:  tau -- vertical optical depth, shape rho.shape if k_lambda is a scalar,
+                       otherwise rho.shape[:-1] + (nchan,nlev)
     """
-    print r_gas,k_lambda
-    tau=np.empty_like(rho)
-    tau[0]=0
-    num_levels=len(rho)
-    num_layers=num_levels-1
+    rho=np.asarray(rho,dtype=np.float64)
+    height=np.asarray(height,dtype=np.float64)
+    k_lambda=np.asarray(k_lambda,dtype=np.float64)
     #
-    # see Wallace and Hobbs equation 4.32
+    # see Wallace and Hobbs equation 4.32 -- tau is linear in k_lambda, so
+    # sum the absorber mass path once and scale it by every k_lambda
     #
-    for index in range(num_layers):
-        delta_z=height[index+1] - height[index]
-        delta_tau=r_gas*rho[index]*k_lambda*delta_z
-        tau[index+1]=tau[index] + delta_tau
-    return tau     
+    delta_z=np.diff(height,axis=-1)
+    zero=np.zeros(rho.shape[:-1] + (1,))
+    if from_top:
+        layer_mass=r_gas*rho[...,1:]*delta_z
+        mass_path=np.cumsum(layer_mass[...,::-1],axis=-1)[...,::-1]
+        mass_path=np.concatenate((mass_path,zero),axis=-1)
+    else:
+        layer_mass=r_gas*rho[...,:-1]*delta_z
+        mass_path=np.concatenate((zero,np.cumsum(layer_mass,axis=-1)),axis=-1)
+    if k_lambda.ndim == 0:
+        return k_lambda*mass_path
+    return k_lambda[:,None]*mass_path[...,None,:]
+
+def test_hydrostat():
+    """
+       the cumulative version should match the original level-by-level march,
+       and the analytic version should converge to the same profile
+    """
+    Rd=287.
+    g=9.8
+    T_surf=300.
+    p_surf=100.e3
+    dT_dz=-7.e-3
+    delta_z=10.
+    num_levels=1500
+    Temp=np.empty([num_levels])
+    press=np.empty_like(Temp)
+    rho=np.empty_like(Temp)
+    press[0]=p_surf
+    Temp[0]=T_surf
+    rho[0]=p_surf/(Rd*T_surf)
+    for i in range(num_levels-1):
+        Temp[i+1]=Temp[i] + dT_dz*delta_z
+        press[i+1]=press[i] - rho[i]*g*delta_z
+        rho[i+1]=press[i+1]/(Rd*Temp[i+1])
+    new_Temp,new_press,new_rho,new_height=hydrostat(T_surf,p_surf,dT_dz,delta_z,num_levels)
+    np.testing.assert_allclose(new_Temp,Temp,rtol=1.e-12)
+    np.testing.assert_allclose(new_press,press,rtol=1.e-10)
+    np.testing.assert_allclose(new_rho,rho,rtol=1.e-10)
+    np.testing.assert_allclose(new_height,np.arange(num_levels)*delta_z)
+    #
+    # constant lapse rate closed form: p=p_surf*(T/T_surf)**(-g/(Rd*dT_dz))
+    #
+    Temp,press,rho,height=hydrostat(T_surf,p_surf,dT_dz,1000.,16,analytic=True)
+    np.testing.assert_allclose(press,p_surf*(Temp/T_surf)**(-g/(Rd*dT_dz)),rtol=1.e-12)
+    #
+    # batch of columns with per-column lapse rates, plus a piecewise profile
+    #
+    T_surfs=np.array([280.,290.,300.])
+    lapse=np.array([-9.e-3,-6.5e-3,-4.e-3])[:,None]
+    Temp,press,rho,height=hydrostat(T_surfs,p_surf,lapse,100.,50)
+    assert Temp.shape == (3,50)
+    for col in range(3):
+        one=hydrostat(T_surfs[col],p_surf,lapse[col,0],100.,50)
+        np.testing.assert_allclose(press[col],one[1],rtol=1.e-12)
+    piecewise=np.where(np.arange(49) < 30,-6.5e-3,0.)
+    Temp,press,rho,height=hydrostat(T_surfs,p_surf,piecewise,100.,50,analytic=True)
+    np.testing.assert_allclose(Temp[:,30:],Temp[:,30:31]*np.ones(20))
+    return None
+
+def test_find_tau():
+    """
+       batched find_tau should match the level-by-level sums in both directions
+    """
+    r_gas=0.01
+    k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.
+    T_surfs=np.array([290.,300.])
+    Temp,press,rho,height=hydrostat(T_surfs,100.e3,-7.e-3,100.,250)
+    tau=find_tau(r_gas,k_lambda,rho,height)
+    tau_top=find_tau(r_gas,k_lambda,rho,height,from_top=True)
+    assert tau.shape == (2,7,250)
+    for col in range(2):
+        for chan,the_k in enumerate(k_lambda):
+            up=np.zeros(250)
+            down=np.zeros(250)
+            for index in range(249):
+                up[index+1]=up[index] + r_gas*rho[col,index]*the_k*100.
+                top_index=249 - index
+                down[top_index-1]=down[top_index] + r_gas*rho[col,top_index]*the_k*100.
+            np.testing.assert_allclose(tau[col,chan],up,rtol=1.e-12)
+            np.testing.assert_allclose(tau_top[col,chan],down,rtol=1.e-12)
+    np.testing.assert_allclose(find_tau(r_gas,k_lambda[0],rho[0],height[0]),tau[0,0])
+    return None
 
 if __name__=="__main__":
     r_gas=0.01  #kg/kg
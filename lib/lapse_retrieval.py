@@ -0,0 +1,139 @@
+"""
+   retrieve lapse rate and surface temperature from multi-channel
+   top of atmosphere brightness temperatures with a lookup table
+
+   the table is a dense grid of top_radiance.forward_model runs over lapse
+   rate and surface temperature.  Observed brightness temperature vectors
+   for a whole image are matched to their nearest table entries with a
+   scipy KD-tree and the parameters are interpolated by inverse distance
+   weighting of those neighbours.
+
+   example:
+       table=LapseTable(np.arange(-10.e-3,-3.e-3,0.05e-3),np.arange(270.,320.,0.5),wavel,k_lambda)
+       table.save('lapse_table.npz')
+       lapse_rate,T_surf,misfit=table.retrieve(Tbright_image)  #Tbright_image shape (...,nchan)
+"""
+from __future__ import division,print_function
+import timeit
+import numpy as np
+from scipy.spatial import cKDTree
+from top_radiance import forward_model
+
+class LapseTable(object):
+    """
+       brightness temperatures on a (lapse rate x surface temperature) grid
+
+       input: lapse_rates -- (nlapse,) lapse rates (K/m)
+              T_surfs -- (ntemp,) surface temperatures (K)
+              wavel, k_lambda -- (nchan,) wavelengths (m) and absorption coefficients (m^2/kg)
+              r_gas, p_surf, delta_z, num_levels -- as for forward_model
+    """
+    def __init__(self,lapse_rates,T_surfs,wavel,k_lambda,r_gas=0.01,p_surf=100.e3,
+                 delta_z=25000/7,num_levels=7):
+        self.wavel=np.asarray(wavel,dtype=np.float64)
+        self.k_lambda=np.asarray(k_lambda,dtype=np.float64)
+        lapse_grid,temp_grid=np.meshgrid(lapse_rates,T_surfs,indexing='ij')
+        self.lapse_rate=lapse_grid.ravel()
+        self.T_surf=temp_grid.ravel()
+        top_rad,self.Tbright=forward_model(self.T_surf,p_surf,self.lapse_rate[:,None],
+                                           delta_z,num_levels,r_gas,self.k_lambda,self.wavel)
+        self._tree=None
+
+    @property
+    def tree(self):
+        """
+           KD-tree over the table brightness temperature vectors, built on first use
+        """
+        if self._tree is None:
+            self._tree=cKDTree(self.Tbright)
+        return self._tree
+
+    def retrieve(self,Tbright,neighbours=4):
+        """
+           input: Tbright -- observed brightness temperatures (K), shape (...,nchan)
+                  neighbours -- number of table entries to interpolate between
+           output: lapse_rate (K/m), T_surf (K), misfit (K, distance to the nearest
+                   table entry), all with shape Tbright.shape[:-1]
+        """
+        Tbright=np.asarray(Tbright,dtype=np.float64)
+        shape=Tbright.shape[:-1]
+        distance,index=self.tree.query(Tbright.reshape(-1,Tbright.shape[-1]),k=neighbours)
+        distance=distance.reshape(-1,neighbours)
+        index=index.reshape(-1,neighbours)
+        #
+        # inverse distance squared weights; the small offset makes an exact
+        # table match take all the weight without dividing by zero
+        #
+        weights=1./(distance**2. + 1.e-12)
+        weights=weights/weights.sum(axis=-1)[:,None]
+        lapse_rate=np.sum(weights*self.lapse_rate[index],axis=-1)
+        T_surf=np.sum(weights*self.T_surf[index],axis=-1)
+        return lapse_rate.reshape(shape),T_surf.reshape(shape),distance[:,0].reshape(shape)
+
+    def save(self,filename):
+        """
+           write the table to a numpy .npz file
+        """
+        with open(filename,'wb') as outfile:
+            np.savez(outfile,wavel=self.wavel,k_lambda=self.k_lambda,lapse_rate=self.lapse_rate,
+                     T_surf=self.T_surf,Tbright=self.Tbright)
+
+    @classmethod
+    def load(cls,filename):
+        """
+           read a table written by LapseTable.save without rerunning the forward model
+        """
+        table=cls.__new__(cls)
+        with np.load(filename) as infile:
+            for key in ['wavel','k_lambda','lapse_rate','T_surf','Tbright']:
+                setattr(table,key,infile[key])
+        table._tree=None
+        return table
+
+
+def benchmark_retrieval(table,npix=1000000,neighbours=4):
+    """
+       time table.retrieve on npix synthetic pixels drawn from the table range
+       output: pixels per second
+    """
+    #
+    # perturb table entries rather than rerun the forward model for every pixel,
+    # and build the tree before the timing starts
+    #
+    nearest=np.random.randint(0,len(table.Tbright),npix)
+    Tbright=table.Tbright[nearest] + np.random.normal(0.,0.1,(npix,table.Tbright.shape[1]))
+    table.tree.query(Tbright[:1])
+    seconds=min(timeit.repeat(lambda: table.retrieve(Tbright,neighbours),number=1,repeat=3))
+    return npix/seconds
+
+
+def test_lapse_retrieval():
+    """
+       retrieve lapse rates and surface temperatures that fall between table entries
+    """
+    wavel=((1/np.linspace(666,766,7))*1.e-2)[::-1]
+    k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.
+    table=LapseTable(np.arange(-10.e-3,-3.e-3,0.1e-3),np.arange(280.,310.,0.5),wavel,k_lambda)
+    true_lapse=np.array([[-8.23e-3,-6.51e-3],[-4.77e-3,-9.05e-3]])
+    true_temp=np.array([[288.3,301.7],[295.1,283.9]])
+    top_rad,Tbright=forward_model(true_temp.ravel(),100.e3,true_lapse.reshape(-1,1),
+                                  25000/7,7,0.01,k_lambda,wavel)
+    lapse_rate,T_surf,misfit=table.retrieve(Tbright.reshape(2,2,7))
+    assert lapse_rate.shape == (2,2)
+    np.testing.assert_allclose(lapse_rate,true_lapse,atol=0.1e-3)
+    np.testing.assert_allclose(T_surf,true_temp,atol=0.5)
+    #
+    # exact table entries come back exactly
+    #
+    lapse_rate,T_surf,misfit=table.retrieve(table.Tbright[10:20])
+    np.testing.assert_allclose(lapse_rate,table.lapse_rate[10:20],rtol=1.e-8)
+    np.testing.assert_allclose(misfit,0.,atol=1.e-8)
+    return None
+
+if __name__=="__main__":
+    test_lapse_retrieval()
+    wavel=((1/np.linspace(666,766,7))*1.e-2)[::-1]
+    k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.
+    table=LapseTable(np.arange(-10.e-3,-3.e-3,0.05e-3),np.arange(270.,320.,0.25),wavel,k_lambda)
+    print("table entries: {}, pixels per second: {:.3g}".format(len(table.Tbright),
+                                                              benchmark_retrieval(table)))
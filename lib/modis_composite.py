@@ -0,0 +1,198 @@
+"""
+   composite brightness temperature maps from many MODIS granules
+
+   each granule is handled by one worker: parseMeta's corner coordinates
+   are checked against the grid's bounding box, then the granule is read a
+   chunk of rows at a time with modis_reader.Granule.  Chunks whose
+   geolocation misses the box are skipped before any band data is read;
+   the rest are calibrated, inverted to brightness temperature and binned
+   into a swath_grid.SwathGrid.  Workers only ever hold one chunk of rows
+   plus their grid, and the parent merges the grids as they come back.
+
+   example:
+       lat_edges=np.linspace(20,40,201)
+       lon_edges=np.linspace(130,160,301)
+       grid,used,skipped,failed=composite(find_granules('modis_day'),['31','32'],
+                                          lat_edges,lon_edges,processes=4)
+       Tbright31,Tbright32=grid.mean
+"""
+from __future__ import division,print_function
+import os
+import glob
+import multiprocessing
+import traceback
+import numpy as np
+from modismeta import parseMeta
+from modis_reader import Granule
+from swath_grid import SwathGrid
+from planck import planckInvert
+
+#
+# central wavelengths (microns) of the MODIS emissive bands
+#
+band_wavel={'20':3.785,'21':3.992,'22':3.971,'23':4.056,'24':4.473,'25':4.545,
+            '27':6.766,'28':7.338,'29':8.523,'30':9.730,'31':11.017,'32':12.032,
+            '33':13.365,'34':13.681,'35':13.942,'36':14.195}
+
+def find_granules(directory,pattern='*.nc'):
+    """
+       sorted list of the granule files in directory matching pattern
+    """
+    return sorted(glob.glob(os.path.join(directory,pattern)))
+
+def corners_overlap(meta,bbox):
+    """
+       input: meta -- dictionary from parseMeta
+              bbox -- (lat_min,lat_max,lon_min,lon_max) in degrees
+       output: True if the box around the granule corners overlaps bbox
+
+       a granule whose corners span more than 180 degrees of longitude
+       crosses the dateline, so it is always kept
+    """
+    lat_min,lat_max,lon_min,lon_max=bbox
+    lats=meta['cornerlats']
+    lons=meta['cornerlons']
+    if lats.max() < lat_min or lats.min() > lat_max:
+        return False
+    if lons.max() - lons.min() > 180.:
+        return True
+    return not (lons.max() < lon_min or lons.min() > lon_max)
+
+def grid_granule(task):
+    """
+       grid the brightness temperatures from one granule
+
+       input: task -- (filename,bands,lat_edges,lon_edges,stats,chunk_rows) tuple,
+                      so it can be sent through Pool.imap
+       output: (filename,grid,error) -- grid is None if the granule misses the
+               box or fails, error holds the traceback if it failed, or a message
+               if the granule has no full resolution geolocation
+    """
+    filename,bands,lat_edges,lon_edges,stats,chunk_rows=task
+    try:
+        granule=Granule(filename)
+        try:
+            bbox=(lat_edges[0],lat_edges[-1],lon_edges[0],lon_edges[-1])
+            if not corners_overlap(parseMeta(granule.nc_file),bbox):
+                return filename,None,None
+            if granule.read_geo(0,1)[0] is None:
+                return filename,None,'no full resolution latitude/longitude in {}'.format(filename)
+            grid=SwathGrid(lat_edges,lon_edges,nfields=len(bands),stats=stats)
+            wavel=np.array([band_wavel[band] for band in bands])*1.e-6
+            nrows,ncols=granule.shape
+            buffer=np.empty([len(bands),chunk_rows,ncols],dtype=np.float32)
+            for start in range(0,nrows,chunk_rows):
+                stop=min(start + chunk_rows,nrows)
+                lat,lon=granule.read_geo(start,stop)
+                index,inside=grid.cell_index(lat,lon)
+                if not inside.any():
+                    continue
+                radiance=buffer[:,:stop-start,:]
+                for band_num,band in enumerate(bands):
+                    granule.read_rows(band,start,stop,out=radiance[band_num])
+                #
+                # W/m^2/micron/sr to W/m^2/m/sr for planckInvert
+                #
+                radiance*=1.e6
+                with np.errstate(invalid='ignore'):
+                    Tbright=planckInvert(wavel[:,None,None],radiance)
+                grid.add(lat,lon,Tbright)
+        finally:
+            granule.close()
+    except Exception:
+        return filename,None,traceback.format_exc()
+    return filename,grid,None
+
+def composite(filenames,bands,lat_edges,lon_edges,stats=(),processes=None,chunk_rows=200):
+    """
+       input: filenames -- granule files, e.g. from find_granules
+              bands -- emissive band names, e.g. ['31','32']
+              lat_edges, lon_edges -- grid cell edges (degrees)
+              stats -- extra statistics for SwathGrid ('min','max','std')
+              processes -- size of the process pool, None for one per cpu,
+                           1 to run in this process
+              chunk_rows -- rows read at a time by each worker
+       output: grid -- SwathGrid with one field per band (K)
+               used -- granules that contributed to the grid
+               skipped -- granules outside the grid
+               failed -- dictionary of filename: traceback for granules that raised
+    """
+    grid=SwathGrid(lat_edges,lon_edges,nfields=len(bands),stats=stats)
+    tasks=[(filename,list(bands),grid.lat_edges,grid.lon_edges,tuple(stats),chunk_rows)
+           for filename in filenames]
+    pool=None
+    if processes == 1:
+        results_iter=(grid_granule(task) for task in tasks)
+    else:
+        pool=multiprocessing.Pool(processes)
+        results_iter=pool.imap_unordered(grid_granule,tasks)
+    used=[]
+    skipped=[]
+    failed={}
+    try:
+        for filename,the_grid,error in results_iter:
+            if error is not None:
+                failed[filename]=error
+            elif the_grid is None:
+                skipped.append(filename)
+            else:
+                grid.merge(the_grid)
+                used.append(filename)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return grid,sorted(used),sorted(skipped),failed
+
+def test_composite():
+    """
+       composite two overlapping granules and check against gridding
+       each one's full brightness temperature image directly
+    """
+    import tempfile
+    import shutil
+    from modis_reader import write_test_granule
+    tmpdir=tempfile.mkdtemp()
+    try:
+        names=[os.path.join(tmpdir,name) for name in ['a.nc','b.nc','c.nc','e.nc']]
+        write_test_granule(names[0],lat0=22.,lon0=146.,seed=1)
+        write_test_granule(names[1],lat0=22.2,lon0=146.1,seed=2)
+        write_test_granule(names[2],lat0=-40.,lon0=10.,seed=3)
+        #
+        # inside the box, but with only 5 km geolocation
+        #
+        write_test_granule(names[3],lat0=22.,lon0=146.,seed=4,geo_step=5)
+        with open(os.path.join(tmpdir,'d.nc'),'w') as outfile:
+            outfile.write('not a netcdf file')
+        lat_edges=np.linspace(22.1,22.5,9)
+        lon_edges=np.linspace(146.,146.4,9)
+        bands=['31','32']
+        expected=SwathGrid(lat_edges,lon_edges,nfields=2)
+        wavel=np.array([11.017e-6,12.032e-6])
+        for name in names[:2]:
+            granule=Granule(name)
+            tile=next(granule.tiles(bands,chunk_rows=40,geo=True))
+            with np.errstate(invalid='ignore'):
+                Tbright=planckInvert(wavel[:,None,None],tile['data']*1.e6)
+            expected.add(tile['lat'],tile['lon'],Tbright)
+            granule.close()
+        for processes in [1,2]:
+            grid,used,skipped,failed=composite(find_granules(tmpdir),bands,lat_edges,lon_edges,
+                                               processes=processes,chunk_rows=7)
+            assert used == names[:2] and skipped == names[2:3]
+            assert sorted(failed.keys()) == [os.path.join(tmpdir,'d.nc'),names[3]]
+            assert 'latitude' in failed[names[3]]
+            np.testing.assert_array_equal(grid.count,expected.count)
+            np.testing.assert_allclose(grid.mean,expected.mean,rtol=1.e-5)
+        assert np.nanmin(grid.mean) > 150. and np.nanmax(grid.mean) < 350.
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
+if __name__=="__main__":
+    import sys
+    directory=sys.argv[1] if len(sys.argv) > 1 else '.'
+    lat_edges=np.linspace(-90,90,181)
+    lon_edges=np.linspace(-180,180,361)
+    grid,used,skipped,failed=composite(find_granules(directory),['31'],lat_edges,lon_edges)
+    print("gridded {} granules, skipped {}, {} failed".format(len(used),len(skipped),len(failed)))
@@ -0,0 +1,198 @@
+"""
+   persistent index of modismeta.parseMeta results for a granule archive
+
+   the orbit, start/stop times, day/night flag and corner coordinates of
+   each granule are kept in an sqlite database keyed by filename and
+   modification time.  MetaIndex.update only opens files that are new or
+   have changed since they were indexed, and MetaIndex.query answers
+   region/time searches from the database without touching the granules.
+
+   example:
+       index=MetaIndex('modis_index.sqlite')
+       index.update(glob.glob('archive/*.nc'))
+       rows=index.query(bbox=(20.,40.,130.,160.),start='2005-07-07T00:00:00',
+                        stop='2005-07-08T00:00:00',daynight='Day')
+       filenames=[row['filename'] for row in rows]
+"""
+from __future__ import division,print_function
+import os
+import json
+import sqlite3
+import numpy as np
+from modismeta import parseMeta
+
+columns=('filename','mtime','orbit','granule_id','start','stop','daynight',
+         'lat_min','lat_max','lon_min','lon_max','dateline','cornerlats','cornerlons')
+
+schema="""create table if not exists granules (
+              filename text primary key, mtime real, orbit integer, granule_id text,
+              start text, stop text, daynight text,
+              lat_min real, lat_max real, lon_min real, lon_max real, dateline integer,
+              cornerlats text, cornerlons text)"""
+
+def iso_time(date,time):
+    """
+       '2005-07-07 UCT','04:05:00 UCT' from parseMeta to '2005-07-07T04:05:00',
+       which sorts and compares correctly as a string
+    """
+    return date.split()[0] + 'T' + time.split()[0]
+
+def meta_row(filename,mtime,meta):
+    """
+       database row for one granule from its parseMeta dictionary
+    """
+    lats=np.asarray(meta['cornerlats'],dtype=np.float64)
+    lons=np.asarray(meta['cornerlons'],dtype=np.float64)
+    return (filename,mtime,int(meta['orbit']),meta['filename'],
+            iso_time(meta['startdate'],meta['starttime']),
+            iso_time(meta['stopdate'],meta['stoptime']),meta['daynight'],
+            lats.min(),lats.max(),lons.min(),lons.max(),int(lons.max() - lons.min() > 180.),
+            json.dumps(lats.tolist()),json.dumps(lons.tolist()))
+
+class MetaIndex(object):
+    """
+       input: dbfile -- sqlite database file, created if it doesn't exist
+                        (':memory:' for an index that isn't saved)
+    """
+    def __init__(self,dbfile):
+        self.dbfile=dbfile
+        self.connection=sqlite3.connect(dbfile)
+        self.connection.execute(schema)
+        self.connection.execute('create index if not exists granule_time on granules (start,stop)')
+        self.connection.commit()
+
+    def update(self,filenames):
+        """
+           parse the granules in filenames that aren't indexed yet, or whose
+           modification time has changed
+
+           output: list of filenames that were (re)parsed, dictionary of
+                   filename: error message for files parseMeta couldn't read
+        """
+        known=dict(self.connection.execute('select filename,mtime from granules'))
+        parsed=[]
+        failed={}
+        for filename in filenames:
+            filename=os.path.abspath(filename)
+            mtime=os.path.getmtime(filename)
+            if known.get(filename) == mtime:
+                continue
+            try:
+                meta=parseMeta(filename)
+            except Exception as error:
+                failed[filename]=str(error)
+                continue
+            self.insert(filename,mtime,meta)
+            parsed.append(filename)
+        self.connection.commit()
+        return parsed,failed
+
+    def insert(self,filename,mtime,meta):
+        """
+           add or replace one granule from its parseMeta dictionary
+        """
+        self.connection.execute('insert or replace into granules values ({})'.format(
+            ','.join('?'*len(columns))),meta_row(filename,mtime,meta))
+
+    def prune(self):
+        """
+           drop granules whose files no longer exist, output: their filenames
+        """
+        missing=[filename for (filename,) in self.connection.execute('select filename from granules')
+                 if not os.path.exists(filename)]
+        self.connection.executemany('delete from granules where filename=?',
+                                    [(filename,) for filename in missing])
+        self.connection.commit()
+        return missing
+
+    def query(self,bbox=None,start=None,stop=None,daynight=None):
+        """
+           input: bbox -- (lat_min,lat_max,lon_min,lon_max) degrees, granules whose
+                          corner box overlaps it (granules crossing the dateline
+                          are always returned)
+                  start, stop -- ISO time strings 'YYYY-MM-DDTHH:MM:SS', granules that
+                                 overlap the interval
+                  daynight -- 'Day', 'Night' or 'Mixed'
+           output: list of dictionaries, one per granule, sorted by start time,
+                   with cornerlats and cornerlons as numpy arrays
+        """
+        where=[]
+        args=[]
+        if bbox is not None:
+            lat_min,lat_max,lon_min,lon_max=bbox
+            where.append('lat_max >= ? and lat_min <= ? and (dateline = 1 or (lon_max >= ? and lon_min <= ?))')
+            args.extend([lat_min,lat_max,lon_min,lon_max])
+        if start is not None:
+            where.append('stop >= ?')
+            args.append(start)
+        if stop is not None:
+            where.append('start <= ?')
+            args.append(stop)
+        if daynight is not None:
+            where.append('daynight = ?')
+            args.append(daynight)
+        command='select * from granules'
+        if where:
+            command=command + ' where ' + ' and '.join(where)
+        rows=[]
+        for values in self.connection.execute(command + ' order by start,filename',args):
+            row=dict(zip(columns,values))
+            row['cornerlats']=np.array(json.loads(row['cornerlats']))
+            row['cornerlons']=np.array(json.loads(row['cornerlons']))
+            rows.append(row)
+        return rows
+
+    def __len__(self):
+        return self.connection.execute('select count(*) from granules').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def test_meta_index():
+    """
+       index three granules, query them, and check that only changed files are reparsed
+    """
+    import tempfile
+    import shutil
+    from modis_reader import write_test_granule
+    tmpdir=tempfile.mkdtemp()
+    try:
+        names=[os.path.join(tmpdir,name) for name in ['a.nc','b.nc','c.nc']]
+        write_test_granule(names[0],lat0=22.,lon0=146.)
+        write_test_granule(names[1],lat0=-40.,lon0=10.)
+        write_test_granule(names[2],lat0=60.,lon0=179.9)
+        dbfile=os.path.join(tmpdir,'index.sqlite')
+        index=MetaIndex(dbfile)
+        parsed,failed=index.update(names)
+        assert parsed == names and failed == {} and len(index) == 3
+        rows=index.query(bbox=(20.,25.,140.,150.))
+        assert [row['filename'] for row in rows] == names[:1]
+        np.testing.assert_allclose(rows[0]['cornerlats'],[22.,22.4,22.46,22.06])
+        assert rows[0]['orbit'] == 8923 and rows[0]['start'] == '2005-07-07T04:05:00'
+        assert len(index.query(start='2005-07-07T04:09:00',stop='2005-07-07T05:00:00')) == 3
+        assert len(index.query(start='2005-07-07T04:11:00')) == 0
+        assert len(index.query(daynight='Night')) == 0
+        index.close()
+        #
+        # a reopened index only reparses the file whose mtime changed
+        #
+        index=MetaIndex(dbfile)
+        assert index.update(names)[0] == []
+        mtime=os.path.getmtime(names[1])
+        os.utime(names[1],(mtime + 10.,mtime + 10.))
+        assert index.update(names)[0] == [names[1]]
+        os.remove(names[2])
+        assert index.prune() == [names[2]] and len(index) == 2
+        index.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
+if __name__=="__main__":
+    import sys
+    import glob
+    index=MetaIndex(sys.argv[1] if len(sys.argv) > 1 else 'modis_index.sqlite')
+    parsed,failed=index.update(glob.glob('*.nc'))
+    print("indexed {} new or changed granules, {} failed, {} total".format(len(parsed),
+                                                                          len(failed),len(index)))
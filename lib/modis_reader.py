@@ -0,0 +1,274 @@
+"""
+   lazy, chunked reader for MODIS level 1b granules (netcdf versions of the
+   MOD021KM/MYD021KM hdf files used in the satellite notebooks)
+
+   replaces slicing EV_1KM_Emissive by hand: band names are found through
+   the band_names attribute of every EV_* variable, rows are read a chunk at
+   a time as raw counts, and radiance_scales/radiance_offsets (or the
+   reflectance ones) are applied in place on float32 buffers, so a full
+   2030 x 1354 granule never has to be in memory at once.
+
+   example:
+       granule=Granule('MYD021KM.A2005188.0405.005.2009232180906.nc')
+       for tile in granule.tiles(['31','32'],chunk_rows=200):
+           print(tile['row_start'],tile['data'].shape)   #(2,nrows,1354) W/m^2/micron/sr
+"""
+from __future__ import division,print_function
+import numpy as np
+from netCDF4 import Dataset
+
+class Granule(object):
+    """
+       input: filename -- path to a netcdf granule, or an open netCDF4.Dataset
+    """
+    #
+    # the MODIS level 1b science variables that carry a band_names attribute
+    #
+    band_vars=('EV_1KM_Emissive','EV_1KM_RefSB','EV_250_Aggr1km_RefSB','EV_500_Aggr1km_RefSB')
+
+    def __init__(self,filename):
+        if isinstance(filename,Dataset):
+            self.nc_file=filename
+        else:
+            self.nc_file=Dataset(filename,'r')
+        self._bands=None
+
+    @property
+    def bands(self):
+        """
+           dictionary mapping band name (e.g. '31') to (variable name, band index),
+           built from the band_names attributes the first time it is needed
+        """
+        if self._bands is None:
+            self._bands={}
+            for varname in self.band_vars:
+                if varname not in self.nc_file.variables:
+                    continue
+                names=self.nc_file.variables[varname].band_names.split(',')
+                for index,name in enumerate(names):
+                    self._bands[name.strip()]=(varname,index)
+        return self._bands
+
+    @property
+    def shape(self):
+        """
+           (rows,cols) of the 1 km swath
+        """
+        varname=[name for name in self.band_vars if name in self.nc_file.variables][0]
+        return self.nc_file.variables[varname].shape[1:]
+
+    def calibration(self,band,kind='radiance'):
+        """
+           input: band -- band name, kind -- 'radiance' or 'reflectance'
+           output: scale, offset, largest valid count for that band
+        """
+        varname,index=self.bands[band]
+        the_var=self.nc_file.variables[varname]
+        scale=float(np.atleast_1d(the_var.getncattr(kind + '_scales'))[index])
+        offset=float(np.atleast_1d(the_var.getncattr(kind + '_offsets'))[index])
+        if 'valid_range' in the_var.ncattrs():
+            max_valid=the_var.valid_range[1]
+        else:
+            max_valid=32767
+        return scale,offset,max_valid
+
+    def read_rows(self,band,row_start,row_stop,out=None,kind='radiance'):
+        """
+           read and calibrate rows row_start:row_stop of one band
+
+           input: band -- band name, e.g. '31'
+                  out -- optional float32 buffer of shape (row_stop-row_start,cols) to fill
+                  kind -- 'radiance' (W/m^2/micron/sr) or 'reflectance'
+           output: float32 array, nan where the raw count is a fill or saturated value
+        """
+        varname,index=self.bands[band]
+        the_var=self.nc_file.variables[varname]
+        #
+        # we want the raw counts, not netCDF4's masked array; put the variable
+        # back the way it was, since the Dataset may belong to the caller
+        #
+        mask,scale=the_var.mask,the_var.scale
+        the_var.set_auto_maskandscale(False)
+        try:
+            raw=the_var[index,row_start:row_stop,:]
+        finally:
+            the_var.set_auto_mask(mask)
+            the_var.set_auto_scale(scale)
+        if out is None:
+            out=np.empty(raw.shape,dtype=np.float32)
+        scale,offset,max_valid=self.calibration(band,kind)
+        out[...]=raw
+        out-=offset
+        out*=scale
+        out[raw > max_valid]=np.nan
+        return out
+
+    def read_geo(self,row_start,row_stop):
+        """
+           latitude and longitude for rows row_start:row_stop, or (None,None)
+           if the file has no full resolution geolocation
+        """
+        variables=self.nc_file.variables
+        if 'latitude' not in variables or variables['latitude'].shape != self.shape:
+            return None,None
+        return variables['latitude'][row_start:row_stop,:],variables['longitude'][row_start:row_stop,:]
+
+    def tiles(self,bands,chunk_rows=200,row_start=0,row_stop=None,kind='radiance',
+              geo=False,reuse_buffer=False):
+        """
+           iterate over calibrated chunks of rows
+
+           input: bands -- list of band names
+                  chunk_rows -- rows per tile
+                  row_start, row_stop -- only read this range of rows
+                  kind -- 'radiance' or 'reflectance'
+                  geo -- also read latitude and longitude for each tile
+                  reuse_buffer -- fill the same float32 buffer for every tile, so
+                                  copy tile['data'] if you need to keep it
+           yields: dictionary with row_start, row_stop, data (nbands,nrows,cols)
+                   and, if geo is True, lat and lon (nrows,cols)
+        """
+        nrows,ncols=self.shape
+        if row_stop is None:
+            row_stop=nrows
+        buffer=None
+        for start in range(row_start,row_stop,chunk_rows):
+            stop=min(start + chunk_rows,row_stop)
+            if buffer is None or not reuse_buffer:
+                buffer=np.empty([len(bands),chunk_rows,ncols],dtype=np.float32)
+            data=buffer[:,:stop-start,:]
+            for band_num,band in enumerate(bands):
+                self.read_rows(band,start,stop,out=data[band_num],kind=kind)
+            tile=dict(row_start=start,row_stop=stop,data=data)
+            if geo:
+                tile['lat'],tile['lon']=self.read_geo(start,stop)
+            yield tile
+
+    def close(self):
+        self.nc_file.close()
+
+
+def write_test_granule(filename,nrows=40,ncols=30,lat0=22.,lon0=146.,seed=0,geo_step=1):
+    """
+       write a small netcdf file laid out like a MODIS 1 km level 1b granule,
+       with the emissive bands, geolocation and ODL metadata, for the tests;
+       geo_step=5 writes every fifth row and column of the geolocation, as in
+       a granule with only the 5 km latitude/longitude
+    """
+    np.random.seed(seed)
+    emissive=[str(band) for band in [20,21,22,23,24,25,27,28,29,30,31,32,33,34,35,36]]
+    with Dataset(filename,'w') as nc_out:
+        nc_out.createDimension('Band_1KM_Emissive',len(emissive))
+        nc_out.createDimension('rows',nrows)
+        nc_out.createDimension('cols',ncols)
+        the_var=nc_out.createVariable('EV_1KM_Emissive','u2',('Band_1KM_Emissive','rows','cols'),
+                                      zlib=True,chunksizes=(1,min(nrows,20),ncols))
+        the_var.set_auto_maskandscale(False)
+        counts=np.random.randint(1000,20000,size=(len(emissive),nrows,ncols)).astype(np.uint16)
+        counts[:,0,0]=65535
+        the_var[...]=counts
+        the_var.band_names=','.join(emissive)
+        the_var.radiance_scales=np.linspace(1.e-4,8.e-4,len(emissive)).astype(np.float32)
+        the_var.radiance_offsets=np.linspace(1000.,2000.,len(emissive)).astype(np.float32)
+        the_var.valid_range=np.array([0,32767],dtype=np.uint16)
+        the_var.units='Watts/m^2/micrometer/steradian'
+        geo_dims=('rows','cols')
+        if geo_step > 1:
+            geo_dims=('geo_rows','geo_cols')
+            nc_out.createDimension('geo_rows',len(range(0,nrows,geo_step)))
+            nc_out.createDimension('geo_cols',len(range(0,ncols,geo_step)))
+        geo_rows=np.arange(0,nrows,geo_step)[:,None]
+        geo_cols=np.arange(0,ncols,geo_step)
+        lat=nc_out.createVariable('latitude','f4',geo_dims)
+        lon=nc_out.createVariable('longitude','f4',geo_dims)
+        lat[...]=lat0 + 0.01*geo_rows + 0.002*geo_cols
+        lon[...]=lon0 + 0.01*geo_cols + 0.001*geo_rows
+        corner_lats=[lat0,lat0 + 0.01*nrows,lat0 + 0.01*nrows + 0.002*ncols,lat0 + 0.002*ncols]
+        corner_lons=[lon0,lon0 + 0.001*nrows,lon0 + 0.01*ncols + 0.001*nrows,lon0 + 0.01*ncols]
+        nc_out.CoreMetadata_0=_test_odl(filename,corner_lats,corner_lons)
+        nc_out.ArchiveMetadata_0='GROUP = ARCHIVEDMETADATA\nEND_GROUP = ARCHIVEDMETADATA\nEND\n'
+    return counts
+
+
+def _test_odl(filename,corner_lats,corner_lons):
+    """
+       CoreMetadata_0 text in the hdfeos ODL layout parsed by modismeta
+    """
+    def odl_object(name,value,indent='    '):
+        return ('{0}OBJECT                 = {1}\n{0}  NUM_VAL              = 1\n'
+                '{0}  VALUE                = {2}\n{0}END_OBJECT             = {1}\n\n').format(indent,name,value)
+    def coords(values):
+        return '(' + ', '.join('{:.4f}'.format(value) for value in values) + ')'
+    text='GROUP                  = INVENTORYMETADATA\n  GROUPTYPE            = MASTERGROUP\n\n'
+    text+='  GROUP                  = ECSDATAGRANULE\n\n'
+    text+=odl_object('LOCALGRANULEID','"{}"'.format(filename.split('/')[-1]))
+    text+=odl_object('PRODUCTIONDATETIME','"2009-08-20T18:09:06.000Z"')
+    text+=odl_object('DAYNIGHTFLAG','"Day"')
+    text+='  END_GROUP              = ECSDATAGRANULE\n\n'
+    text+='  GROUP                  = ORBITCALCULATEDSPATIALDOMAIN\n\n'
+    text+=odl_object('ORBITNUMBER','8923','      ')
+    text+=odl_object('EQUATORCROSSINGTIME','"04:12:57.360000"','      ')
+    text+=odl_object('EQUATORCROSSINGDATE','"2005-07-07"','      ')
+    text+='  END_GROUP              = ORBITCALCULATEDSPATIALDOMAIN\n\n'
+    text+='  GROUP                  = RANGEDATETIME\n\n'
+    text+=odl_object('RANGEENDINGDATE','"2005-07-07"')
+    text+=odl_object('RANGEENDINGTIME','"04:10:00.000000"')
+    text+=odl_object('RANGEBEGINNINGDATE','"2005-07-07"')
+    text+=odl_object('RANGEBEGINNINGTIME','"04:05:00.000000"')
+    text+='  END_GROUP              = RANGEDATETIME\n\n'
+    text+='  GROUP                  = GRINGPOINT\n\n'
+    text+=odl_object('GRINGPOINTLONGITUDE',coords(corner_lons),'      ')
+    text+=odl_object('GRINGPOINTLATITUDE',coords(corner_lats),'      ')
+    text+=odl_object('GRINGPOINTSEQUENCENO','(1, 2, 3, 4)','      ')
+    text+='  END_GROUP              = GRINGPOINT\n\n'
+    text+='END_GROUP              = INVENTORYMETADATA\n\nEND\n'
+    return text
+
+
+def test_granule_reader():
+    """
+       chunked, calibrated reads should match calibrating the whole band at once
+    """
+    import tempfile
+    import shutil
+    import os
+    tmpdir=tempfile.mkdtemp()
+    try:
+        filename=os.path.join(tmpdir,'MYD021KM.A2005188.0405.005.2009232180906.nc')
+        counts=write_test_granule(filename)
+        granule=Granule(filename)
+        assert granule.shape == (40,30)
+        varname,index31=granule.bands['31']
+        assert varname == 'EV_1KM_Emissive' and index31 == 10
+        scale,offset,max_valid=granule.calibration('31')
+        expected=(scale*(counts[index31].astype(np.float32) - np.float32(offset)))
+        expected[0,0]=np.nan
+        tiles=list(granule.tiles(['31','32'],chunk_rows=15,geo=True))
+        assert [tile['row_start'] for tile in tiles] == [0,15,30]
+        data=np.concatenate([tile['data'] for tile in tiles],axis=1)
+        assert data.dtype == np.float32 and data.shape == (2,40,30)
+        np.testing.assert_allclose(data[0],expected,rtol=1.e-5)
+        lat=np.concatenate([tile['lat'] for tile in tiles])
+        np.testing.assert_allclose(lat,granule.nc_file.variables['latitude'][...])
+        #
+        # a reused buffer gives the same numbers one tile at a time
+        #
+        for tile in granule.tiles(['31'],chunk_rows=15,row_start=5,reuse_buffer=True):
+            np.testing.assert_allclose(tile['data'][0],expected[tile['row_start']:tile['row_stop']],
+                                       rtol=1.e-5)
+        granule.close()
+        #
+        # reading through a caller's Dataset leaves its masking and scaling alone
+        #
+        with Dataset(filename) as nc_file:
+            granule=Granule(nc_file)
+            granule.read_rows('31',0,5)
+            the_var=nc_file.variables['EV_1KM_Emissive']
+            assert the_var.mask and the_var.scale
+            assert np.ma.is_masked(the_var[index31,0,0])
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
+if __name__=="__main__":
+    test_granule_reader()
@@ -2,102 +2,115 @@
    class that reads the NASA hdfeos CoreMetadata.0 attribute
    and retrieves the orbitnumber, equator crossing time, 
    image lat/lon corners, etc.
-"""
 
-import types
+   the metadata block is tokenized once by parseODL, rather than
+   split and searched with a regular expression for every key
+"""
+from __future__ import print_function
+import re
 import numpy as np
 import netCDF4
 
+#search for a string that looks like 11:22:33
+timeObject=re.compile(r'.*(?P<time>\d{2}\:\d{2}\:\d{2}).*',re.DOTALL)
+#search for a string that looks like 2006-10-02
+dateObject=re.compile(r'.*(?P<date>\d{4}-\d{2}-\d{2}).*',re.DOTALL)
+
+def parseODL(text):
+    """
+       tokenize an hdfeos ODL metadata block in one pass
+
+       input: text -- e.g. the CoreMetadata_0 attribute
+       output: dictionary mapping each OBJECT name to the text of its VALUE,
+               with any value that runs over several lines (a long coordinate
+               list in parentheses) joined back into one string
+    """
+    values={}
+    objects=[]
+    lines=iter(text.splitlines())
+    for line in lines:
+        key,sep,value=line.partition('=')
+        if not sep:
+            continue
+        key=key.strip()
+        value=value.strip()
+        if key == 'OBJECT':
+            objects.append(value)
+        elif key == 'END_OBJECT':
+            if objects:
+                objects.pop()
+        elif key == 'VALUE' and objects:
+            while value.count('(') > value.count(')'):
+                try:
+                    value=value + next(lines).strip()
+                except StopIteration:
+                    break
+            if objects[-1] not in values:
+                values[objects[-1]]=value
+    return values
+
 class metaParse:
     def __init__(self,metaDat,altrDat):
-        import re
-        self.metaDat=metaDat
-        self.altrDat=altrDat
-        #search for the string following the words "VALUE= "
-        self.stringObject=\
-             re.compile('.*VALUE\s+=\s"(?P<value>.*)"',re.DOTALL)
-        #search for a string that looks like 11:22:33
-        self.timeObject=\
-             re.compile('.*(?P<time>\d{2}\:\d{2}\:\d{2}).*',re.DOTALL)
-        #search for a string that looks like 2006-10-02
-        self.dateObject=\
-             re.compile('.*(?P<date>\d{4}-\d{2}-\d{2}).*',\
-                        re.DOTALL)
-        #search for a string that looks like "(anything between parens)"
-        self.coordObject=re.compile('.*\((?P<coord>.*)\)',re.DOTALL)
-        #search for a string that looks like "1234"
-        self.orbitObject=\
-             re.compile('.*VALUE\s+=\s(?P<orbit>\d+)\n',re.DOTALL)
+        self.metaValues=parseODL(metaDat)
+        self.altrValues=parseODL(altrDat)
 
     def getstring(self,theName):
-        theString=self.metaDat.split(theName)
-        #should break into three pieces, we want middle
-        if len(theString) ==3:
-            theString=theString[1]
-        else:
-            
-            altString=self.altrDat.split(theName)
-            if len(altString) == 3:
-                theString=altString[1]
-            else:
-                raise "couldn't parse %s" % (theName,)
-        return theString
-        
+        #CoreMetadata first, level-2 files keep some values in ArchiveMetadata
+        if theName in self.metaValues:
+            return self.metaValues[theName]
+        if theName in self.altrValues:
+            return self.altrValues[theName]
+        raise ValueError("couldn't parse %s" % (theName,))
 
     def __call__(self,theName):
         if theName=='CORNERS':
-            import string
-            #look for the corner coordinates by searching for
-            #the GRINGPOINTLATITUDE and GRINGPOINTLONGITUDE keywords
-            #and then matching the values inside two round parenthesis
-            #using the coord regular expression
-            theString= self.getstring('GRINGPOINTLATITUDE')
-            theMatch=self.coordObject.match(theString)
-            thelats=theMatch.group('coord').split(',')
-            thelats=map(string.atof,thelats)
-            theString= self.getstring('GRINGPOINTLONGITUDE')
-            theMatch=self.coordObject.match(theString)
-            thelongs=theMatch.group('coord').split(',')
-            thelongs=map(string.atof,thelongs)
-            coordlist=[]
-            for i in range(len(thelongs)):
-                coordlist.append((thelongs[i],thelats[i]))
-            value=coordlist
+            #the corner coordinates are the values of GRINGPOINTLATITUDE
+            #and GRINGPOINTLONGITUDE, written as "(lat1, lat2, ...)"
+            thelats=self.getstring('GRINGPOINTLATITUDE').strip('()').split(',')
+            thelats=[float(item) for item in thelats]
+            thelongs=self.getstring('GRINGPOINTLONGITUDE').strip('()').split(',')
+            thelongs=[float(item) for item in thelongs]
+            value=list(zip(thelongs,thelats))
         #regular value
         else:
             theString= self.getstring(theName)
             #orbitnumber doesn't have quotes
             if theName=='ORBITNUMBER':
-                theMatch=self.orbitObject.match(theString)
-                if theMatch:
-                    value=theMatch.group('orbit')
+                if theString.isdigit():
+                    value=theString
                 else:
-                    raise "couldn't fine ORBITNUMBER"
+                    raise ValueError("couldn't find ORBITNUMBER")
             #expect quotes around anything else:
             else:
-                theMatch=self.stringObject.match(theString)
-                if theMatch:
-                    value=theMatch.group('value')
-                    theDate=self.dateObject.match(value)
+                if len(theString) > 1 and theString[0] == '"' and theString[-1] == '"':
+                    value=theString[1:-1]
+                    theDate=dateObject.match(value)
                     if theDate:
                         value=theDate.group('date') + " UCT"
                     else:
-                        theTime=self.timeObject.match(value)
+                        theTime=timeObject.match(value)
                         if theTime:
                             value=theTime.group('time') + " UCT"
                 else:
-                    raise "couldn't parse %s" % (theName,)
+                    raise ValueError("couldn't parse %s" % (theName,))
         return value
 
 def parseMeta(filename):
-    if type(filename) == types.StringType:
-        infile = Dataset(filename,'r')
-    elif isinstance(filename,netCDF4.Dataset):
+    if isinstance(filename,netCDF4.Dataset):
         infile=filename
+    elif isinstance(filename,str):
+        infile = netCDF4.Dataset(filename,'r')
     else:
-        raise IOError, "need an netcdf filename or Dataset instance"
-    metaDat=infile.CoreMetadata_0
-    altrDat=infile.ArchiveMetadata_0
+        raise IOError("need an netcdf filename or Dataset instance")
+    #
+    # only the metadata strings are needed, so close a file we opened here
+    #
+    try:
+        metaDat=infile.CoreMetadata_0
+        altrDat=infile.ArchiveMetadata_0
+    finally:
+        if infile is not filename:
+            infile.close()
     # level-2 files stores GRING data in here
 
     parseIt=metaParse(metaDat,altrDat)
@@ -122,12 +135,59 @@ def parseMeta(filename):
     outDict['cornerlons']=np.array(cornerlons)
     return outDict
 
+def test_parse_meta():
+    """
+       parse a synthetic granule and a multi-line coordinate list
+    """
+    import tempfile
+    import shutil
+    import os
+    from modis_reader import write_test_granule
+    text="""GROUP = GRINGPOINT
+      OBJECT                 = GRINGPOINTCONTAINER
+        OBJECT                 = GRINGPOINTLATITUDE
+          NUM_VAL              = 4
+          VALUE                = (22.0, 22.4,
+                                  22.46, 22.06)
+        END_OBJECT             = GRINGPOINTLATITUDE
+      END_OBJECT             = GRINGPOINTCONTAINER
+    END_GROUP = GRINGPOINT
+    """
+    values=parseODL(text)
+    assert values == {'GRINGPOINTLATITUDE':'(22.0, 22.4,22.46, 22.06)'}
+    tmpdir=tempfile.mkdtemp()
+    try:
+        filename=os.path.join(tmpdir,'MYD021KM.A2005188.0405.005.2009232180906.nc')
+        write_test_granule(filename)
+        meta=parseMeta(filename)
+        assert meta['orbit'] == '8923'
+        assert meta['filename'] == 'MYD021KM.A2005188.0405.005.2009232180906.nc'
+        assert meta['startdate'] == '2005-07-07 UCT' and meta['starttime'] == '04:05:00 UCT'
+        assert meta['stoptime'] == '04:10:00 UCT' and meta['equatortime'] == '04:12:57 UCT'
+        assert meta['nasaProductionDate'] == '2009-08-20 UCT' and meta['daynight'] == 'Day'
+        np.testing.assert_allclose(meta['cornerlats'],[22.,22.4,22.46,22.06])
+        np.testing.assert_allclose(meta['cornerlons'],[146.,146.04,146.34,146.3])
+        #
+        # a file opened by parseMeta is closed again, one passed in is left open
+        #
+        if os.path.isdir('/proc/self/fd'):
+            num_open=len(os.listdir('/proc/self/fd'))
+            for count in range(5):
+                parseMeta(filename)
+            assert len(os.listdir('/proc/self/fd')) == num_open
+        with netCDF4.Dataset(filename) as nc_file:
+            assert parseMeta(nc_file)['orbit'] == '8923'
+            assert nc_file.isopen()
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
 def dorun(filename=None):
     import sys
     if not filename:
         filename=\
          'MOD021KM.A2006275.0440.005.2008107091833.hdf'
-    print parseMeta(filename)
+    print(parseMeta(filename))
 
 if __name__=='__main__':
     dorun()
@@ -16,7 +16,10 @@ REFERENCES
     NCEP/NCAR Reanalysis -- Kalnay et al. 1996
         http://dx.doi.org/10.1175/1520-0477(1996)077<0437:TNYRP>2.0.CO;2
 '''
+from __future__ import print_function
 import datetime as dt  # Python standard library datetime  module
+import json
+from collections import OrderedDict
 import numpy as np
 from netCDF4 import Dataset  # http://code.google.com/p/netcdf4-python/
 import argparse
@@ -24,12 +27,299 @@ import netCDF4
 from modismeta import parseMeta
 
 
+class DimSchema(object):
+    '''
+    Name, length and unlimited flag of one netCDF dimension
+    '''
+    __slots__ = ('name', 'size', 'unlimited')
+
+    def __init__(self, name, size, unlimited=False):
+        self.name = name
+        self.size = size
+        self.unlimited = unlimited
+
+
+class VarSchema(object):
+    '''
+    Structure of one netCDF variable. The attributes are read from the
+    file the first time they are asked for, so the Dataset must still be
+    open then (or the schema must have come from json). A schema loaded
+    from json saved without attributes has none (has_attributes is False).
+    '''
+    __slots__ = ('name', 'dimensions', 'shape', 'dtype', 'size', 'itemsize',
+                 'chunking', 'compression', '_nc_var', '_attributes')
+
+    def __init__(self, name, dimensions, shape, dtype, size, itemsize,
+                 chunking=None, compression=None, nc_var=None, attributes=None):
+        self.name = name
+        self.dimensions = tuple(dimensions)
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.size = size
+        self.itemsize = itemsize
+        self.chunking = None if chunking is None else tuple(chunking)
+        self.compression = compression
+        self._nc_var = nc_var
+        self._attributes = attributes
+
+    @classmethod
+    def from_variable(cls, nc_var):
+        chunking = nc_var.chunking()
+        try:
+            compression = dict((key, json_value(value))
+                               for key, value in nc_var.filters().items())
+        except Exception:
+            compression = None
+        if isinstance(nc_var.dtype, np.dtype):
+            dtype, itemsize = str(nc_var.dtype), nc_var.dtype.itemsize
+        else:
+            # variable length strings
+            dtype, itemsize = 'str', 0
+        return cls(nc_var.name, nc_var.dimensions, nc_var.shape, dtype,
+                   int(nc_var.size), itemsize,
+                   None if chunking == 'contiguous' else chunking,
+                   compression, nc_var=nc_var)
+
+    @property
+    def nbytes(self):
+        return self.size*self.itemsize
+
+    @property
+    def has_attributes(self):
+        return self._attributes is not None or self._nc_var is not None
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            if self._nc_var is None:
+                raise ValueError("the attributes of %s were not saved" % self.name)
+            self._attributes = OrderedDict(
+                (ncattr, self._nc_var.getncattr(ncattr))
+                for ncattr in self._nc_var.ncattrs())
+        return self._attributes
+
+    def to_dict(self, attributes=True):
+        var_dict = OrderedDict([
+            ('dimensions', list(self.dimensions)),
+            ('shape', list(self.shape)),
+            ('dtype', self.dtype),
+            ('size', self.size),
+            ('nbytes', self.nbytes),
+            ('chunking', None if self.chunking is None else list(self.chunking)),
+            ('compression', self.compression)])
+        if attributes and self.has_attributes:
+            var_dict['attributes'] = OrderedDict(
+                (key, json_value(value)) for key, value in self.attributes.items())
+        return var_dict
+
+    @classmethod
+    def from_dict(cls, name, var_dict):
+        size = var_dict['size']
+        itemsize = var_dict['nbytes']//size if size else 0
+        attributes = var_dict.get('attributes')
+        if attributes is not None:
+            attributes = OrderedDict(attributes)
+        return cls(name, var_dict['dimensions'], var_dict['shape'],
+                   var_dict['dtype'], size, itemsize, var_dict['chunking'],
+                   var_dict.get('compression'), attributes=attributes)
+
+
+class FileSchema(object):
+    '''
+    Dimensions, variables and global attributes of a netCDF file, built
+    by nc_schema. Global and variable attributes are fetched lazily.
+    A schema saved with global_values=False keeps only the global
+    attribute names (has_values is False).
+    '''
+    __slots__ = ('dimensions', 'variables', '_nc_fid', '_attributes', '_names')
+
+    def __init__(self, dimensions, variables, nc_fid=None, attributes=None,
+                 attribute_names=None):
+        self.dimensions = dimensions
+        self.variables = variables
+        self._nc_fid = nc_fid
+        self._attributes = attributes
+        self._names = attribute_names
+
+    @property
+    def has_values(self):
+        return self._attributes is not None or self._nc_fid is not None
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            if self._nc_fid is None:
+                raise ValueError("only the global attribute names were saved")
+            self._attributes = OrderedDict(
+                (nc_attr, self._nc_fid.getncattr(nc_attr))
+                for nc_attr in self._nc_fid.ncattrs())
+        return self._attributes
+
+    def attribute_names(self):
+        '''
+        global attribute names, without reading their values
+        '''
+        if self._attributes is not None:
+            return list(self._attributes.keys())
+        if self._nc_fid is not None:
+            return list(self._nc_fid.ncattrs())
+        return list(self._names)
+
+    def to_dict(self, global_values=True, var_attributes=True):
+        '''
+        Parameters
+        ----------
+        global_values : Boolean
+            include the values of the global attributes, which for MODIS
+            granules are long metadata strings, or only their names
+            (always only the names if has_values is False)
+        var_attributes : Boolean
+            include the variable attributes (read from the file if needed,
+            left out for variables whose attributes weren't saved)
+        '''
+        if global_values and self.has_values:
+            nc_attrs = OrderedDict((key, json_value(value))
+                                   for key, value in self.attributes.items())
+        else:
+            nc_attrs = self.attribute_names()
+        return OrderedDict([
+            ('attributes', nc_attrs),
+            ('dimensions', OrderedDict((name, dim.size)
+                                       for name, dim in self.dimensions.items())),
+            ('unlimited', [name for name, dim in self.dimensions.items()
+                           if dim.unlimited]),
+            ('variables', OrderedDict((name, var.to_dict(var_attributes))
+                                      for name, var in self.variables.items()))])
+
+    def to_json(self, global_values=True, var_attributes=True, **kwargs):
+        '''
+        The schema as json text. global_values and var_attributes are passed
+        to to_dict, any other keywords (indent, sort_keys ...) to json.dumps
+        '''
+        return json.dumps(self.to_dict(global_values, var_attributes), **kwargs)
+
+    @classmethod
+    def from_dict(cls, schema_dict):
+        unlimited = schema_dict.get('unlimited', [])
+        dimensions = OrderedDict(
+            (name, DimSchema(name, size, name in unlimited))
+            for name, size in schema_dict['dimensions'].items())
+        variables = OrderedDict(
+            (name, VarSchema.from_dict(name, var_dict))
+            for name, var_dict in schema_dict['variables'].items())
+        nc_attrs = schema_dict['attributes']
+        if not isinstance(nc_attrs, dict):
+            # only the names were saved
+            return cls(dimensions, variables, attribute_names=list(nc_attrs))
+        return cls(dimensions, variables, attributes=OrderedDict(nc_attrs))
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text, object_pairs_hook=OrderedDict))
+
+    def diff(self, other, attributes=True):
+        '''
+        Differences between this schema and another one
+
+        Returns
+        -------
+        changes : dict
+            'dimensions': name: (size here, size in other),
+            'variables': name: {field: (value here, value in other)},
+            'attributes': global name: (value here, value in other),
+            with None for anything missing from one side, and
+            only the entries that differ. Attribute values are only
+            compared when both schemas have them, otherwise just the names.
+        '''
+        def compare(first, second):
+            return dict((key, (first.get(key), second.get(key)))
+                        for key in set(first) | set(second)
+                        if first.get(key) != second.get(key))
+        mine = self.to_dict(attributes, attributes)
+        theirs = other.to_dict(attributes, attributes)
+        changes = dict(dimensions=compare(mine['dimensions'], theirs['dimensions']),
+                       variables={})
+        for name in set(mine['variables']) | set(theirs['variables']):
+            first = mine['variables'].get(name, {})
+            second = theirs['variables'].get(name, {})
+            if first and second and ('attributes' in first) != ('attributes' in second):
+                first.pop('attributes', None)
+                second.pop('attributes', None)
+            var_changes = compare(first, second)
+            if var_changes:
+                changes['variables'][name] = var_changes
+        if attributes and self.has_values and other.has_values:
+            changes['attributes'] = compare(mine['attributes'], theirs['attributes'])
+        else:
+            changes['attributes'] = compare(
+                dict.fromkeys(mine['attributes'], True),
+                dict.fromkeys(theirs['attributes'], True))
+        return changes
+
+
+def nc_schema(nc_fid):
+    '''
+    Structure of a netCDF file without printing or reading attribute values.
+
+    Parameters
+    ----------
+    nc_fid : netCDF4.Dataset
+        A netCDF4 dateset object
+
+    Returns
+    -------
+    schema : FileSchema
+    '''
+    dimensions = OrderedDict(
+        (name, DimSchema(name, len(dim), dim.isunlimited()))
+        for name, dim in nc_fid.dimensions.items())
+    variables = OrderedDict(
+        (name, VarSchema.from_variable(nc_var))
+        for name, nc_var in nc_fid.variables.items())
+    return FileSchema(dimensions, variables, nc_fid=nc_fid)
+
+
+def format_schema(schema):
+    '''
+    The verbose ncdump text for a FileSchema, as a string
+    '''
+    def ncattr_lines(key):
+        if key not in schema.variables:
+            return ["\t\tWARNING: %s does not contain variable attributes" % key]
+        var = schema.variables[key]
+        dtype = str if var.dtype == 'str' else np.dtype(var.dtype)
+        lines = ["\t\ttype: %s" % repr(dtype)]
+        for ncattr, value in var.attributes.items():
+            lines.append('\t\t%s: %s' % (ncattr, repr(value)))
+        return lines
+
+    lines = ["NetCDF Global Attributes:"]
+    for nc_attr, value in schema.attributes.items():
+        lines.append('\t%s: %s' % (nc_attr, repr(value)))
+    lines.append("NetCDF dimension information:")
+    for name, dim in schema.dimensions.items():
+        lines.append("\tName: %s" % name)
+        lines.append("\t\tsize: %s" % dim.size)
+        lines.extend(ncattr_lines(name))
+    lines.append("NetCDF variable information:")
+    for name, var in schema.variables.items():
+        if name not in schema.dimensions:
+            lines.append('\tName: %s' % name)
+            lines.append("\t\tdimensions: %s" % (var.dimensions,))
+            lines.append("\t\tsize: %s" % var.size)
+            lines.extend(ncattr_lines(name))
+    return '\n'.join(lines)
+
+
 def ncdump(nc_fid, verb=True):
     '''
     ncdump outputs dimensions, variables and their attribute information.
     The information is similar to that of NCAR's ncdump utility.
     ncdump requires a valid instance of Dataset.
 
+    The structure comes from nc_schema, and the printed text from
+    format_schema; use those directly to get it without printing.
+
     Parameters
     ----------
     nc_fid : netCDF4.Dataset
@@ -46,48 +336,106 @@ def ncdump(nc_fid, verb=True):
     nc_vars : list
         A Python list of the NetCDF file variables
     '''
-    def print_ncattr(key):
-        """
-        Prints the NetCDF file attributes for a given key
-
-        Parameters
-        ----------
-        key : unicode
-            a valid netCDF4.Dataset.variables key
-        """
-        try:
-            print "\t\ttype:", repr(nc_fid.variables[key].dtype)
-            for ncattr in nc_fid.variables[key].ncattrs():
-                print '\t\t%s:' % ncattr,\
-                      repr(nc_fid.variables[key].getncattr(ncattr))
-        except KeyError:
-            print "\t\tWARNING: %s does not contain variable attributes" % key
-
-    # NetCDF global attributes
-    nc_attrs = nc_fid.ncattrs()
-    if verb:
-        print "NetCDF Global Attributes:"
-        for nc_attr in nc_attrs:
-            print '\t%s:' % nc_attr, repr(nc_fid.getncattr(nc_attr))
-    nc_dims = [dim for dim in nc_fid.dimensions]  # list of nc dimensions
-    # Dimension shape information.
+    schema = nc_schema(nc_fid)
     if verb:
-        print "NetCDF dimension information:"
-        for dim in nc_dims:
-            print "\tName:", dim 
-            print "\t\tsize:", len(nc_fid.dimensions[dim])
-            print_ncattr(dim)
-    # Variable information.
-    nc_vars = [var for var in nc_fid.variables]  # list of nc variables
-    if verb:
-        print "NetCDF variable information:"
-        for var in nc_vars:
-            if var not in nc_dims:
-                print '\tName:', var
-                print "\t\tdimensions:", nc_fid.variables[var].dimensions
-                print "\t\tsize:", nc_fid.variables[var].size
-                print_ncattr(var)
-    return nc_attrs, nc_dims, nc_vars
+        print(format_schema(schema))
+    return schema.attribute_names(), list(schema.dimensions), list(schema.variables)
+
+
+def json_value(value):
+    '''
+    Convert a netCDF attribute value (numpy scalar or array, bytes)
+    to something json can write
+    '''
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def nc_summary(nc_fid, global_values=False):
+    '''
+    Same information as ncdump, returned as a dictionary instead of printed.
+
+    Parameters
+    ----------
+    nc_fid : netCDF4.Dataset
+        A netCDF4 dateset object
+    global_values : Boolean
+        include the values of the global attributes, which for MODIS
+        granules are long metadata strings, or only their names
+
+    Returns
+    -------
+    summary : dict
+        nc_schema(nc_fid).to_dict(global_values): 'attributes',
+        'dimensions': name: size, 'unlimited': dimension names,
+        'variables': name: dict of dimensions, shape, dtype, size, nbytes,
+        chunking (None if contiguous), compression and attributes
+    '''
+    return nc_schema(nc_fid).to_dict(global_values)
+
+
+def test_schema():
+    '''
+    the schema text matches the old print-as-you-go ncdump, the json
+    round trip keeps everything, and diff finds the changes
+    '''
+    import os
+    import shutil
+    import tempfile
+    from modis_reader import write_test_granule
+    tmpdir = tempfile.mkdtemp()
+    try:
+        first, second = [os.path.join(tmpdir, name) for name in ['a.nc', 'b.nc']]
+        write_test_granule(first)
+        write_test_granule(second, nrows=50)
+        nc_fid = Dataset(first, 'r')
+        schema = nc_schema(nc_fid)
+        assert schema._attributes is None
+        assert schema.variables['EV_1KM_Emissive']._attributes is None
+        text = format_schema(schema)
+        lines = text.split('\n')
+        assert lines[lines.index('\tName: EV_1KM_Emissive') + 3] == \
+            "\t\ttype: dtype('uint16')"
+        assert "\t\tWARNING: rows does not contain variable attributes" in lines
+        emissive = schema.variables['EV_1KM_Emissive']
+        assert emissive.chunking == (1, 20, 30) and emissive.nbytes == 16*40*30*2
+        assert emissive.compression['zlib']
+        copy = FileSchema.from_json(schema.to_json())
+        assert copy.to_dict() == json.loads(schema.to_json())
+        assert copy.diff(schema) == dict(dimensions={}, variables={}, attributes={})
+        assert ncdump(nc_fid, verb=False) == (['CoreMetadata_0', 'ArchiveMetadata_0'],
+                                             ['Band_1KM_Emissive', 'rows', 'cols'],
+                                             ['EV_1KM_Emissive', 'latitude', 'longitude'])
+        nc_other = Dataset(second, 'r')
+        changes = schema.diff(nc_schema(nc_other), attributes=False)
+        assert changes['dimensions'] == {'rows': (40, 50)}
+        assert changes['variables']['latitude'] == {'shape': ([40, 30], [50, 30]),
+                                                    'size': (1200, 1500),
+                                                    'nbytes': (4800, 6000)}
+        assert changes['attributes'] == {}
+        assert 'CoreMetadata_0' in schema.diff(nc_schema(nc_other))['attributes']
+        #
+        # a names-only schema knows it has no values, so diff doesn't report
+        # every attribute as changed
+        #
+        names_only = FileSchema.from_json(schema.to_json(global_values=False,
+                                                         var_attributes=False, indent=1))
+        assert not names_only.has_values
+        assert names_only.attribute_names() == ['CoreMetadata_0', 'ArchiveMetadata_0']
+        assert not names_only.variables['EV_1KM_Emissive'].has_attributes
+        assert names_only.to_dict() == schema.to_dict(False, False)
+        for first, second in [(names_only, schema), (schema, names_only)]:
+            assert first.diff(second) == dict(dimensions={}, variables={}, attributes={})
+        nc_fid.close()
+        nc_other.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
 
 
 if __name__ == "__main__":
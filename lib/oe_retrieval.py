@@ -0,0 +1,170 @@
+"""
+   optimal estimation retrieval of level temperatures from multi-channel
+   top of atmosphere brightness temperatures
+
+   the forward model is the lapse-rate exercise one: hydrostat builds the
+   column for the current temperature guess, find_tau gives the optical
+   depths and top_radiance the radiances.  The jacobian comes from
+   transmit_top.temperature_jacobian (tau held fixed), and every pixel is
+   iterated at once with Levenberg-Marquardt (or plain Gauss-Newton)
+   steps, see Rodgers (2000) eq. 5.36
+"""
+from __future__ import division,print_function
+import numpy as np
+from scipy.linalg import cho_factor,cho_solve
+from hydrostat import hydrostat,find_tau
+from planck import planckInvert
+from top_radiance import top_radiance
+from transmit_top import temperature_jacobian
+
+def exp_covariance(height,sigma_T,corr_length):
+    """
+       input: height -- (nlev,) level heights (m)
+              sigma_T -- prior standard deviation (K), scalar or (nlev,)
+              corr_length -- correlation length (m)
+       output: (nlev,nlev) covariance sigma_i*sigma_j*exp(-|z_i - z_j|/corr_length)
+    """
+    sigma_T=np.asarray(sigma_T,dtype=np.float64)*np.ones(len(height))
+    distance=np.fabs(np.subtract.outer(height,height))
+    return np.outer(sigma_T,sigma_T)*np.exp(-distance/corr_length)
+
+
+class TempRetrieval(object):
+    """
+       input: x_a -- (nlev,) prior level temperatures (K), level 0 is the surface
+              S_a -- (nlev,nlev) prior covariance (K^2)
+              S_e -- (nchan,) brightness temperature noise variances (K^2)
+              wavel, k_lambda -- (nchan,) wavelengths (m) and absorption coefficients (m^2/kg)
+              r_gas, p_surf, delta_z -- as for top_radiance.forward_model
+
+       the prior covariance is factored once here and reused for every pixel
+    """
+    def __init__(self,x_a,S_a,S_e,wavel,k_lambda,r_gas=0.01,p_surf=100.e3,delta_z=25000/7):
+        self.x_a=np.asarray(x_a,dtype=np.float64)
+        self.num_levels=len(self.x_a)
+        self.S_a_inv=cho_solve(cho_factor(S_a),np.eye(self.num_levels))
+        self.S_e_inv=1./np.asarray(S_e,dtype=np.float64)*np.ones(len(wavel))
+        self.wavel=np.asarray(wavel,dtype=np.float64)
+        self.k_lambda=np.asarray(k_lambda,dtype=np.float64)
+        self.r_gas=r_gas
+        self.p_surf=p_surf
+        self.delta_z=delta_z
+
+    def forward(self,Temp,jacobian=False):
+        """
+           input: Temp -- level temperatures (K), shape (npix,nlev)
+           output: Tbright -- (npix,nchan) brightness temperatures (K)
+                   and, if jacobian is True, K -- (npix,nchan,nlev) dTbright/dTemp
+        """
+        lapse=np.diff(Temp,axis=-1)/self.delta_z
+        Temp,press,rho,height=hydrostat(Temp[...,0],self.p_surf,lapse,self.delta_z,
+                                        self.num_levels)
+        tau=find_tau(self.r_gas,self.k_lambda,rho,height)
+        Tbright=planckInvert(self.wavel,top_radiance(tau,Temp,height,Temp[...,0],self.wavel))
+        if not jacobian:
+            return Tbright
+        #
+        # the surface is at the level 0 temperature, so its term goes in column 0
+        #
+        jac,jac_sfc=temperature_jacobian(tau,Temp,Temp[...,0],self.wavel,brightness=True)
+        jac[...,0]=jac[...,0] + jac_sfc
+        return Tbright,jac
+
+    def cost(self,Temp,y,Tbright):
+        """
+           measurement plus prior cost for each pixel
+        """
+        dy=y - Tbright
+        dx=Temp - self.x_a
+        return np.sum(dy*dy*self.S_e_inv,axis=-1) + np.einsum('...i,ij,...j->...',dx,self.S_a_inv,dx)
+
+    def retrieve(self,y,x0=None,maxiter=20,tol=1.e-3,lm=True,gamma0=1.):
+        """
+           input: y -- observed brightness temperatures (K), shape (...,nchan)
+                  x0 -- first guess (K), defaults to the prior
+                  maxiter -- maximum iterations
+                  tol -- a pixel has converged when its largest temperature step is below tol (K)
+                  lm -- use Levenberg-Marquardt damping, otherwise Gauss-Newton
+                  gamma0 -- starting Levenberg-Marquardt damping
+           output: Temp -- (...,nlev) retrieved temperatures (K)
+                   converged -- (...) boolean mask
+                   niter -- (...) iterations used
+                   cost -- (...) final cost
+        """
+        y=np.asarray(y,dtype=np.float64)
+        shape=y.shape[:-1]
+        y=y.reshape(-1,y.shape[-1])
+        npix=y.shape[0]
+        Temp=np.empty([npix,self.num_levels])
+        Temp[...]=self.x_a if x0 is None else np.asarray(x0).reshape(-1,self.num_levels)
+        converged=np.zeros([npix],dtype=bool)
+        niter=np.zeros([npix],dtype=int)
+        gamma=np.ones([npix])*(gamma0 if lm else 0.)
+        Tbright,jac=self.forward(Temp,jacobian=True)
+        cost=self.cost(Temp,y,Tbright)
+        active=np.arange(npix)
+        for it in range(maxiter):
+            if active.size == 0:
+                break
+            the_Temp=Temp[active]
+            the_jac=jac[active]
+            #
+            # Levenberg-Marquardt step for all active pixels at once:
+            # ((1+gamma)S_a^-1 + K^T S_e^-1 K) dx = K^T S_e^-1 (y-F) - S_a^-1 (x-x_a)
+            #
+            KtSe=np.swapaxes(the_jac,-1,-2)*self.S_e_inv
+            lhs=np.matmul(KtSe,the_jac) + (1. + gamma[active])[:,None,None]*self.S_a_inv
+            rhs=np.einsum('pij,pj->pi',KtSe,y[active] - Tbright[active]) - \
+                np.dot(the_Temp - self.x_a,self.S_a_inv)
+            step=np.linalg.solve(lhs,rhs[...,None])[...,0]
+            new_Temp=the_Temp + step
+            new_Tbright,new_jac=self.forward(new_Temp,jacobian=True)
+            new_cost=self.cost(new_Temp,y[active],new_Tbright)
+            niter[active]=niter[active] + 1
+            accept=(new_cost <= cost[active]) | (not lm)
+            keep=active[accept]
+            Temp[keep]=new_Temp[accept]
+            Tbright[keep]=new_Tbright[accept]
+            jac[keep]=new_jac[accept]
+            cost[keep]=new_cost[accept]
+            if lm:
+                gamma[keep]=gamma[keep]/10.
+                gamma[active[~accept]]=gamma[active[~accept]]*10.
+            done=accept & (np.fabs(step).max(axis=-1) < tol)
+            converged[active[done]]=True
+            active=active[~done]
+        return (Temp.reshape(shape + (self.num_levels,)),converged.reshape(shape),
+                niter.reshape(shape),cost.reshape(shape))
+
+
+def test_oe_retrieval():
+    """
+       retrieve perturbed profiles from noise-free brightness temperatures
+    """
+    wavel=((1/np.linspace(666,766,7))*1.e-2)[::-1]
+    k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.
+    delta_z=25000/7
+    x_a,press,rho,height=hydrostat(300.,100.e3,-6.5e-3,delta_z,7)
+    S_a=exp_covariance(height,5.,3000.)
+    retrieval=TempRetrieval(x_a,S_a,0.01**2.,wavel,k_lambda,delta_z=delta_z)
+    np.random.seed(5)
+    truth=x_a + np.random.multivariate_normal(np.zeros(7),S_a,6).reshape(2,3,7)
+    y=retrieval.forward(truth.reshape(-1,7)).reshape(2,3,7)
+    for lm in [True,False]:
+        Temp,converged,niter,cost=retrieval.retrieve(y,lm=lm)
+        assert Temp.shape == (2,3,7)
+        assert converged.all()
+        fit=retrieval.forward(Temp.reshape(-1,7)).reshape(2,3,7)
+        np.testing.assert_allclose(fit,y,atol=0.05)
+        prior_error=np.fabs(truth - x_a)[...,:-1].mean()
+        assert np.fabs(truth - Temp)[...,:-1].mean() < prior_error
+    #
+    # a pixel retrieved on its own gives the same answer as in the batch
+    #
+    single=retrieval.retrieve(y[1,2])[0]
+    batch=retrieval.retrieve(y)[0]
+    np.testing.assert_allclose(single,batch[1,2],atol=1.e-8)
+    return None
+
+if __name__=="__main__":
+    test_oe_retrieval()
@@ -1,22 +1,20 @@
 import numpy as np
 from  scipy.integrate import quad
 
-c=2.99792458e+08  #m/s -- speed of light in vacumn
-h=6.62606876e-34  #J s  -- Planck's constant
-kb=1.3806503e-23  # J/K  -- Boltzman's constant
-c=3.e8  #speed of light (m/s)
-c1=2.*h*c**2.
-c2=h*c/kb
-sigma=2.*np.pi**5.*kb**4./(15*h**3.*c**2.)
+import planck_kernel
+from planck_kernel import c,h,kb,c1,c2,sigma
+
+#
+# the planck functions below are thin wrappers around planck_kernel,
+# which broadcasts and takes a dtype argument if you need float32
+#
 
 def planckDeriv(wavel,Temp):
     """
        input: wavel in m, Temp in K
-       output: dBlambda/dlambda  W/m^2/m/sr/m
+       output: dBlambda/dTemp  W/m^2/m/sr/K
     """
-    expterm=np.exp(c2/(wavel*Temp))
-    deriv=c1/np.pi*wavel**(-6.)*(expterm -1)**(-2.)*c2/Temp**2.*expterm
-    return deriv           
+    return planck_kernel.wavelen_deriv(wavel,Temp)
 
 
 def planckwavelen(wavel,Temp):
@@ -24,31 +22,27 @@ def planckwavelen(wavel,Temp):
        input: wavelength (m), Temp (K)
        output: planck function W/m^2/m/sr
     """
-    Blambda=c1/(wavel**5.*(np.exp(c2/(wavel*Temp)) -1))
-    return Blambda
+    return planck_kernel.wavelen(wavel,Temp)
 
 def planckfreq(freq,Temp):
     """
       input: freq (Hz), Temp (K)
       output: planck function in W/m^2/Hz/sr
     """
-    Bfreq=c1*freq**3./(np.exp(c2*freq/Temp) -1)
-    return Bfreq
+    return planck_kernel.freq(freq,Temp)
 
 def planckwavenum(waven,Temp):
     """
       input: wavenumber (m^{-1}), Temp (K)
       output: planck function in W/m^2/m^{-1}/sr
     """
-    Bwaven=c1*waven**3./(np.exp(c2*waven/Temp) -1)
-    return Bwaven
+    return planck_kernel.wavenum(waven,Temp)
 
 def planckInvert(wavel,Blambda):
     """input wavelength in m and Blambda in W/m^2/m, output
     output brightness temperature in K
     """
-    Tbright=c2/(wavel*np.log(c1/(wavel**5.*Blambda) + 1.))
-    return Tbright
+    return planck_kernel.wavelen_invert(wavel,Blambda)
 
 def planckInt(Temp,lower,upper):
     """Integrate planckwavelen given temperatue Temp (K) from lower (m) to upper (m) wavelengths
@@ -71,11 +65,17 @@ def goodInvert(T0,bbr,wavel):
 
 
 def rootfind(T0,bbrVec,wavel):
+    """
+       scalar Newton inversion, one radiance at a time -- kept as a reference
+       for newtonInvert, which does the same iteration on whole arrays
+       input: T0 -- first guess (K), bbrVec -- radiances (W/m^2/m/sr), wavel (m)
+       output: list of brightness temperatures (K)
+    """
     bbrVec=np.asarray(bbrVec)
-    guess=planckwavelen(T0,wavel)
+    guess=planckwavelen(wavel,T0)
     out=[]
     for bbr in bbrVec:
-        while np.fabs(bbr - guess) > 1.e-8:
+        while np.fabs(bbr - guess) > 1.e-8*bbr:
             delB=bbr-guess
             deriv=planckDeriv(wavel,T0)    
             delT=delB/deriv
@@ -85,6 +85,89 @@ def rootfind(T0,bbrVec,wavel):
     return out
 
 
+def planckDeriv2(wavel,Temp):
+    """
+       input: wavel in m, Temp in K
+       output: d^2Blambda/dTemp^2  W/m^2/m/sr/K^2
+    """
+    x=c2/(wavel*Temp)
+    fterm=1./(-np.expm1(-x))
+    u=x/Temp
+    deriv2=planckDeriv(wavel,Temp)*(u*(2.*fterm - 1.) - 2./Temp)
+    return deriv2
+
+
+def newtonInvert(wavel,Blambda,T0=300.,tol=1.e-6,maxiter=50,halley=False):
+    """
+       invert planckwavelen for brightness temperature with Newton (or Halley)
+       iterations done on whole arrays at once
+
+       input: wavel (m), Blambda (W/m^2/m/sr) -- any shapes that broadcast
+                 together, e.g. wavel[:,None,None] against a (channel,row,col) image
+              T0 -- first guess temperature (K), scalar or broadcastable array
+              tol -- stop iterating a point once its temperature step is below tol (K)
+              maxiter -- maximum number of iterations
+              halley -- if True use Halley's method (needs planckDeriv2)
+       output: Tbright (K), converged (boolean mask), both with the broadcast shape
+    """
+    wavel,Blambda,T0=np.broadcast_arrays(wavel,Blambda,T0)
+    shape=Blambda.shape
+    wavel=wavel.ravel()
+    Blambda=Blambda.ravel()
+    Tbright=np.array(T0,dtype=np.float64).ravel()
+    converged=np.zeros(Tbright.shape,dtype=bool)
+    #
+    # only iterate on the points that haven't converged yet
+    #
+    active=np.arange(Tbright.size)
+    for it in range(maxiter):
+        if active.size == 0:
+            break
+        the_wavel=wavel[active]
+        Temp=Tbright[active]
+        delB=planckwavelen(the_wavel,Temp) - Blambda[active]
+        deriv=planckDeriv(the_wavel,Temp)
+        if halley:
+            deriv2=planckDeriv2(the_wavel,Temp)
+            delT= -2.*delB*deriv/(2.*deriv**2. - delB*deriv2)
+        else:
+            delT= -delB/deriv
+        newT=Temp + delT
+        #
+        # don't let an overshoot send the temperature negative
+        #
+        newT=np.where(newT > 0,newT,0.5*Temp)
+        Tbright[active]=newT
+        done=np.fabs(newT - Temp) < tol
+        converged[active[done]]=True
+        active=active[~done]
+    return Tbright.reshape(shape),converged.reshape(shape)
+
+
+def benchmark_invert(npts=100000,wavel=11.e-6,nloop=3):
+    """
+       time newtonInvert against rootfind and the closed form planckInvert
+       input: npts -- number of radiances to invert, wavel (m)
+       output: dictionary of best times in seconds, keyed by method
+    """
+    import timeit
+    Temps=np.random.uniform(200.,320.,npts)
+    bbr=planckwavelen(wavel,Temps)
+    #
+    # rootfind is a python loop, so time it on a short slice and scale up
+    #
+    nslow=min(npts,1000)
+    timers=dict(planckInvert=lambda: planckInvert(wavel,bbr),
+                newtonInvert=lambda: newtonInvert(wavel,bbr),
+                halleyInvert=lambda: newtonInvert(wavel,bbr,halley=True),
+                rootfind=lambda: rootfind(300.,bbr[:nslow],wavel))
+    out={}
+    for key,the_fun in timers.items():
+        out[key]=min(timeit.repeat(the_fun,number=1,repeat=nloop))
+    out['rootfind']=out['rootfind']*npts/nslow
+    return out
+
+
 def test_planck_wavelen():
     """
        test planck function for several wavelengths
@@ -143,6 +226,24 @@ def test_planck_integral():
     np.testing.assert_almost_equal(totrad,stefan,decimal=5)
     return None
 
+def test_newton_invert():
+    """
+       vectorized Newton and Halley inversions should agree with
+       planckInvert over a (channel,row,col) image
+    """
+    the_wavelens=np.array([8.,11.,12.,15.])*1.e-6
+    Temps=np.linspace(190.,330.,60).reshape(6,10)
+    Blambda=planckwavelen(the_wavelens[:,None,None],Temps)
+    exact=planckInvert(the_wavelens[:,None,None],Blambda)
+    for halley in [False,True]:
+        Tbright,converged=newtonInvert(the_wavelens[:,None,None],Blambda,halley=halley)
+        assert Tbright.shape == (4,6,10)
+        assert converged.all()
+        np.testing.assert_array_almost_equal(Tbright,exact,decimal=6)
+    np.testing.assert_array_almost_equal(rootfind(300.,Blambda[1,0,:],the_wavelens[1]),
+                                         Temps[0,:],decimal=6)
+    return None
+
 #this trick will run  the following script if
 #the file planck.py is run as a program, but won't
 #if  planck.py is imported from another  module
@@ -153,3 +254,5 @@ if __name__ ==  '__main__':
     test_planck_wavelen()
     test_planck_inverse()
     test_planck_integral()
+    test_newton_invert()
+    print(benchmark_invert())
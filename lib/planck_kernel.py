@@ -0,0 +1,185 @@
+"""
+   single home for the Planck function in its wavelength, frequency and
+   wavenumber forms, with temperature derivatives and inverses
+
+   every function broadcasts its spectral argument against Temp, so e.g.
+   wavelen(wavel[:,None,None],Temp) gives a (channel,row,col) image.
+   Pass dtype=np.float32 to keep large granules in single precision.
+
+   All forms are written as pre/(exp(x) - 1) with x=c2*spec/Temp and are
+   evaluated with one expm1(x) per call, derivatives included.  expm1 keeps
+   full precision for small x, and for very large x it overflows to inf,
+   which gives the correct limit of zero for the radiance and its derivative.
+"""
+from __future__ import division
+import numpy as np
+
+#
+# planck.py has always used c=3.e8 and the tests in tests/test_planck.py
+# are pinned to it, so this is the one value used everywhere
+#
+c=3.e8  #speed of light (m/s)
+h=6.62606876e-34  #J s  -- Planck's constant
+kb=1.3806503e-23  # J/K  -- Boltzman's constant
+c1=2.*h*c**2.  #W m^2/sr -- wavelength and wavenumber forms
+c2=h*c/kb  #m K
+c1_freq=2.*h/c**2.  #J s^3/m^2/sr -- frequency form
+c2_freq=h/kb  #K s
+sigma=2.*np.pi**5.*kb**4./(15*h**3.*c**2.)
+
+#
+# take roots of the prefactors so that wavel**(-5) or freq**3 are
+# never formed on their own -- (1.e13 Hz)**3 overflows float32
+#
+_c1_fifth=c1**(1./5.)
+_c1_cube=c1**(1./3.)
+_c1_freq_cube=c1_freq**(1./3.)
+
+
+def _asarrays(spec,Temp,dtype):
+    return np.asarray(spec,dtype=dtype),np.asarray(Temp,dtype=dtype)
+
+
+def _planck(pre,x):
+    """
+       pre/(exp(x) - 1) with a single expm1
+    """
+    with np.errstate(over='ignore'):
+        return pre/np.expm1(x)
+
+
+def _planck_deriv(pre,x,Temp):
+    """
+       B and dB/dTemp for any of the three forms, given x=c2*spec/Temp,
+       sharing one expm1 evaluation:
+           dB/dTemp=B*x/Temp*exp(x)/(exp(x) - 1)=B*x/Temp*(1 + 1/expm1(x))
+    """
+    with np.errstate(over='ignore'):
+        em1=np.expm1(x)
+    Bfun=pre/em1
+    return Bfun,Bfun*x/Temp*(1. + 1./em1)
+
+
+def wavelen(wavel,Temp,dtype=np.float64):
+    """
+       input: wavelength (m), Temp (K)
+       output: planck function W/m^2/m/sr
+    """
+    wavel,Temp=_asarrays(wavel,Temp,dtype)
+    x=c2/(wavel*Temp)
+    return _planck((_c1_fifth/wavel)**5.,x)
+
+
+def wavelen_deriv(wavel,Temp,dtype=np.float64):
+    """
+       input: wavelength (m), Temp (K)
+       output: dBlambda/dTemp W/m^2/m/sr/K
+    """
+    wavel,Temp=_asarrays(wavel,Temp,dtype)
+    x=c2/(wavel*Temp)
+    return _planck_deriv((_c1_fifth/wavel)**5.,x,Temp)[1]
+
+
+def wavelen_invert(wavel,Blambda,dtype=np.float64):
+    """
+       input: wavelength (m), Blambda (W/m^2/m/sr)
+       output: brightness temperature (K)
+    """
+    wavel,Blambda=_asarrays(wavel,Blambda,dtype)
+    return c2/(wavel*np.log1p((_c1_fifth/wavel)**5./Blambda))
+
+
+def freq(freq,Temp,dtype=np.float64):
+    """
+       input: freq (Hz), Temp (K)
+       output: planck function in W/m^2/Hz/sr
+    """
+    freq,Temp=_asarrays(freq,Temp,dtype)
+    x=c2_freq*freq/Temp
+    return _planck((_c1_freq_cube*freq)**3.,x)
+
+
+def freq_deriv(freq,Temp,dtype=np.float64):
+    """
+       input: freq (Hz), Temp (K)
+       output: dBfreq/dTemp in W/m^2/Hz/sr/K
+    """
+    freq,Temp=_asarrays(freq,Temp,dtype)
+    x=c2_freq*freq/Temp
+    return _planck_deriv((_c1_freq_cube*freq)**3.,x,Temp)[1]
+
+
+def freq_invert(freq,Bfreq,dtype=np.float64):
+    """
+       input: freq (Hz), Bfreq (W/m^2/Hz/sr)
+       output: brightness temperature (K)
+    """
+    freq,Bfreq=_asarrays(freq,Bfreq,dtype)
+    return c2_freq*freq/np.log1p((_c1_freq_cube*freq)**3./Bfreq)
+
+
+def wavenum(waven,Temp,dtype=np.float64):
+    """
+      input: wavenumber (m^{-1}), Temp (K)
+      output: planck function in W/m^2/m^{-1}/sr
+    """
+    waven,Temp=_asarrays(waven,Temp,dtype)
+    x=c2*waven/Temp
+    return _planck((_c1_cube*waven)**3.,x)
+
+
+def wavenum_deriv(waven,Temp,dtype=np.float64):
+    """
+      input: wavenumber (m^{-1}), Temp (K)
+      output: dBwaven/dTemp in W/m^2/m^{-1}/sr/K
+    """
+    waven,Temp=_asarrays(waven,Temp,dtype)
+    x=c2*waven/Temp
+    return _planck_deriv((_c1_cube*waven)**3.,x,Temp)[1]
+
+
+def wavenum_invert(waven,Bwaven,dtype=np.float64):
+    """
+      input: wavenumber (m^{-1}), Bwaven (W/m^2/m^{-1}/sr)
+      output: brightness temperature (K)
+    """
+    waven,Bwaven=_asarrays(waven,Bwaven,dtype)
+    return c2*waven/np.log1p((_c1_cube*waven)**3./Bwaven)
+
+
+def test_kernel_forms():
+    """
+       the three forms should be consistent with one another,
+       invert exactly, and survive float32 and extreme arguments
+    """
+    Temps=np.array([200.,250.,300.])[:,None]
+    wavels=np.array([4.,11.,15.])*1.e-6
+    waven=1./wavels
+    freqs=c/wavels
+    Blambda=wavelen(wavels,Temps)
+    #
+    # B_lambda dlambda = B_waven dwaven = B_freq dfreq
+    #
+    np.testing.assert_allclose(wavenum(waven,Temps),Blambda*wavels**2.,rtol=1.e-10)
+    np.testing.assert_allclose(freq(freqs,Temps),Blambda*wavels**2./c,rtol=1.e-10)
+    np.testing.assert_allclose(wavelen_invert(wavels,Blambda),Temps*np.ones(3),rtol=1.e-12)
+    np.testing.assert_allclose(freq_invert(freqs,freq(freqs,Temps)),Temps*np.ones(3),rtol=1.e-12)
+    np.testing.assert_allclose(wavenum_invert(waven,wavenum(waven,Temps)),Temps*np.ones(3),rtol=1.e-12)
+    dT=1.e-3
+    for fun,deriv,spec in [(wavelen,wavelen_deriv,wavels),(freq,freq_deriv,freqs),
+                           (wavenum,wavenum_deriv,waven)]:
+        numeric=(fun(spec,Temps + dT) - fun(spec,Temps - dT))/(2.*dT)
+        np.testing.assert_allclose(deriv(spec,Temps),numeric,rtol=1.e-6)
+        single=fun(spec,Temps,dtype=np.float32)
+        assert single.dtype == np.float32
+        np.testing.assert_allclose(single,fun(spec,Temps),rtol=1.e-5)
+    #
+    # very cold at short wavelength: radiance and derivative go to zero, not nan
+    #
+    with np.errstate(over='raise',invalid='raise',divide='raise'):
+        cold=wavelen_deriv(1.e-6,np.array([5.,300.]),dtype=np.float32)
+    assert np.all(np.isfinite(cold)) and cold[0] == 0.
+    return None
+
+if __name__=="__main__":
+    test_kernel_forms()
@@ -0,0 +1,174 @@
+"""
+   pulse-pair estimates of Doppler moments from complex I/Q samples
+
+   pulse_pair.py and phaseshift.py draw the phase shift between pulses;
+   this module measures it.  For I/Q samples z shaped (rays,gates,pulses)
+       R0=<|z_n|**2>            (power)
+       R1=<z_(n+1) conj(z_n)>   (lag-1 autocorrelation)
+       velocity=-wavel/(4 pi Ts) arg(R1)
+       width=wavel/(2 sqrt(2) pi Ts) sqrt(ln(S/|R1|)),  S=R0 - noise
+   (Doviak and Zrnic 1993, eqs. 6.19 and 6.27), with Ts=1/PRF.  A velocity
+   away from the radar is positive, and velocities fold at the Nyquist
+   velocity wavel*PRF/4 of radar_geometry.nyquist_velocity.
+
+   example:
+       iq=synthetic_iq(velocity,width,power,noise,64,10.,1000.)
+       moments=pulse_pair(iq,10.,1000.,noise=noise)
+       moments['velocity'].shape   #(rays,gates)
+"""
+from __future__ import division,print_function
+import os
+import timeit
+import numpy as np
+
+def autocorrelations(iq):
+    """
+       input: iq -- complex I/Q samples, pulses along the last axis
+       output: R0 (real) and R1 (complex), shape iq.shape[:-1]
+    """
+    R0=(np.einsum('...i,...i->...',iq.real,iq.real) +
+        np.einsum('...i,...i->...',iq.imag,iq.imag))/iq.shape[-1]
+    R1=np.einsum('...i,...i->...',iq[...,1:],np.conj(iq[...,:-1]))/(iq.shape[-1] - 1)
+    return R0,R1
+
+def pulse_pair(iq,the_wavel,PRF,noise=0.):
+    """
+       input: iq -- complex I/Q samples shaped (...,pulses), e.g. (rays,gates,pulses)
+              the_wavel -- wavelength (cm)
+              PRF -- pulse repetition frequency (s^-1)
+              noise -- noise power per sample, same units as |iq|**2, scalar or (...)
+       output: dictionary of arrays shaped iq.shape[:-1]:
+               R0, R1 -- lag 0 and lag 1 autocorrelations
+               power -- 10 log10(R0 - noise) (dB), nan where that's not positive
+               velocity -- mean radial velocity (m/s)
+               width -- spectrum width (m/s), nan where the signal power isn't positive
+    """
+    iq=np.asarray(iq)
+    R0,R1=autocorrelations(iq)
+    wavel=the_wavel/100.
+    Ts=1./PRF
+    signal=R0 - noise
+    velocity=-wavel/(4.*np.pi*Ts)*np.angle(R1)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        ratio=np.log(signal/np.abs(R1))
+        power=np.where(signal > 0.,10.*np.log10(signal),np.nan)
+    #
+    # a measured |R1| larger than the signal power means a very narrow spectrum
+    #
+    ratio=np.where(signal > 0.,np.maximum(ratio,0.),np.nan)
+    width=wavel/(2.*np.sqrt(2.)*np.pi*Ts)*np.sqrt(ratio)
+    return dict(R0=R0,R1=R1,power=power,velocity=velocity,width=width)
+
+def iter_dwells(filename,ngates,npulses,rays_per_dwell=10,dtype=np.complex64):
+    """
+       read a raw I/Q file (rays,gates,pulses in C order) through a memory map
+
+       yields: (first ray, iq block shaped (rays_per_dwell,ngates,npulses)),
+               the last block may have fewer rays
+    """
+    iq_file=np.memmap(filename,dtype=dtype,mode='r')
+    iq_file=iq_file.reshape(-1,ngates,npulses)
+    for start in range(0,iq_file.shape[0],rays_per_dwell):
+        yield start,np.array(iq_file[start:start + rays_per_dwell])
+
+def process_file(filename,ngates,npulses,the_wavel,PRF,noise=0.,rays_per_dwell=10,
+                 dtype=np.complex64):
+    """
+       pulse_pair moments for a whole raw I/Q file, one dwell of rays at a time,
+       so only rays_per_dwell rays of samples are in memory at once
+
+       output: dictionary of power, velocity and width arrays shaped (rays,gates)
+    """
+    out=None
+    for start,iq in iter_dwells(filename,ngates,npulses,rays_per_dwell,dtype):
+        moments=pulse_pair(iq,the_wavel,PRF,noise)
+        if out is None:
+            nbytes=np.dtype(dtype).itemsize*ngates*npulses
+            nrays=os.path.getsize(filename)//nbytes
+            out=dict((key,np.empty([nrays,ngates])) for key in ['power','velocity','width'])
+        for key in out.keys():
+            out[key][start:start + iq.shape[0]]=moments[key]
+    return out
+
+def synthetic_iq(velocity,width,power,noise,npulses,the_wavel,PRF,seed=None):
+    """
+       I/Q samples with a Gaussian Doppler spectrum plus white noise
+
+       input: velocity, width -- mean velocity and spectrum width (m/s), any broadcastable shape
+              power, noise -- signal and noise power per sample
+              npulses -- samples per gate
+              the_wavel -- wavelength (cm), PRF -- pulse repetition frequency (s^-1)
+       output: complex128 array shaped (...,npulses)
+    """
+    if seed is not None:
+        np.random.seed(seed)
+    wavel=the_wavel/100.
+    shape=np.broadcast(velocity,width,power,noise).shape
+    velocity=np.asarray(velocity,dtype=np.float64)[...,None]
+    width=np.maximum(np.asarray(width,dtype=np.float64),1.e-6)[...,None]
+    #
+    # Doppler frequency -2v/wavel for each fft bin, with the spectrum
+    # wrapped around the neighbouring Nyquist intervals
+    #
+    freq=np.fft.fftfreq(npulses,1./PRF)
+    spectrum=np.zeros(shape + (npulses,))
+    for alias in [-1,0,1]:
+        spectrum+=np.exp(-(freq + alias*PRF + 2.*velocity/wavel)**2./(2.*(2.*width/wavel)**2.))
+    spectrum=spectrum/spectrum.sum(axis=-1)[...,None]
+    amplitude=npulses*np.sqrt(np.asarray(power,dtype=np.float64)[...,None]*spectrum)
+    gauss=(np.random.normal(size=spectrum.shape) + 1j*np.random.normal(size=spectrum.shape))/np.sqrt(2.)
+    iq=np.fft.ifft(amplitude*gauss,axis=-1)
+    noise_amp=np.sqrt(np.asarray(noise,dtype=np.float64)/2.)[...,None]
+    iq=iq + noise_amp*(np.random.normal(size=iq.shape) + 1j*np.random.normal(size=iq.shape))
+    return iq
+
+def benchmark_pulse_pair(nrays=36,ngates=1000,npulses=64,the_wavel=10.,PRF=1000.):
+    """
+       time pulse_pair on a synthetic volume
+       output: gates per second
+    """
+    iq=synthetic_iq(np.random.uniform(-20.,20.,(nrays,ngates)),2.,1.,0.01,npulses,
+                    the_wavel,PRF).astype(np.complex64)
+    seconds=min(timeit.repeat(lambda: pulse_pair(iq,the_wavel,PRF,0.01),number=1,repeat=3))
+    return nrays*ngates/seconds
+
+def test_pulse_pair():
+    """
+       recover the velocity, width and power of synthetic signals, and
+       get the same answer from a memory mapped file dwell by dwell
+    """
+    import tempfile
+    import shutil
+    from radar_geometry import nyquist_velocity
+    the_wavel=10.
+    PRF=1000.
+    v_nyquist=nyquist_velocity(the_wavel,PRF)
+    true_vel=np.linspace(-20.,20.,9)[:,None]*np.ones([9,400])
+    iq=synthetic_iq(true_vel,2.,1.,0.01,64,the_wavel,PRF,seed=2)
+    moments=pulse_pair(iq,the_wavel,PRF,noise=0.01)
+    assert moments['velocity'].shape == (9,400)
+    np.testing.assert_allclose(np.median(moments['velocity'],axis=1),true_vel[:,0],atol=0.2)
+    np.testing.assert_allclose(np.median(moments['width']),2.,rtol=0.1)
+    np.testing.assert_allclose(np.median(moments['power']),0.,atol=0.3)
+    #
+    # a velocity past the Nyquist velocity folds back into the interval
+    #
+    folded=pulse_pair(synthetic_iq(v_nyquist + 5.*np.ones(200),1.,1.,0.,64,the_wavel,PRF,seed=3),
+                      the_wavel,PRF)
+    np.testing.assert_allclose(np.median(folded['velocity']),5. - v_nyquist,atol=0.2)
+    tmpdir=tempfile.mkdtemp()
+    try:
+        filename=os.path.join(tmpdir,'iq.bin')
+        iq32=iq.astype(np.complex64)
+        iq32.tofile(filename)
+        streamed=process_file(filename,400,64,the_wavel,PRF,noise=0.01,rays_per_dwell=4)
+        direct=pulse_pair(iq32,the_wavel,PRF,noise=0.01)
+        for key in ['power','velocity','width']:
+            np.testing.assert_allclose(streamed[key],direct[key])
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
+if __name__=="__main__":
+    test_pulse_pair()
+    print("pulse pair moments: {:.3g} gates per second".format(benchmark_pulse_pair()))
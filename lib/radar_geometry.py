@@ -0,0 +1,145 @@
+"""
+   radar equation geometry for arrays of radars, pulses and gates
+
+   these are the Stull chapter 8 formulas from a10_a15.py (stull_8_13,
+   stull_8_16, stull_8_17, stull_8_35 and stull_r7) written so that every
+   argument can be a numpy array, plus the 4/3 earth radius beam height
+   for every gate of a PPI scan.  Nothing is computed at import time.
+
+   example:
+       ranges=np.arange(0.25,150.,0.25)               #km
+       elevs=np.array([0.5,1.5,2.4,3.4,4.3,6.0])      #degrees
+       geom=gate_geometry(ranges,elevs[:,None],beamwidth(10.,8.5),1.57)
+       geom['height'].shape  #(6,599) m above the radar
+"""
+from __future__ import division,print_function
+import numpy as np
+
+c=3.e8  #speed of light (m/s)
+earth_radius=6.371e6  #m
+
+#
+# (name, shortest, longest wavelength in cm), from question A11
+#
+bands=[('l_band',15,30),('s_band',7.5,15),('c_band',3.75,7.5),('x_band',2.5,3.75),
+       ('ku_band',1.67,2.5),('ka_band',0.75,1.11)]
+
+def beamwidth(the_wavel,dish_size):
+    """
+       input:  the_wavel : wavelength (cm)
+               dish_size : antenna dish diameter (m)
+       output: beamwidth angle (degrees), Stull eq. 8.13
+    """
+    return 71.6*(np.asarray(the_wavel)/100.)/dish_size
+
+def target_range(delT):
+    """
+       input:  delT : round-trip travel time (microseconds)
+       output: radar range (km), Stull eq. 8.16
+    """
+    return c*(np.asarray(delT)*1.e-6)/2.*1.e-3
+
+def max_range(PRF):
+    """
+       input:  PRF : pulse repetition frequency (s^-1)
+       output: maximum unambiguous range (km), Stull eq. 8.17
+    """
+    return c/(2.*np.asarray(PRF))*1.e-3
+
+def nyquist_velocity(the_wavel,PRF):
+    """
+       input:  the_wavel : wavelength (cm)
+               PRF : pulse repetition frequency (s^-1)
+       output: maximum unambiguous Doppler velocity (m/s), Stull eq. 8.35
+    """
+    return (np.asarray(the_wavel)/100.)*PRF/4.
+
+def sample_volume(delT,the_range=30.,the_wavel=10.,dish_size=5.):
+    """
+       input: delT : pulse duration (microseconds)
+              the_range : range to the sample (km)
+              the_wavel : wavelength (cm)
+              dish_size : antenna dish diameter (m)
+       output: radar sample volume (km^3), a cylinder one beamwidth across and
+               c*delT long, as in question R7
+    """
+    beam=beamwidth(the_wavel,dish_size)*np.pi/180.
+    vol_radius=np.asarray(the_range)*1.e3*beam/2.
+    volume=np.pi*vol_radius**2.*np.asarray(delT)*1.e-6*c
+    return volume*1.e-9
+
+def band_name(the_wavel):
+    """
+       input: the_wavel : wavelength (cm), any shape
+       output: array of radar band names, '' for wavelengths outside the bands
+    """
+    the_wavel=np.asarray(the_wavel,dtype=np.float64)
+    names=np.zeros(the_wavel.shape,dtype='U7')
+    for name,left_lim,right_lim in bands:
+        names[(the_wavel >= left_lim) & (the_wavel < right_lim)]=name
+    return names
+
+def gate_geometry(the_range,elevation,beam,delT,earth_factor=4./3.):
+    """
+       beam geometry for every gate of a scan, broadcasting range against elevation
+
+       input: the_range -- slant range to the gate (km)
+              elevation -- antenna elevation angle (degrees)
+              beam -- beamwidth (degrees), e.g. from beamwidth()
+              delT -- pulse duration (microseconds)
+              earth_factor -- effective earth radius factor for standard refraction
+       output: dictionary of arrays with the broadcast shape:
+               height -- beam centre height above the radar (m)
+               ground_range -- distance along the earth's surface (km)
+               beam_diameter -- width of the beam at the gate (m)
+               volume -- sample volume (km^3), as for sample_volume
+    """
+    the_range=np.asarray(the_range,dtype=np.float64)*1.e3
+    elev=np.asarray(elevation,dtype=np.float64)*np.pi/180.
+    eff_radius=earth_factor*earth_radius
+    #
+    # Doviak and Zrnic (1993) eq. 2.28
+    #
+    height=np.sqrt(the_range**2. + eff_radius**2. + 2.*the_range*eff_radius*np.sin(elev)) - eff_radius
+    ground_range=eff_radius*np.arcsin(the_range*np.cos(elev)/(eff_radius + height))
+    beam_diameter=the_range*np.asarray(beam)*np.pi/180.
+    volume=np.pi*(beam_diameter/2.)**2.*np.asarray(delT)*1.e-6*c
+    #
+    # give every output the full gate shape, even the ones that don't depend on elevation
+    #
+    zeros=np.zeros(np.broadcast(the_range,elev,np.asarray(beam),np.asarray(delT)).shape)
+    return dict(height=height + zeros,ground_range=ground_range*1.e-3 + zeros,
+                beam_diameter=beam_diameter + zeros,volume=volume*1.e-9 + zeros)
+
+def test_radar_geometry():
+    """
+       array calls match the scalar textbook numbers
+    """
+    np.testing.assert_allclose(beamwidth(np.array([20,10,3]),np.array([8,5,1])),
+                               [1.79,1.432,2.148],rtol=1.e-12)
+    np.testing.assert_allclose(target_range([2,100,300]),[0.3,15.,45.])
+    np.testing.assert_allclose(max_range(np.array([50,1000])),[3000.,150.])
+    velocity=nyquist_velocity(np.array([10.,5.])[:,None],np.array([100.,1000.,1600.]))
+    np.testing.assert_allclose(velocity,[[2.5,25.,40.],[1.25,12.5,20.]])
+    vol=sample_volume(np.array([0.1,1.,5.]))
+    np.testing.assert_allclose(vol,np.pi*(30.e3*1.432*np.pi/180./2.)**2.*
+                               np.array([0.1,1.,5.])*1.e-6*3.e8*1.e-9)
+    assert list(band_name([20,10,5,3,1.2,1.])) == ['l_band','s_band','c_band','x_band','','ka_band']
+    ranges=np.linspace(0.,150.,601)
+    elevs=np.array([0.,0.5,10.])[:,None]
+    geom=gate_geometry(ranges,elevs,1.,1.)
+    assert geom['height'].shape == (3,601)
+    #
+    # at zero elevation the beam rises as r**2/(2 k a), and for a flat earth
+    # the height is r sin(elevation)
+    #
+    np.testing.assert_allclose(geom['height'][0,-1],150.e3**2./(2.*4./3.*earth_radius),rtol=1.e-3)
+    flat=gate_geometry(ranges,elevs,1.,1.,earth_factor=1.e6)
+    np.testing.assert_allclose(flat['height'],ranges*1.e3*np.sin(elevs*np.pi/180.),atol=1.e-2)
+    np.testing.assert_allclose(flat['ground_range'],ranges*np.cos(elevs*np.pi/180.),atol=1.e-6)
+    np.testing.assert_allclose(geom['volume'][1,120],
+                               sample_volume(1.,30.,the_wavel=100./71.6,dish_size=1.),rtol=1.e-12)
+    return None
+
+if __name__=="__main__":
+    test_radar_geometry()
@@ -0,0 +1,160 @@
+"""
+   moments of the Marshall-Palmer (and general gamma) drop size distribution
+   for whole arrays of rain rates
+
+       n(D)=N0 D**mu exp(-lambda D),  lambda=4.1 RR**(-0.21) mm^{-1}
+
+   with D in mm and n in m^{-3} mm^{-1}, as in marshall_palmer.marshall_dist
+   (mu=0).  The k'th moment M_k is the integral of D**k n(D), so the number
+   concentration is M_0, the liquid water content is proportional to M_3
+   and the reflectivity factor Z is M_6.  With closed_form=True the moments
+   come from
+       M_k=N0 Gamma(k+mu+1)/lambda**(k+mu+1)
+   (times the regularized incomplete gamma function if the diameters are
+   cut off at Dmax), otherwise n(D) is integrated numerically on a diameter
+   grid, broadcasting rain rate against diameter.
+
+   example:
+       out=rain_bulk(rain_volume)        #rain_volume shape (nsweep,nray,ngate) mm/hr
+       dBZ=out['dBZ']
+       rain_back=zr_rain_rate(out['Z'])
+"""
+from __future__ import division,print_function
+import numpy as np
+from scipy.special import gamma,gammainc
+
+N0_mp=8000.  #m^{-3} mm^{-1}
+rho_water=1000.  #kg/m^3
+
+def mp_lambda(RR):
+    """
+       input: RR -- rain rate (mm/hr), any shape
+       output: Marshall-Palmer slope parameter lambda (mm^{-1}), inf where RR is 0
+    """
+    RR=np.asarray(RR,dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        return 4.1*RR**(-0.21)
+
+def moments(RR,orders,Dvec=None,N0=N0_mp,mu=0.,Dmax=None,closed_form=True):
+    """
+       moments of n(D)=N0 D**mu exp(-lambda(RR) D)
+
+       input: RR -- rain rate (mm/hr), shape (...)
+              orders -- moment orders k, scalar or (nmom,)
+              Dvec -- diameter grid (mm) for the numerical integral, defaults
+                      to 0 to Dmax (or 10 mm) in 0.01 mm steps
+              N0 (m^{-3} mm^{-1}), mu -- distribution parameters
+              Dmax -- largest drop diameter (mm), None for no cutoff in the closed form
+              closed_form -- use the gamma function moments instead of the diameter grid
+       output: M_k in m^{-3} mm^k, shape RR.shape + orders.shape
+    """
+    the_lambda=mp_lambda(RR)[...,None]
+    orders=np.asarray(orders,dtype=np.float64)
+    order_shape=orders.shape
+    orders=orders.ravel()
+    if closed_form:
+        power=orders + mu + 1.
+        with np.errstate(divide='ignore',invalid='ignore'):
+            out=N0*gamma(power)/the_lambda**power
+            if Dmax is not None:
+                out=out*gammainc(power,the_lambda*Dmax)
+        #
+        # no rain: lambda is infinite and every moment is zero
+        #
+        out=np.where(np.isinf(the_lambda),0.,out)
+    else:
+        if Dvec is None:
+            Dvec=np.arange(0.,(10. if Dmax is None else Dmax) + 0.005,0.01)
+        Dvec=np.asarray(Dvec,dtype=np.float64)
+        #
+        # trapezoid weights times D**k (and D**mu), so each moment is one dot product
+        #
+        dD=np.diff(Dvec)
+        trap=np.zeros_like(Dvec)
+        trap[:-1]=trap[:-1] + 0.5*dD
+        trap[1:]=trap[1:] + 0.5*dD
+        with np.errstate(divide='ignore',invalid='ignore'):
+            weights=trap[:,None]*Dvec[:,None]**(orders + mu)
+        weights[~np.isfinite(weights)]=0.
+        with np.errstate(invalid='ignore'):
+            ndist=N0*np.exp(-the_lambda*Dvec)
+        ndist=np.where(np.isinf(the_lambda),0.,ndist)
+        out=np.dot(ndist,weights)
+    return out.reshape(out.shape[:-1] + order_shape)
+
+def rain_bulk(RR,Dvec=None,N0=N0_mp,mu=0.,Dmax=None,closed_form=True):
+    """
+       input: RR -- rain rate (mm/hr), any shape, other arguments as for moments
+       output: dictionary of arrays shaped like RR:
+               N_T -- number concentration (m^{-3})
+               LWC -- liquid water content (g/m^3)
+               Z -- reflectivity factor (mm^6 m^{-3})
+               dBZ -- 10 log10(Z)
+    """
+    out=moments(RR,[0.,3.,6.],Dvec=Dvec,N0=N0,mu=mu,Dmax=Dmax,closed_form=closed_form)
+    #
+    # (pi/6) rho_w D**3 with D in mm: 1.e-9 m^3/mm^3 and 1.e3 g/kg
+    #
+    LWC=np.pi/6.*rho_water*1.e-6*out[...,1]
+    with np.errstate(divide='ignore'):
+        dBZ=10.*np.log10(out[...,2])
+    return dict(N_T=out[...,0],LWC=LWC,Z=out[...,2],dBZ=dBZ)
+
+def zr_reflectivity(RR,a=200.,b=1.6):
+    """
+       Z=a RR**b (mm^6 m^{-3}), Marshall and Palmer's a=200, b=1.6 by default;
+       the closed form Marshall-Palmer moments give a=296, b=1.47
+    """
+    return a*np.asarray(RR,dtype=np.float64)**b
+
+def zr_rain_rate(Z,a=200.,b=1.6,dBZ=False):
+    """
+       invert Z=a RR**b, input Z in mm^6 m^{-3} (or dBZ if dBZ is True),
+       output rain rate in mm/hr
+    """
+    Z=np.asarray(Z,dtype=np.float64)
+    if dBZ:
+        Z=10.**(Z/10.)
+    return (Z/a)**(1./b)
+
+def test_rain_moments():
+    """
+       closed form and numerical moments agree with each other and with
+       integrating marshall_dist one rain rate at a time
+    """
+    from marshall_palmer import marshall_dist
+    RR=np.array([[0.,1.,5.],[10.,25.,100.]])
+    Dvec=np.linspace(0,8.,2001)
+    numeric=rain_bulk(RR,Dvec=Dvec,closed_form=False)
+    truncated=rain_bulk(RR,Dmax=8.)
+    for key in ['N_T','LWC','Z']:
+        assert numeric[key].shape == (2,3)
+        np.testing.assert_allclose(numeric[key],truncated[key],rtol=1.e-4)
+    for index in np.ndindex(RR.shape):
+        if RR[index] == 0.:
+            continue
+        integrand=marshall_dist(Dvec,RR[index])*Dvec**6.
+        Z=np.sum(0.5*(integrand[1:] + integrand[:-1])*np.diff(Dvec))
+        np.testing.assert_allclose(numeric['Z'][index],Z,rtol=1.e-10)
+    #
+    # the complete closed form gives the textbook Z=296 R**1.47
+    #
+    full=rain_bulk(RR)
+    assert full['Z'][0,0] == 0. and full['N_T'][0,0] == 0.
+    np.testing.assert_allclose(full['Z'][RR > 0],zr_reflectivity(RR[RR > 0],296.,1.47),rtol=0.02)
+    np.testing.assert_allclose(zr_rain_rate(full['dBZ'],296.,1.47,dBZ=True)[RR > 0],
+                               RR[RR > 0],rtol=0.02)
+    np.testing.assert_allclose(zr_rain_rate(zr_reflectivity(RR)),RR)
+    #
+    # gamma distribution moments with mu != 0
+    #
+    np.testing.assert_allclose(moments(RR[1],[2.,4.],Dvec=Dvec,mu=2.,closed_form=False),
+                               moments(RR[1],[2.,4.],mu=2.,Dmax=8.),rtol=1.e-4)
+    return None
+
+if __name__=="__main__":
+    test_rain_moments()
+    RR=np.logspace(-1,2,5)
+    out=rain_bulk(RR)
+    for the_rr,lwc,dbz in zip(RR,out['LWC'],out['dBZ']):
+        print("rain rate {:8.2f} mm/hr: LWC {:6.3f} g/m^3, {:6.2f} dBZ".format(the_rr,lwc,dbz))
@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from fluxes import two_stream
 
 sigma=5.67e-8
 
@@ -23,40 +24,7 @@ def find_heights(press_levels,rho_layers):
     return level_heights
 
 def fluxes(tau_levels,Temp_layers,T_surf):
-    up_rad=np.empty_like(tau_levels)
-    down_rad=np.empty_like(tau_levels)
-    sfc_rad=sigma*T_surf**4.
-    up_rad[0]=sfc_rad
-    tot_levs=len(tau_levels)
-    for index in np.arange(1,tot_levs):
-        upper_lev=index
-        lower_lev=index - 1
-        layer_num=index-1
-        del_tau=tau_levels[upper_lev] - tau_levels[lower_lev]
-        trans=np.exp(-1.666*del_tau)
-        emiss=1 - trans
-        layer_rad=sigma*Temp_layers[layer_num]**4.*emiss
-        #
-        # find the radiance at the next level
-        #
-        up_rad[upper_lev]=trans*up_rad[lower_lev] + layer_rad
-    #
-    # start at the top of the atmosphere
-    # with zero downwelling flux
-    #
-    down_rad[tot_levs-1]=0
-    #
-    # go down a level at a time, adding up the radiances
-    #
-    for index in np.arange(1,tot_levs):
-        upper_lev=tot_levs - index
-        lower_lev=tot_levs - index -1
-        layer_num=tot_levs - index - 1
-        del_tau=tau_levels[upper_lev] - tau_levels[lower_lev]
-        trans=np.exp(-1.666*del_tau)
-        emiss=1 - trans
-        layer_rad=sigma*Temp_layers[layer_num]**4.*emiss
-        down_rad[lower_lev]=down_rad[upper_lev]*trans + layer_rad
+    up_rad,down_rad=two_stream(tau_levels,Temp_layers,Temp_layers,T_surf)
     return (up_rad,down_rad)
 
 def heating_rate(net_up,height_levels,rho_layers):
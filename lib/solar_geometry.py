@@ -0,0 +1,151 @@
+"""
+   solar declination, elevation, zenith angle and secant for numpy arrays
+   of times and positions
+
+   the day3_elevation and tucson_elevation notebooks use Stull eqs. 2.5
+   and 2.6 on one datetime at a time:
+       delta_s=phi_r cos(2 pi (day - solstice)/year_length)
+       sin(psi)=sin(phi) sin(delta_s) - cos(phi) cos(delta_s) cos(2 pi t_utc/24 - lambda_e)
+   here the same equations take datetime64 arrays of UTC times and
+   latitude/longitude arrays, broadcasting against each other, so a scalar
+   time with a granule's lat/lon arrays, or a year of one-minute times at
+   a single site, is one call.
+
+   longitudes are degrees east (as in MODIS files); Stull's lambda_e is
+   degrees west, so lambda_e=-lon.  Times must be UTC: convert local
+   times first, e.g. np.datetime64('2014-06-22T13:00') + np.timedelta64(7,'h')
+   for Vancouver daylight time.
+
+   example:
+       geom=solar_geometry(np.datetime64('2005-07-07T04:05'),lat,lon)   #lat, lon (2030,1354)
+       secant=geom['secant']
+"""
+from __future__ import division,print_function
+import numpy as np
+
+phi_r=23.44  #axis tilt (degrees), Stull
+solstice_day=172  #day of the year of the summer solstice, Stull
+
+def _times(times):
+    return np.asarray(times,dtype='datetime64[s]')
+
+def day_of_year(times):
+    """
+       input: times -- datetime64 array (or anything np.datetime64 accepts)
+       output: whole days since January 1 and the length of that year (days),
+               both integer arrays shaped like times
+    """
+    times=_times(times)
+    year_start=times.astype('datetime64[Y]')
+    the_day=(times - year_start.astype('datetime64[s]'))//np.timedelta64(1,'D')
+    year_length=((year_start + 1).astype('datetime64[D]') -
+                 year_start.astype('datetime64[D]')).astype(int)
+    return the_day,year_length
+
+def utc_hour(times):
+    """
+       fractional hour of the day (UTC) for datetime64 times
+    """
+    times=_times(times)
+    seconds=(times - times.astype('datetime64[D]').astype('datetime64[s]')).astype(np.float64)
+    return seconds/3600.
+
+def declination(times,solstice=solstice_day):
+    """
+       input: times -- datetime64 UTC times, any shape
+              solstice -- day of the year of the summer solstice
+       output: solar declination (degrees), Stull eq. 2.5
+    """
+    the_day,year_length=day_of_year(times)
+    fraction=(the_day - solstice)/year_length
+    return phi_r*np.cos(2.*np.pi*fraction)
+
+def solar_geometry(times,lat,lon,solstice=solstice_day):
+    """
+       input: times -- datetime64 UTC times
+              lat, lon -- latitude (degrees N) and longitude (degrees E)
+              all three broadcast against each other
+       output: dictionary of arrays with the broadcast shape:
+               declination, elevation, zenith (degrees), elevation is negative
+               below the horizon
+               cos_zenith
+               secant -- 1/cos_zenith, 0 when the sun is at or below the horizon
+                         (cos_zenith < 1.e-5), as in the tucson_elevation notebook
+    """
+    deltas=np.radians(declination(times,solstice))
+    hour=utc_hour(times)
+    phi=np.radians(np.asarray(lat,dtype=np.float64))
+    lambda_e=-np.radians(np.asarray(lon,dtype=np.float64))
+    sin_psi=np.sin(phi)*np.sin(deltas) - np.cos(phi)*np.cos(deltas)*np.cos(2.*np.pi*hour/24. - lambda_e)
+    sin_psi=np.clip(sin_psi,-1.,1.)
+    elevation=np.degrees(np.arcsin(sin_psi))
+    #
+    # cos(zenith)=sin(elevation)
+    #
+    with np.errstate(divide='ignore'):
+        secant=np.where(sin_psi < 1.e-5,0.,1./sin_psi)
+    shape=np.broadcast(deltas,phi,lambda_e).shape
+    return dict(declination=np.degrees(deltas)*np.ones(shape),elevation=elevation,
+                zenith=90. - elevation,cos_zenith=sin_psi,secant=secant)
+
+def elevation(times,lat,lon,clip=False,solstice=solstice_day):
+    """
+       solar elevation (degrees); with clip=True values below the horizon are
+       set to 0 like the notebook find_elevation
+    """
+    elev=solar_geometry(times,lat,lon,solstice)['elevation']
+    if clip:
+        elev=np.maximum(elev,0.)
+    return elev
+
+def zenith(times,lat,lon,solstice=solstice_day):
+    """
+       solar zenith angle (degrees)
+    """
+    return solar_geometry(times,lat,lon,solstice)['zenith']
+
+def test_solar_geometry():
+    """
+       compare with the notebook's math-module find_elevation, one time at a time
+    """
+    import datetime
+    from math import asin,sin,cos,pi
+    def find_elevation(the_date,lat,lon_west):
+        year_start=datetime.datetime(the_date.year,1,1)
+        year_length=(datetime.datetime(the_date.year + 1,1,1) - year_start).days
+        the_day=(the_date - year_start).days
+        deltas=23.44*cos(2*pi*(the_day - 172)/year_length)*pi/180.
+        phi=lat*pi/180.
+        t_utc=the_date.hour + the_date.minute/60.
+        sin_psi=sin(phi)*sin(deltas) - cos(phi)*cos(deltas)*cos(2*pi*t_utc/24. - lon_west*pi/180.)
+        return asin(sin_psi)*180./pi
+    dates=[datetime.datetime(2014,12,22,hour,minute) for hour in range(24) for minute in [0,20]]
+    dates+=[datetime.datetime(2016,3,23,hour,30) for hour in range(24)]
+    times=np.array(dates,dtype='datetime64[s]')
+    for lat,lon in [(49.25,-123.1),(32.221,-110.926),(-33.9,151.2)]:
+        expected=[find_elevation(the_date,lat,-lon) for the_date in dates]
+        np.testing.assert_allclose(elevation(times,lat,lon),expected,atol=1.e-10)
+    #
+    # a lat/lon grid at one time, and times against a grid
+    #
+    lat,lon=np.meshgrid(np.linspace(-60,60,7),np.linspace(-180,170,8),indexing='ij')
+    geom=solar_geometry(times[5],lat,lon)
+    assert geom['zenith'].shape == (7,8)
+    for index in np.ndindex(lat.shape):
+        np.testing.assert_allclose(geom['elevation'][index],
+                                   find_elevation(dates[5],lat[index],-lon[index]),atol=1.e-10)
+    geom=solar_geometry(times[:,None,None],lat,lon)
+    assert geom['secant'].shape == (len(dates),7,8) and geom['declination'].shape == (len(dates),7,8)
+    up=geom['cos_zenith'] >= 1.e-5
+    np.testing.assert_allclose(geom['secant'][up],1./np.cos(np.radians(geom['zenith'][up])))
+    assert (geom['secant'][~up] == 0.).all()
+    assert elevation(times,49.25,-123.1,clip=True).min() == 0.
+    np.testing.assert_allclose(declination(np.datetime64('2014-06-22')),23.44)
+    return None
+
+if __name__=="__main__":
+    import timeit
+    test_solar_geometry()
+    minutes=np.arange('2014-01-01','2015-01-01',dtype='datetime64[m]')
+    seconds=min(timeit.repeat(lambda: zenith(minutes,49.25,-123.1),number=1,repeat=3))
+    print("a year of one-minute zenith angles ({} times) in {:.3f} s".format(len(minutes),seconds))
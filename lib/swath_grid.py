@@ -0,0 +1,225 @@
+"""
+   bin swath data onto a regular lat/lon grid
+
+   replaces the np.digitize + per-point loop in the satellite notebooks.
+   Every point is turned into a flat cell index once, and the per-cell sums
+   and counts for all fields come from np.bincount; min and max use
+   np.minimum.at/np.maximum.at.  A SwathGrid keeps running totals, so
+   granules (or tiles of one granule) can be added one at a time and
+   grids built in separate processes can be merged.
+
+   example:
+       grid=SwathGrid(np.linspace(20,30,101),np.linspace(140,160,201),nfields=2,stats=('std',))
+       for tile in granule.tiles(['31','32'],geo=True):
+           grid.add(tile['lat'],tile['lon'],tile['data'])
+       chan31_mean,chan32_mean=grid.mean
+"""
+from __future__ import division,print_function
+import numpy as np
+
+class SwathGrid(object):
+    """
+       input: lat_edges -- (nlat+1,) increasing latitude cell edges (degrees)
+              lon_edges -- (nlon+1,) increasing longitude cell edges (degrees)
+              nfields -- number of fields binned together
+              stats -- any of 'min','max','std' to keep as well as the mean
+
+       points outside the edges, or with nan lat/lon, are counted in self.outside
+       and otherwise ignored; nan field values are left out of that field's cell
+    """
+    def __init__(self,lat_edges,lon_edges,nfields=1,stats=()):
+        self.lat_edges=np.asarray(lat_edges,dtype=np.float64)
+        self.lon_edges=np.asarray(lon_edges,dtype=np.float64)
+        self.nfields=nfields
+        self.stats=tuple(stats)
+        for stat in self.stats:
+            if stat not in ('min','max','std'):
+                raise ValueError("unknown statistic {}, use min, max or std".format(stat))
+        self.shape=(len(self.lat_edges) - 1,len(self.lon_edges) - 1)
+        ncells=self.shape[0]*self.shape[1]
+        self.sums=np.zeros([nfields,ncells])
+        self.counts=np.zeros([nfields,ncells],dtype=np.int64)
+        if 'std' in self.stats:
+            self.sumsq=np.zeros([nfields,ncells])
+        if 'min' in self.stats:
+            self.mins=np.empty([nfields,ncells])
+            self.mins.fill(np.inf)
+        if 'max' in self.stats:
+            self.maxs=np.empty([nfields,ncells])
+            self.maxs.fill(-np.inf)
+        self.outside=0
+
+    def cell_index(self,lat,lon):
+        """
+           input: lat, lon -- arrays of point positions (degrees), any matching shape
+           output: flat cell index for each point (raveled), boolean mask of the
+                   points that fall inside the grid
+        """
+        lat=np.asarray(lat,dtype=np.float64).ravel()
+        lon=np.asarray(lon,dtype=np.float64).ravel()
+        row=np.searchsorted(self.lat_edges,lat,side='right') - 1
+        col=np.searchsorted(self.lon_edges,lon,side='right') - 1
+        #
+        # a point exactly on the last edge goes in the last cell, as np.histogram does
+        #
+        row[lat == self.lat_edges[-1]]=self.shape[0] - 1
+        col[lon == self.lon_edges[-1]]=self.shape[1] - 1
+        inside=(row >= 0) & (row < self.shape[0]) & (col >= 0) & (col < self.shape[1])
+        return row*self.shape[1] + col,inside
+
+    def add(self,lat,lon,fields):
+        """
+           accumulate one batch of points
+
+           input: lat, lon -- point positions (degrees), shape (...)
+                  fields -- values to bin, shape (nfields,...), or (...) when nfields is 1
+        """
+        index,inside=self.cell_index(lat,lon)
+        fields=np.asarray(fields).reshape(self.nfields,-1)
+        self.outside=self.outside + int(np.sum(~inside))
+        index=index[inside]
+        ncells=self.sums.shape[1]
+        for field_num in range(self.nfields):
+            values=fields[field_num,inside].astype(np.float64)
+            good=np.isfinite(values)
+            if not good.all():
+                values=values[good]
+                the_index=index[good]
+            else:
+                the_index=index
+            self.sums[field_num]+=np.bincount(the_index,weights=values,minlength=ncells)
+            self.counts[field_num]+=np.bincount(the_index,minlength=ncells)
+            if 'std' in self.stats:
+                self.sumsq[field_num]+=np.bincount(the_index,weights=values*values,minlength=ncells)
+            if 'min' in self.stats:
+                np.minimum.at(self.mins[field_num],the_index,values)
+            if 'max' in self.stats:
+                np.maximum.at(self.maxs[field_num],the_index,values)
+
+    def merge(self,other):
+        """
+           add the totals from another SwathGrid with the same edges, fields and stats
+        """
+        if (other.shape != self.shape or other.nfields != self.nfields or
+                set(other.stats) != set(self.stats) or
+                not np.array_equal(other.lat_edges,self.lat_edges) or
+                not np.array_equal(other.lon_edges,self.lon_edges)):
+            raise ValueError("can only merge grids with the same edges, number of fields and stats")
+        self.sums+=other.sums
+        self.counts+=other.counts
+        self.outside=self.outside + other.outside
+        if 'std' in self.stats:
+            self.sumsq+=other.sumsq
+        if 'min' in self.stats:
+            np.minimum(self.mins,other.mins,out=self.mins)
+        if 'max' in self.stats:
+            np.maximum(self.maxs,other.maxs,out=self.maxs)
+
+    def _cells(self,values):
+        """
+           reshape (nfields,ncells) to (nfields,nlat,nlon), nan in empty cells
+        """
+        values=np.where(self.counts > 0,values,np.nan)
+        return values.reshape((self.nfields,) + self.shape)
+
+    @property
+    def count(self):
+        return self.counts.reshape((self.nfields,) + self.shape)
+
+    @property
+    def mean(self):
+        with np.errstate(invalid='ignore',divide='ignore'):
+            return self._cells(self.sums/self.counts)
+
+    @property
+    def std(self):
+        """
+           population standard deviation in each cell
+        """
+        with np.errstate(invalid='ignore',divide='ignore'):
+            mean=self.sums/self.counts
+            var=np.maximum(self.sumsq/self.counts - mean*mean,0.)
+        return self._cells(np.sqrt(var))
+
+    @property
+    def min(self):
+        return self._cells(self.mins)
+
+    @property
+    def max(self):
+        return self._cells(self.maxs)
+
+
+def grid_points(lat,lon,fields,lat_edges,lon_edges,stats=()):
+    """
+       one-shot version of SwathGrid for a single batch of points
+
+       input: lat, lon, fields -- as for SwathGrid.add, fields with a leading field axis
+       output: SwathGrid holding the totals
+    """
+    fields=np.asarray(fields)
+    nfields=fields.shape[0] if fields.ndim > np.ndim(lat) else 1
+    grid=SwathGrid(lat_edges,lon_edges,nfields=nfields,stats=stats)
+    grid.add(lat,lon,fields)
+    return grid
+
+
+def test_swath_grid():
+    """
+       compare with a per-point loop, then check that adding in pieces
+       and merging give the same answer as one call
+    """
+    np.random.seed(3)
+    npts=5000
+    lat=np.random.uniform(19.,31.,npts)
+    lon=np.random.uniform(139.,161.,npts)
+    fields=np.vstack([lat,np.random.normal(280.,5.,npts)])
+    fields[1,::50]=np.nan
+    lat_edges=np.linspace(20,30,11)
+    lon_edges=np.linspace(140,160,21)
+    grid=grid_points(lat,lon,fields,lat_edges,lon_edges,stats=('min','max','std'))
+    sums=np.zeros([2,10,20])
+    counts=np.zeros([2,10,20])
+    values=[[[[] for col in range(20)] for row in range(10)] for field in range(2)]
+    outside=0
+    for point in range(npts):
+        row=int(np.floor(lat[point] - 20.))
+        col=int(np.floor(lon[point] - 140.))
+        if row < 0 or row >= 10 or col < 0 or col >= 20:
+            outside+=1
+            continue
+        for field in range(2):
+            if np.isfinite(fields[field,point]):
+                sums[field,row,col]+=fields[field,point]
+                counts[field,row,col]+=1
+                values[field][row][col].append(fields[field,point])
+    assert grid.outside == outside
+    np.testing.assert_array_equal(grid.count,counts)
+    np.testing.assert_allclose(grid.mean,sums/counts,rtol=1.e-12)
+    np.testing.assert_allclose(grid.std[1,4,7],np.std(values[1][4][7]),rtol=1.e-8)
+    assert grid.min[1,4,7] == min(values[1][4][7]) and grid.max[1,4,7] == max(values[1][4][7])
+    #
+    # two pieces added to one grid, and two grids merged, match the single call
+    #
+    incremental=SwathGrid(lat_edges,lon_edges,nfields=2,stats=('min','max','std'))
+    other=SwathGrid(lat_edges,lon_edges,nfields=2,stats=('min','max','std'))
+    incremental.add(lat[:2000],lon[:2000],fields[:,:2000])
+    other.add(lat[2000:],lon[2000:],fields[:,2000:])
+    incremental.merge(other)
+    for stat in ['count','mean','std','min','max']:
+        np.testing.assert_allclose(getattr(incremental,stat),getattr(grid,stat),rtol=1.e-10)
+    assert incremental.outside == outside
+    #
+    # grids tracking different statistics can't be merged, in either direction
+    #
+    fewer=SwathGrid(lat_edges,lon_edges,nfields=2,stats=('min',))
+    for first,second in [(incremental,fewer),(fewer,incremental)]:
+        try:
+            first.merge(second)
+        except ValueError:
+            continue
+        raise AssertionError("merged stats {} into {}".format(second.stats,first.stats))
+    return None
+
+if __name__=="__main__":
+    test_swath_grid()
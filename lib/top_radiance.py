@@ -0,0 +1,104 @@
+"""
+   top of atmosphere radiance for many profiles and channels at once
+
+   replaces the level-by-level top_radiance loops in diff_lapse_toa.py and
+   bright_lapse_toa.py.  The upward recurrence
+        up_rad=trans*up_rad + (1-trans)*B(T_lower)
+   telescopes to a sum over layers weighted by the change in the
+   level-to-top transmission, which is a single array expression
+"""
+from __future__ import division,print_function
+import numpy as np
+from planck import planckwavelen,planckInvert
+from hydrostat import hydrostat,find_tau
+
+def top_radiance(tau,Temp,height,T_surf,wavel,k_lambda=None,verbose=False):
+    """Input:
+           tau: level optical depths measured from the surface, shape (...,nlev),
+                or (...,nchan,nlev) when wavel is a vector of nchan wavelengths
+           Temp: level temperatures (K), shape (...,nlev)
+           height: level heights (m) -- not used, kept for the old call signature
+           T_surf: temperature of black surface (K), shape (...)
+           wavel: wavelength (m), scalar or (nchan,) vector
+           k_lambda: not used, kept for the old call signature
+           verbose: print the surface radiance and total tau for each channel
+       Output:
+           top_rad: radiance at top of atmosphere (W/m^2/m/sr), shape tau.shape[:-1]
+    """
+    tau=np.asarray(tau,dtype=np.float64)
+    Temp=np.asarray(Temp,dtype=np.float64)
+    T_surf=np.asarray(T_surf,dtype=np.float64)
+    wavel=np.asarray(wavel,dtype=np.float64)
+    if wavel.ndim > 0:
+        #
+        # add a channel axis to the temperatures
+        #
+        Temp=Temp[...,None,:]
+        T_surf=T_surf[...,None]
+        level_wavel=wavel[:,None]
+    else:
+        level_wavel=wavel
+    sfc_rad=planckwavelen(wavel,T_surf)
+    if verbose:
+        for the_wavel,the_rad,the_tau in zip(np.atleast_1d(wavel),
+                                             np.atleast_1d(sfc_rad).ravel(),
+                                             np.atleast_2d(tau)[...,-1].ravel()):
+            print("-"*60)
+            print("wavelength: %8.2f microns" % (the_wavel*1.e6))
+            print("surface radiation: %8.2f W/m^2/micron/sr" % (the_rad*1.e-6))
+            print("total tau: %8.2f" % the_tau)
+            print("-"*60)
+    #
+    # transmission from each level to the top of the atmosphere; layer k
+    # contributes (1 - trans_k)*B(T_k) attenuated by trans_top[k+1]
+    #
+    trans_top=np.exp(-(tau[...,-1:] - tau))
+    layer_rad=planckwavelen(level_wavel,Temp[...,:-1])
+    top_rad=sfc_rad*trans_top[...,0] + np.sum(np.diff(trans_top,axis=-1)*layer_rad,axis=-1)
+    return top_rad
+
+def forward_model(T_surf,p_surf,dT_dz,delta_z,num_levels,r_gas,k_lambda,wavel):
+    """
+       build hydrostatic profiles and return their top of atmosphere radiances
+       and brightness temperatures
+
+       input: T_surf, p_surf, dT_dz, delta_z, num_levels -- as for hydrostat.hydrostat,
+                  pass dT_dz with shape (nprof,1) for one lapse rate per profile
+              r_gas -- gas mixing ratio (kg/kg)
+              k_lambda -- (nchan,) mass absorption coefficients (m^2/kg)
+              wavel -- (nchan,) wavelengths (m)
+       output: top_rad (W/m^2/m/sr), Tbright (K), both shape (nprof,nchan)
+    """
+    Temp,press,rho,height=hydrostat(T_surf,p_surf,dT_dz,delta_z,num_levels)
+    tau=find_tau(r_gas,k_lambda,rho,height)
+    top_rad=top_radiance(tau,Temp,height,Temp[...,0],wavel)
+    Tbright=planckInvert(wavel,top_rad)
+    return top_rad,Tbright
+
+def test_top_radiance():
+    """
+       compare the batched version with the original level loop
+    """
+    r_gas=0.01
+    dT_dz=np.arange(-9.e-3,-4.e-3,0.5e-3)[:,None]
+    wavenums=np.linspace(666,766,7)
+    wavel=((1/wavenums)*1.e-2)[::-1]
+    k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.
+    top_rad,Tbright=forward_model(300.,100.e3,dT_dz,25000/7,7,r_gas,k_lambda,wavel)
+    assert top_rad.shape == (10,7)
+    for prof in range(10):
+        Temp,press,rho,height=hydrostat(300.,100.e3,dT_dz[prof,0],25000/7,7)
+        for chan in range(7):
+            tau=find_tau(r_gas,k_lambda[chan],rho,height)
+            up_rad=planckwavelen(wavel[chan],300.)
+            for index in range(1,7):
+                trans=np.exp(-(tau[index] - tau[index-1]))
+                up_rad=trans*up_rad + (1 - trans)*planckwavelen(wavel[chan],Temp[index-1])
+            np.testing.assert_allclose(top_rad[prof,chan],up_rad,rtol=1.e-12)
+            np.testing.assert_allclose(top_radiance(tau,Temp,height,300.,wavel[chan]),
+                                       up_rad,rtol=1.e-12)
+    np.testing.assert_allclose(Tbright,planckInvert(wavel,top_rad))
+    return None
+
+if __name__=="__main__":
+    test_top_radiance()
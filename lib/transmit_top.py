@@ -3,35 +3,98 @@
    depths at 7 different wavelengths given assumed k values for CO2.  It differences
    the transmissivities to get the weighting functions following
    Stull eq. 8.4
+
+   weighting_functions and temperature_jacobian are the library versions,
+   batched over profiles and channels
 """
 
+from __future__ import print_function
 import numpy as np
 import matplotlib.pyplot as plt
-from hydrostat import hydrostat
+from hydrostat import hydrostat,find_tau
+from planck import planckDeriv,planckInvert
+from top_radiance import top_radiance
 
 
-def find_tau(r_gas,k_lambda,rho,height):
+def weighting_functions(r_gas,k_lambda,rho,height):
     """
        input: r_gas -- gas mixing ratio in kg/kg
-              k_lambda -- mass absorption coefficient in kg/m^2
-              rho -- vector of air densities in kg/m^3
-              height -- corresponding layer heights in m
-       output:  tau -- vetical optical depth from the surface, same shape as rho
+              k_lambda -- (nchan,) mass absorption coefficients in m^2/kg
+              rho -- air densities in kg/m^3, shape (...,nlev)
+              height -- level heights in m, shape (...,nlev)
+       output: trans -- transmittance from each level to the top, shape (...,nchan,nlev)
+               weights -- layer weighting functions np.diff(trans), shape (...,nchan,nlev-1)
+    """
+    tau=find_tau(r_gas,k_lambda,rho,height,from_top=True)
+    trans=np.exp(-tau)
+    weights=np.diff(trans,axis=-1)
+    return trans,weights
+
+
+def temperature_jacobian(tau,Temp,T_surf,wavel,brightness=False):
+    """
+       analytic derivative of top_radiance.top_radiance with respect to the
+       level temperatures and the surface temperature, holding tau fixed
+
+       input: tau -- level optical depths from the surface, shape (...,nchan,nlev)
+              Temp -- level temperatures (K), shape (...,nlev)
+              T_surf -- surface temperature (K), shape (...)
+              wavel -- (nchan,) wavelengths (m)
+              brightness -- if True return derivatives of brightness temperature (K/K)
+                            instead of radiance (W/m^2/m/sr/K)
+       output: jac -- shape (...,nchan,nlev); the top level never emits so its column is 0
+               jac_sfc -- shape (...,nchan)
     """
-    tau=np.empty_like(rho)
+    tau=np.asarray(tau,dtype=np.float64)
+    wavel=np.asarray(wavel,dtype=np.float64)
+    if brightness:
+        top_rad=top_radiance(tau,Temp,None,T_surf,wavel)
+    Temp=np.asarray(Temp,dtype=np.float64)[...,None,:]
+    T_surf=np.asarray(T_surf,dtype=np.float64)[...,None]
     #
-    # start at TOA with tau=0 and work down
+    # top_rad=B(T_surf)*trans_top[0] + sum_k diff(trans_top)[k]*B(Temp[k])
     #
-    tau[-1]=0
-    num_levels=len(rho)
-    num_layers=num_levels-1
-    for index in range(num_layers):
-        top_index=num_layers - index 
-        bot_index=num_layers - index - 1
-        delta_z=height[top_index] - height[bot_index]
-        delta_tau=r_gas*rho[top_index]*k_lambda*delta_z
-        tau[bot_index]=tau[top_index] + delta_tau
-    return tau     
+    trans_top=np.exp(-(tau[...,-1:] - tau))
+    layer_weights=np.diff(trans_top,axis=-1)
+    jac=np.zeros(np.broadcast(tau,Temp).shape)
+    jac[...,:-1]=layer_weights*planckDeriv(wavel[:,None],Temp[...,:-1])
+    jac_sfc=trans_top[...,0]*planckDeriv(wavel,T_surf)
+    if brightness:
+        dB_dTb=planckDeriv(wavel,planckInvert(wavel,top_rad))
+        jac=jac/dB_dTb[...,None]
+        jac_sfc=jac_sfc/dB_dTb
+    return jac,jac_sfc
+
+
+def test_jacobian():
+    """
+       compare the analytic jacobian with centered differences of top_radiance
+    """
+    r_gas=0.01
+    wavel=((1/np.linspace(666,766,7))*1.e-2)[::-1]
+    k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.
+    Temp,press,rho,height=hydrostat(np.array([290.,300.]),100.e3,
+                                    np.array([-8.e-3,-5.e-3])[:,None],25000/7,7)
+    tau=find_tau(r_gas,k_lambda,rho,height)
+    T_surf=Temp[:,0]
+    for brightness in [False,True]:
+        jac,jac_sfc=temperature_jacobian(tau,Temp,T_surf,wavel,brightness=brightness)
+        assert jac.shape == (2,7,7) and jac_sfc.shape == (2,7)
+        def forward(the_Temp,the_sfc):
+            top_rad=top_radiance(tau,the_Temp,height,the_sfc,wavel)
+            return planckInvert(wavel,top_rad) if brightness else top_rad
+        dT=1.e-3
+        for level in range(7):
+            delta=np.zeros(7)
+            delta[level]=dT
+            numeric=(forward(Temp + delta,T_surf) - forward(Temp - delta,T_surf))/(2.*dT)
+            np.testing.assert_allclose(jac[...,level],numeric,rtol=1.e-6,atol=1.e-12)
+        numeric=(forward(Temp,T_surf + dT) - forward(Temp,T_surf - dT))/(2.*dT)
+        np.testing.assert_allclose(jac_sfc,numeric,rtol=1.e-6)
+    trans,weights=weighting_functions(r_gas,k_lambda,rho,height)
+    np.testing.assert_allclose(trans,np.exp(-find_tau(r_gas,k_lambda,rho,height,from_top=True)))
+    assert weights.shape == (2,7,6)
+    return None
 
 if __name__=="__main__":
     r_gas=0.01  #kg/kg
@@ -46,7 +109,7 @@ if __name__=="__main__":
     #
     wavenums=np.linspace(666,766,7)
     wavelengths=1/wavenums
-    print wavelengths*1.e4  #microns
+    print(wavelengths*1.e4)  #microns
     #
     # make a hydrostatic atmosphere
     #
@@ -59,10 +122,10 @@ if __name__=="__main__":
     k_lambda=np.array([0.002,0.003,0.006,0.010,0.012,0.016,0.020])*5.  
     legend_string=["%5.3f" % item for item in k_lambda]
     #
-    # make a list of tuples of k_lambda and its label
-    # using zip
+    # optical depths for all 7 k_lambdas in one call, shape (7,num_levels)
     #
-    k_vals=zip(k_lambda,legend_string)
+    tau_all=find_tau(r_gas,k_lambda,rho,height,from_top=True)
+    trans_all,del_trans_all=weighting_functions(r_gas,k_lambda,rho,height)
     #
     #  find the height at mid-layer
     #
@@ -71,12 +134,9 @@ if __name__=="__main__":
     fig1,axis1=plt.subplots(1,1)
     fig2,axis2=plt.subplots(1,1)
     fig3,axis3=plt.subplots(1,1)
-    for k_lambda,k_label in k_vals:
-        tau=find_tau(r_gas,k_lambda,rho,height)
+    for tau,trans,del_trans,k_label in zip(tau_all,trans_all,del_trans_all,legend_string):
         axis1.plot(tau,height,label=k_label)
-        trans=np.exp(-tau)
         axis2.plot(trans,height,label=k_label)
-        del_trans=np.diff(trans)
         axis3.plot(del_trans,mid_height,label=k_label)
     axis1.set_title('optical depth for 7 values of $k_\lambda$')
     axis1.set_xlabel('optical depth')
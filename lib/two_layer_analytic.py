@@ -1,3 +1,17 @@
+"""
+   closed form two-layer troposphere and stratosphere models, and a
+   batched linear solve for any number of grey layers
+
+   troposphere and stratosphere broadcast over arrays of eps, eps_l, eps_s
+   and S0 like numpy ufuncs, so a sweep is one call:
+       eps=np.linspace(0.3,0.6,100)
+       Tground,T1,T2=troposphere(eps[:,None],np.array([300.,340.,380.]))   #(100,3)
+
+   grey_layers solves the same radiative balance for N layers, each with its
+   own longwave emissivity and shortwave absorptivity, as a linear system in
+   the emitted fluxes, and does every column in one np.linalg.solve call
+"""
+from __future__ import division,print_function
 import numpy as np
 sigma=5.67e-8
 
@@ -5,15 +19,16 @@ def troposphere(eps=0.5,S0=340):
     """
        input:  eps  (default=0.5) longwave emissivity of each layer
                S0   (default=340 W/m^2)  Solar constant
+               eps and S0 can be arrays that broadcast against each other
        output: Tground, T1, T2  (all Kelvins)  -- equilibrium temperatures of ground, first and second layer
-               see the google spreadsheet at:  
+               see the google spreadsheet at:
                https://docs.google.com/spreadsheets/d/1bnWUHHrof-0tzZlCDGAL1L74KAqls0XRttpK3AMrhCQ/edit#gid=1066209610
                for the equations that were solved
                https://docs.google.com/spreadsheets/d/1NfI1gRkhuFvSupDX3RF4D2YBGPfuAWH-mpYDDJHu4HE/edit#gid=923351782
     """
+    eps=np.asarray(eps,dtype=np.float64)
     b6=eps
-    b7=S0
-    sigma=5.67e-8
+    b7=np.asarray(S0,dtype=np.float64)
     Fground=(1-0.3)*b7/(1-b6/2*(1+b6*(1-b6)/2)/(1-b6*b6/4)-(1-b6)*b6/2*((1-b6)+b6/2)/(1-b6*b6/4))
     c4=Fground
     F1=c4*b6/2*(1+b6*(1-b6)/2)/(1-b6*b6/4)
@@ -31,14 +46,16 @@ def stratosphere(eps_l=0.03,eps_s=0.10,S0=340):
        input:  eps_l  (default=0.03) longwave emissivity due to CO2 of each layer
                eps_s (default=0.10)  shortwave absorptivity due to O3 of each layer
                S0   (default=340 W/m^2)  Solar constant
+               all three can be arrays that broadcast against each other
        output: T1, T2  (all Kelvins)  -- equilibrium temperatures of first and second layer
-               see the google spreadsheet at:  
+               see the google spreadsheet at:
                https://docs.google.com/spreadsheets/d/1bnWUHHrof-0tzZlCDGAL1L74KAqls0XRttpK3AMrhCQ/edit#gid=1066209610
                for the equations that were solved
     """
-    B6=S0
+    eps_l=np.asarray(eps_l,dtype=np.float64)
+    B6=np.asarray(S0,dtype=np.float64)
     B5=eps_l
-    B4=eps_s
+    B4=np.asarray(eps_s,dtype=np.float64)
     F2=B6*(B4/2+B4*(1-B4)*B5/4)/(1-B5*B5/4)
     F1=B6*(B4*(1-B4)/2+B5*B4/4)/(1-B5*B5/4)
     #
@@ -46,54 +63,166 @@ def stratosphere(eps_l=0.03,eps_s=0.10,S0=340):
     #
     T1=(F1/(sigma*eps_l))**0.25
     T2=(F2/(sigma*eps_l))**0.25
-    return T1,T2       
+    return T1,T2
+
+def between_trans(trans):
+    """
+       input: trans -- (...,n) longwave transmissivity of each emitter, bottom to top
+       output: (...,n,n) array whose [...,i,k] element is the product of trans over
+               the emitters strictly between i and k (1 for neighbours and i == k)
+    """
+    trans=np.asarray(trans,dtype=np.float64)
+    n=trans.shape[-1]
+    between=np.ones(trans.shape + (n,))
+    for i in range(n - 2):
+        between[...,i,i + 2:]=np.cumprod(trans[...,i + 1:n - 1],axis=-1)
+    upper=np.triu(np.ones([n,n],dtype=bool),1)
+    return np.where(upper,between,np.swapaxes(between,-1,-2))
+
+def exchange_matrix(eps,between,ground=True):
+    """
+       longwave exchange matrix A for the balance A x = absorbed shortwave
+
+       input: eps -- (...,nlayers) layer longwave emissivities, bottom to top
+              between -- (...,n,n) transmissivity between emitters from between_trans,
+                         n=nlayers+1 with the ground as emitter 0, or nlayers without
+              ground -- True if there is a black ground below the layers
+       output: (...,n,n) matrix; x is the flux each emitter sends in each direction,
+               eps sigma T**4 for a layer and sigma T**4 (upward only) for the ground,
+               so layer rows read 2 x_k - eps_k sum_i between_ik x_i and the ground
+               row x_0 - sum_i between_i0 x_i
+    """
+    eps=np.asarray(eps,dtype=np.float64)
+    absorb=eps
+    diag=2.*np.ones(eps.shape)
+    if ground:
+        absorb=np.concatenate((np.ones(eps.shape[:-1] + (1,)),eps),axis=-1)
+        diag=np.concatenate((np.ones(eps.shape[:-1] + (1,)),diag),axis=-1)
+    n=absorb.shape[-1]
+    offdiag=1. - np.eye(n)
+    #
+    # row k absorbs a fraction absorb_k of what every other emitter sends its way
+    #
+    A= -absorb[...,:,None]*np.swapaxes(between,-1,-2)*offdiag
+    return A + diag[...,:,None]*np.eye(n)
+
+def grey_layers(eps,S0=340.,sw_abs=0.,albedo=0.3,ground=True):
+    """
+       radiative equilibrium of N grey layers over an optional black ground,
+       batched over any leading dimensions
+
+       input: eps -- (...,nlayers) longwave emissivity of each layer, bottom to top
+              S0 -- solar flux at the top (W/m^2), shape (...)
+              sw_abs -- shortwave absorptivity of each layer, broadcastable to eps
+              albedo -- fraction of the shortwave reaching the ground that is reflected
+              ground -- False for layers with nothing below them, as in stratosphere()
+       output: Tground -- ground temperature (K), shape (...), None if ground is False
+               Temp -- layer temperatures (K), shape (...,nlayers)
+
+       the shortwave is absorbed on the way down only; with eps=[eps,eps] and
+       sw_abs=0 this is troposphere(eps,S0), and with ground=False,
+       sw_abs=[eps_s,eps_s] and albedo=0 it is stratosphere(eps_l,eps_s,S0)
+    """
+    eps=np.asarray(eps,dtype=np.float64)
+    S0=np.asarray(S0,dtype=np.float64)[...,None]
+    albedo=np.asarray(albedo,dtype=np.float64)[...,None]
+    shape=np.broadcast(eps,np.asarray(sw_abs),S0,albedo).shape
+    eps=np.broadcast_to(eps,shape)
+    sw_abs=np.broadcast_to(np.asarray(sw_abs,dtype=np.float64),shape)
+    #
+    # shortwave reaching the top of each layer, from the top down
+    #
+    sw_trans=np.cumprod((1. - sw_abs)[...,::-1],axis=-1)[...,::-1]
+    sw_top=S0*np.concatenate((sw_trans[...,1:],np.ones(shape[:-1] + (1,))),axis=-1)
+    source=sw_abs*sw_top
+    trans=1. - eps
+    if ground:
+        sfc_source=(1. - albedo)*S0*sw_trans[...,:1]
+        source=np.concatenate((sfc_source,source),axis=-1)
+        trans=np.concatenate((np.zeros(shape[:-1] + (1,)),trans),axis=-1)
+    A=exchange_matrix(eps,between_trans(trans),ground)
+    flux=np.linalg.solve(A,source[...,None])[...,0]
+    if ground:
+        return (flux[...,0]/sigma)**0.25,(flux[...,1:]/(sigma*eps))**0.25
+    return None,(flux/(sigma*eps))**0.25
+
+def test_two_layer():
+    """
+       array calls match scalar calls, and the N-layer solve reproduces both
+       closed forms and the N-layer black-body result Tground**4=(N+1) Te**4
+    """
+    eps=np.linspace(0.05,0.95,1000)[:,None]
+    S0=np.array([300.,340.,380.])
+    Tground,T1,T2=troposphere(eps,S0)
+    assert T2.shape == (1000,3)
+    for index in [(0,0),(500,1),(999,2)]:
+        np.testing.assert_allclose([Tground[index],T1[index],T2[index]],
+                                   troposphere(eps[index[0],0],S0[index[1]]),rtol=1.e-12)
+    layers=np.repeat(eps[...,None],2,axis=-1)
+    Tg_solve,Temp=grey_layers(layers,S0)
+    assert Temp.shape == (1000,3,2)
+    np.testing.assert_allclose(Tg_solve,Tground,rtol=1.e-10)
+    np.testing.assert_allclose(Temp[...,0],T1,rtol=1.e-10)
+    np.testing.assert_allclose(Temp[...,1],T2,rtol=1.e-10)
+    eps_l=np.linspace(0.01,0.05,50)[:,None]
+    eps_s=np.array([0.05,0.1,0.2])
+    ST1,ST2=stratosphere(eps_l,eps_s)
+    assert ST1.shape == (50,3)
+    layers=np.repeat(eps_l[...,None],2,axis=-1)
+    Tg_solve,Temp=grey_layers(layers,340.,sw_abs=eps_s[:,None],albedo=0.,ground=False)
+    assert Tg_solve is None
+    np.testing.assert_allclose(Temp[...,0],ST1,rtol=1.e-10)
+    np.testing.assert_allclose(Temp[...,1],ST2,rtol=1.e-10)
+    #
+    # N black layers: each level down adds one more Te**4
+    #
+    Tg_solve,Temp=grey_layers(np.ones([4,7]),np.array([200.,240.,280.,320.]),albedo=0.)
+    Te4=np.array([200.,240.,280.,320.])[:,None]/sigma
+    np.testing.assert_allclose(Temp**4.,Te4*np.arange(7,0,-1),rtol=1.e-10)
+    np.testing.assert_allclose(Tg_solve**4.,Te4[:,0]*8.,rtol=1.e-10)
+    return None
 
 if __name__=="__main__":
+    import timeit
     import matplotlib.pyplot as plt
+    test_two_layer()
     #
     # run default cases to check
     #
     Tground,T1,T2=troposphere()
     ST1,ST2=stratosphere()
     print("default tropospheric ground, layer 1 and layer 2 temps: {:5.2f} K, {:5.2f} K, {:5.2f} K".format(Tground,T1,T2))
-    print("default stratospheric layer 1 and layer 2 temps: {:5.2f} K, {:5.2f} K".format(T1,T2))
-    print(ST1,ST2)
-    Tg_vals=[]
-    T1_vals=[]
-    T2_vals=[]
+    print("default stratospheric layer 1 and layer 2 temps: {:5.2f} K, {:5.2f} K".format(ST1,ST2))
+    eps_sweep=np.random.uniform(0.05,0.95,(10000,10))
+    seconds=min(timeit.repeat(lambda: grey_layers(eps_sweep),number=1,repeat=3))
+    print("10 layer grey solve for {} columns in {:.3f} s".format(len(eps_sweep),seconds))
+
     eps=np.linspace(0.3,0.6,100)
-    for the_eps in eps:
-        Tground,T1,T2=troposphere(eps)
-        Tg_vals.append(Tground)
-        T1_vals.append(T1)
-        T2_vals.append(T2)
+    Tground,T1,T2=troposphere(eps)
     fig=plt.figure(1)
     fig.clf()
     ax1=fig.add_subplot(111)
     ax1.plot(eps,T1,label='layer 1 temp (K)')
     ax1.plot(eps,T2,label='layer 2 temp (K)')
     ax1.legend(loc='upper left')
-    ax1.set_xlabel('emmissivty $\epsilon$')
+    ax1.set_xlabel(r'emmissivty $\epsilon$')
     ax1.set_ylabel('layer temperature (K)')
     ax1.set_title('tropospheric temperatures with S0/4=340 $W/m^2$')
     fig.tight_layout()
     fig.canvas.draw()
 
     eps=np.linspace(0.01,0.05,100)
-    for the_eps in eps:
-        T1,T2=stratosphere(eps)
-        T1_vals.append(T1)
-        T2_vals.append(T2)
+    T1,T2=stratosphere(eps)
     fig=plt.figure(2)
     fig.clf()
     ax1=fig.add_subplot(111)
     ax1.plot(eps,T1,label='layer 1 temp (K)')
     ax1.plot(eps,T2,label='layer 2 temp (K)')
     ax1.legend(loc='upper right')
-    ax1.set_xlabel('emmissivty $\epsilon$')
+    ax1.set_xlabel(r'emmissivty $\epsilon$')
     ax1.set_ylabel('layer temperature (K)')
     ax1.set_title('stratospheric temperatures with S0/4=340 $W/m^2$')
     fig.tight_layout()
     fig.canvas.draw()
     plt.show()
-    
+
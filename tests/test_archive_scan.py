@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/archive_scan.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from archive_scan import test_scan_archive
+
+test_scan_archive()
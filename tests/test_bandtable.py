@@ -0,0 +1,9 @@
+import os,site
+#
+# import test functions from lib/bandtable.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from bandtable import test_table_forward,test_table_inverse
+
+test_table_forward()
+test_table_inverse()
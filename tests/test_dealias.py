@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/dealias.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from dealias import test_dealias
+
+test_dealias()
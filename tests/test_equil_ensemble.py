@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/equil_ensemble.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from equil_ensemble import test_ensemble
+
+test_ensemble()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/equil_run.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from equil_run import test_run_equilibrium
+
+test_run_equilibrium()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/fluxes.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from fluxes import test_two_stream
+
+test_two_stream()
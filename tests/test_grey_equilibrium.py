@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/grey_equilibrium.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from grey_equilibrium import test_grey_equilibrium
+
+test_grey_equilibrium()
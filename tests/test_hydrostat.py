@@ -0,0 +1,9 @@
+import os,site
+#
+# import test functions from lib/hydrostat.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from hydrostat import test_hydrostat,test_find_tau
+
+test_hydrostat()
+test_find_tau()
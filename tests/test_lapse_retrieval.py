@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/lapse_retrieval.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from lapse_retrieval import test_lapse_retrieval
+
+test_lapse_retrieval()
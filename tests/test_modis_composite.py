@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/modis_composite.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from modis_composite import test_composite
+
+test_composite()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/modis_index.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from modis_index import test_meta_index
+
+test_meta_index()
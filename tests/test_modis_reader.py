@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/modis_reader.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from modis_reader import test_granule_reader
+
+test_granule_reader()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/modismeta.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from modismeta import test_parse_meta
+
+test_parse_meta()
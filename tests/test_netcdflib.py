@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/netcdflib.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from netcdflib import test_schema
+
+test_schema()
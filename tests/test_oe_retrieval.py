@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/oe_retrieval.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from oe_retrieval import test_oe_retrieval
+
+test_oe_retrieval()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/planck_kernel.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from planck_kernel import test_kernel_forms
+
+test_kernel_forms()
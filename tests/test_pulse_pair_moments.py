@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/pulse_pair_moments.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from pulse_pair_moments import test_pulse_pair
+
+test_pulse_pair()
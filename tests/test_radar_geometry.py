@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/radar_geometry.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from radar_geometry import test_radar_geometry
+
+test_radar_geometry()
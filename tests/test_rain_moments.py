@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/rain_moments.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from rain_moments import test_rain_moments
+
+test_rain_moments()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/solar_geometry.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from solar_geometry import test_solar_geometry
+
+test_solar_geometry()
@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/swath_grid.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from swath_grid import test_swath_grid
+
+test_swath_grid()
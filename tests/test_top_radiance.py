@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/top_radiance.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from top_radiance import test_top_radiance
+
+test_top_radiance()
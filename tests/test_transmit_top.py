@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/transmit_top.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from transmit_top import test_jacobian
+
+test_jacobian()
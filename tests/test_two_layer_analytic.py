@@ -0,0 +1,8 @@
+import os,site
+#
+# import test functions from lib/two_layer_analytic.py
+#
+site.addsitedir(os.path.abspath('../lib'))
+from two_layer_analytic import test_two_layer
+
+test_two_layer()